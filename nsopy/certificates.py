@@ -0,0 +1,108 @@
+# Optimality certificates, computed alongside any method (see the observer pattern and
+# SolutionMethod.register_oracle_observer)
+import time
+
+import numpy as np
+
+from nsopy.methods.bundle import BundleManager
+from nsopy.methods.cut_pool import CutPool
+from nsopy.methods.master_problems import make_master_problem, dual_domain_constraints
+from nsopy.observer_pattern import Observer
+from nsopy.oracles import unwrap_oracle
+
+DEFAULT_CHECK_EVERY = 10
+DEFAULT_GAP_TOLERANCE = 1e-3
+
+
+class DualityGapCertificate(Observer):
+    """ Certified optimality gap, for any method driven by dual_step() or dual_step_async() (SubgradientMethod,
+    UniversalPGM, UniversalDGM, UniversalFGM, SGMDoubleSimpleAveraging, SGMTripleAveraging, ...).
+
+    Each oracle result (lambda_j, d_j, diff_d_j) of the method is a cut of the concave dual function,
+        d(lambda) <= d_j + diff_d_j^T (lambda - lambda_j),
+    and every check_every iterations the cutting plane model is maximized over the dual domain (an LP, solved by the
+    master problems of the cutting planes method), which bounds the dual optimum d* from above. The best value
+    found so far bounds it from below, and the gap upper_bound - lower_bound certifies the suboptimality of
+    best_lambda; certified is True once it is at most tolerance.
+
+    Values are those of the function the method maximizes, sense_sign*d (see SolutionMethod.sense_sign): with
+    sense='min', the minimum f* of the oracle lies in [-upper_bound, -lower_bound]. The upper bound is only valid
+    on the domain given with set_dual_domain() and the search box lambda_min <= lambda <= lambda_max, which
+    therefore have to contain an optimum; it is infinite while the model is unbounded on the domain. With max_cuts,
+    the model is managed as in BundleManager (inactive cuts are removed, and active ones aggregated), which keeps the
+    bound valid.
+    """
+    def __init__(self, dual_method, lambda_min=-np.inf, lambda_max=np.inf, check_every=DEFAULT_CHECK_EVERY,
+                 tolerance=DEFAULT_GAP_TOLERANCE, max_cuts=None, master_problem=None):
+        self.method = dual_method
+        self.method.register_observer(self)
+        self.method.register_oracle_observer(self)
+        self.check_every = check_every
+        self.tolerance = tolerance
+
+        self.bundle = CutPool(dual_method.dimension)
+        self.master_problem = make_master_problem(master_problem, dual_method.dimension,
+                                                  lambda_min=lambda_min, lambda_max=lambda_max)
+        self.bundle_manager = BundleManager(self.bundle, self.master_problem, max_bundle_size=max_cuts)
+
+        self.iterations = 0
+        self.upper_bound = np.inf
+        self.lower_bound = -np.inf
+        self.best_lambda = None
+        self.check_time = 0.0  # spent computing upper bounds, in seconds
+
+    @property
+    def gap(self):
+        return self.upper_bound - self.lower_bound
+
+    @property
+    def certified(self):
+        return self.gap <= self.tolerance
+
+    def set_dual_domain(self, type='free', param=0):
+        # same domains as the methods
+        if type == '2 stage smps':
+            inner_problem = unwrap_oracle(self.method.oracle).__self__
+        else:
+            inner_problem = None
+        lower_bounds, A_eq, b_eq = dual_domain_constraints(type, self.method.dimension, param=param,
+                                                           inner_problem=inner_problem)
+        if lower_bounds is not None:
+            self.master_problem.add_lower_bounds(lower_bounds)
+        if A_eq is not None:
+            self.master_problem.add_equality_constraints(A_eq, b_eq)
+
+    def oracle_update(self, points, results):
+        sense_sign = self.method.sense_sign
+        for lambda_j, (_, d_j, diff_d_j) in zip(points, results):
+            d_j = sense_sign*float(d_j)
+            if not np.isfinite(d_j):
+                continue
+            lambda_j = np.array(lambda_j, dtype=float)
+            diff_d_j = sense_sign*np.asarray(diff_d_j, dtype=float)
+            self.bundle.add_cut(-diff_d_j, -d_j + np.dot(diff_d_j, lambda_j))
+            if d_j > self.lower_bound:
+                self.lower_bound = d_j
+                self.best_lambda = lambda_j
+
+    def update(self):
+        self.iterations += 1
+        if self.iterations % self.check_every == 0:
+            self.check()
+
+    def check(self):
+        """ Updates the upper bound with the cuts collected so far, and returns the gap. """
+        if len(self.bundle) > len(self.bundle_manager.inactive_iterations):
+            start = time.time()
+            self.bundle_manager.add_new_cuts()
+            try:
+                value, _ = self.master_problem.solve()
+            except RuntimeError:
+                # the model is unbounded on the domain (or the LP failed): no bound yet
+                pass
+            else:
+                # the master problem minimizes -d
+                self.upper_bound = min(self.upper_bound, -value)
+                self.bundle_manager.update()
+            self.check_time += time.time() - start
+        return self.gap
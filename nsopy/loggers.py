@@ -90,6 +90,21 @@ class EnhancedDualMethodLogger(Observer):
         # -- TEMP
 
 
+class BundleMethodLogger(EnhancedDualMethodLogger):
+    """ Additionally logs the size of the bundle, and the time spent in the master problem, of CuttingPlanesMethod and
+    BundleMethod
+    """
+    def __init__(self, dual_method):
+        super(BundleMethodLogger, self).__init__(dual_method)
+        self.bundle_size = []
+        self.master_solve_time = []
+
+    def update(self):
+        super(BundleMethodLogger, self).update()
+        self.bundle_size.append(self.method.bundle_size)
+        self.master_solve_time.append(self.method.master_solve_time)
+
+
 class DualDgmFgmMethodLogger(Observer):
     """ Additionally logs # of oracle calls, time
     """
@@ -0,0 +1,281 @@
+""" Asynchronous parallel methods for separable dual functions, d(lambda) = sum_i d_i(lambda).
+
+With a synchronous method, every iteration waits for all the blocks of a nsopy.oracles.SeparableOracle to be
+evaluated, so a single slow subproblem stalls all the workers. The methods below instead update lambda as soon as
+any block returns, using the last available (stale) values and subgradients for the blocks that are still being
+evaluated; each block is re-evaluated at the new lambda as soon as its result has been used.
+
+Staleness is bounded: the result of a block evaluated at the iterate of iteration j is only used up to iteration
+j + max_staleness; beyond that, the method waits for the block to return. With max_staleness=0, the methods coincide
+with their synchronous counterparts (SubgradientMethod and SGMDoubleSimpleAveraging).
+
+The aggregated, possibly stale, values are not values of d at any point, and are not passed to the oracle observers
+(such as best, or nsopy.certificates.DualityGapCertificate): only exact evaluations are, i.e., the iterates at which
+every block was evaluated. With max_staleness=0 this is every iterate; otherwise, the first one and those at which
+the blocks happen to be dispatched together.
+"""
+from __future__ import division
+import asyncio
+import functools
+import time
+from concurrent.futures import wait, ALL_COMPLETED, FIRST_COMPLETED
+
+import numpy as np
+
+from nsopy.methods.base import SolutionMethod
+from nsopy.methods.quasi_monotone import METHOD_QUASI_MONOTONE_DEFAULT_GAMMA
+from nsopy.methods.subgradient import STEPSIZE_RULES, subgradient_stepsize
+from nsopy.observer_pattern import Observable
+
+DEFAULT_MAX_STALENESS = 5
+
+
+class AsynchronousBlockMethod(SolutionMethod, Observable):
+    """ Bookkeeping common to the asynchronous methods: dispatches the blocks of separable_oracle, collects their
+    results as they come in, and keeps the (possibly stale) aggregated value and subgradient.
+
+    Subclasses implement _update_lambda(diff_d_k), which computes the next iterate from the aggregated subgradient.
+    An iteration is implemented in _block_step(), a generator which yields the block evaluations (futures) to wait
+    for, and when (FIRST_COMPLETED or ALL_COMPLETED): dual_step() waits for them, and dual_step_async() awaits them
+    without blocking the event loop.
+
+    Instrumentation (updated at each iteration):
+    - block_staleness: for each block, number of iterations since the iterate its current result was evaluated at
+    - max_observed_staleness: largest staleness used so far
+    - block_idle_time: for each block, total time (in seconds) between the collection of the result of an evaluation
+      and the dispatch of the next one, i.e., during which the block was not being evaluated
+    - wait_time: total time the method spent waiting for block results (also added to oracle_time)
+    - block_calls: number of block evaluations collected so far; oracle_calls counts them as fractions of a full
+      oracle call (n_blocks block evaluations are one oracle call)
+    """
+    def __init__(self, separable_oracle, projection_function, dimension=0, max_staleness=DEFAULT_MAX_STALENESS, sense='min'):
+        super(AsynchronousBlockMethod, self).__init__()
+
+        if separable_oracle.asynchronous:
+            raise ValueError('Asynchronous methods need the block functions to be synchronous; they are evaluated on '
+                             'the executor of the separable oracle')
+        self.separable_oracle = separable_oracle
+        self.oracle = separable_oracle
+        self.n_blocks = separable_oracle.n_blocks
+        self._set_sense(sense)  # the method maximizes sense_sign*d
+        self.projection_function = projection_function
+
+        if max_staleness < 0:
+            raise ValueError('max_staleness should be a non-negative integer')
+        self.max_staleness = int(max_staleness)
+        self.exact_oracle_results = self.max_staleness == 0
+
+        self.iteration_number = 1
+        self.oracle_calls = 0
+        self.block_calls = 0
+
+        if dimension == 0:
+            self.lambda_k = self.projection_function(0)
+            self.dimension = len(self.lambda_k)
+        else:
+            self.dimension = dimension
+            self.lambda_k = self.projection_function(np.zeros(self.dimension, dtype=float))
+        self.x_k = 0
+        self.d_k = 0
+        self.diff_d_k = 0
+
+        # latest result of each block, and iteration of the iterate it was evaluated at
+        self.block_results = [None]*self.n_blocks
+        self.block_result_iteration = np.zeros(self.n_blocks, dtype=int)
+        self._sum_d = 0.0
+        self._sum_diff_d = np.zeros(self.dimension, dtype=float)
+        # evaluations in flight: future -> (block, iteration)
+        self._in_flight = {}
+        self._collection_time = {}
+        self._collected = []
+        # blocks dispatched at each iteration: iteration -> (lambda, blocks dispatched, results collected so far)
+        self._rounds = {}
+
+        # instrumentation
+        self.block_staleness = np.zeros(self.n_blocks, dtype=int)
+        self.max_observed_staleness = 0
+        self.block_idle_time = np.zeros(self.n_blocks, dtype=float)
+        self.wait_time = 0.0
+
+    def dual_step(self):
+        steps = self._block_step()
+        try:
+            futures, return_when = next(steps)
+            while True:
+                start = time.time()
+                wait(futures, return_when=return_when)
+                self._collect(start)
+                futures, return_when = steps.send(None)
+        except StopIteration:
+            pass
+
+    async def dual_step_async(self):
+        """ Same as dual_step(); the blocks are still evaluated on the executor of the separable oracle, and waited for
+        on a thread of the event loop's default executor. """
+        loop = asyncio.get_running_loop()
+        steps = self._block_step()
+        try:
+            futures, return_when = next(steps)
+            while True:
+                start = time.time()
+                await loop.run_in_executor(None, functools.partial(wait, futures, return_when=return_when))
+                self._collect(start)
+                futures, return_when = steps.send(None)
+        except StopIteration:
+            pass
+
+    def _block_step(self):
+        if self.iteration_number == 1:
+            for block in range(self.n_blocks):
+                self._dispatch(block)
+            yield list(self._in_flight), ALL_COMPLETED
+        else:
+            yield list(self._in_flight), FIRST_COMPLETED
+
+        # enforce the staleness bound
+        stale_blocks = np.flatnonzero(self.iteration_number - self.block_result_iteration > self.max_staleness)
+        while len(stale_blocks):
+            in_flight_blocks = {block: future for future, (block, _) in self._in_flight.items()}
+            for block in stale_blocks:
+                if block not in in_flight_blocks:
+                    # its last evaluation was collected, but is already too old: evaluate it again, at lambda_k
+                    in_flight_blocks[block] = self._dispatch(block)
+            yield [in_flight_blocks[block] for block in stale_blocks], ALL_COMPLETED
+            stale_blocks = np.flatnonzero(self.iteration_number - self.block_result_iteration > self.max_staleness)
+
+        self.block_staleness = self.iteration_number - self.block_result_iteration
+        self.max_observed_staleness = max(self.max_observed_staleness, int(np.max(self.block_staleness)))
+        self._notify_exact_rounds()
+
+        self.x_k = np.concatenate([np.atleast_1d(x_i) for x_i, _, _ in self.block_results])
+        self.d_k = self._sum_d
+        self.diff_d_k = self._work_array('diff_d_k', self._sum_diff_d)
+        # log signal to any observers connected
+        self.notify_observers()
+
+        self._update_lambda(self.diff_d_k)
+        self.iteration_number += 1
+
+        # evaluate the blocks whose results have been used, at the new iterate
+        in_flight_blocks = [block for block, _ in self._in_flight.values()]
+        for block in sorted(set(self._collected)):
+            if block not in in_flight_blocks:
+                self._dispatch(block)
+        self._collected = []
+
+    def _update_lambda(self, diff_d_k):
+        raise NotImplementedError()
+
+    def _dispatch(self, block):
+        if block in self._collection_time:
+            self.block_idle_time[block] += time.time() - self._collection_time.pop(block)
+
+        # lambda_k is updated in place, while evaluations outlive the iteration: they are passed a copy, shared by the
+        # blocks dispatched at the same iteration
+        if self.iteration_number not in self._rounds:
+            self._rounds[self.iteration_number] = (np.copy(self.lambda_k), set(), {})
+        lambda_j, blocks, _ = self._rounds[self.iteration_number]
+        blocks.add(block)
+        future = self.separable_oracle.submit(block, lambda_j)
+        self._in_flight[future] = (block, self.iteration_number)
+        return future
+
+    def _notify_exact_rounds(self):
+        # called once no more blocks can be dispatched at the current iteration: passes the rounds in which every
+        # block was dispatched, and has returned, to the oracle observers, and forgets the other complete rounds
+        for iteration in sorted(self._rounds):
+            lambda_j, blocks, results = self._rounds[iteration]
+            if len(results) < len(blocks):
+                continue
+            del self._rounds[iteration]
+            if len(blocks) == self.n_blocks:
+                ordered_results = [results[block] for block in range(self.n_blocks)]
+                x_j = np.concatenate([np.atleast_1d(x_i) for x_i, _, _ in ordered_results])
+                d_j = sum(d_i for _, d_i, _ in ordered_results)
+                diff_d_j = np.sum([diff_d_i for _, _, diff_d_i in ordered_results], axis=0)
+                self._notify_oracle_observers([lambda_j], [(x_j, d_j, diff_d_j)])
+
+    def _collect(self, wait_start):
+        # called once the evaluations yielded by _block_step() are done, after waiting for them since wait_start
+        now = time.time()
+        self.wait_time += now - wait_start
+        self.oracle_time += now - wait_start
+
+        # collect all completed evaluations (not only those we waited for)
+        for future in [future for future in self._in_flight if future.done()]:
+            block, iteration = self._in_flight.pop(future)
+            self._collection_time[block] = now
+            x_i, d_i, diff_d_i = future.result()
+            if self.block_results[block] is not None:
+                _, old_d_i, old_diff_d_i = self.block_results[block]
+                self._sum_d -= old_d_i
+                self._sum_diff_d -= old_diff_d_i
+            self._sum_d += d_i
+            self._sum_diff_d += diff_d_i
+            self.block_results[block] = (x_i, d_i, diff_d_i)
+            self.block_result_iteration[block] = iteration
+            self._rounds[iteration][2][block] = (x_i, d_i, diff_d_i)
+            self.block_calls += 1
+            self._collected.append(block)
+        self.oracle_calls = self.block_calls / self.n_blocks
+
+    def close(self):
+        """ Waits for the evaluations still in flight (whose results are discarded). """
+        wait(list(self._in_flight))
+        self._in_flight = {}
+
+
+class AsynchronousSubgradientMethod(AsynchronousBlockMethod):
+    """ Asynchronous variant of SubgradientMethod, for separable oracles (see module docstring). """
+    def __init__(self, separable_oracle, projection_function, dimension=0, stepsize_rule='1/k', stepsize_0=1.0,
+                 max_staleness=DEFAULT_MAX_STALENESS, sense='min'):
+        super(AsynchronousSubgradientMethod, self).__init__(separable_oracle, projection_function, dimension=dimension,
+                                                            max_staleness=max_staleness, sense=sense)
+
+        self.stepsize_0 = float(stepsize_0)
+        assert stepsize_rule in STEPSIZE_RULES, "stepsize_rule has to be either '1/k', 'constant' ot '1/sqrt(k)'"
+        self.stepsize_rule = stepsize_rule
+
+        self.desc = 'Async SG {}, $s_0 = {}$, $\\tau = {}$'.format(stepsize_rule, self.stepsize_0, self.max_staleness)
+        # for record keeping
+        self.method_name = 'Async SG'
+        self.parameter = stepsize_0
+
+    def _update_lambda(self, diff_d_k):
+        stepsize = subgradient_stepsize(self.stepsize_rule, self.stepsize_0, self.iteration_number)
+        # lambda_k = P(lambda_k + sense_sign*stepsize*diff_d_k), in place
+        lambda_k = self._work_array('lambda_k', self.lambda_k)
+        self.lambda_k = self._projected_step(lambda_k, self.sense_sign*stepsize, diff_d_k, out=lambda_k)
+
+
+class AsynchronousSGMDoubleSimpleAveraging(AsynchronousBlockMethod):
+    """ Asynchronous variant of SGMDoubleSimpleAveraging, for separable oracles (see module docstring). """
+    def __init__(self, separable_oracle, projection_function, dimension=0, gamma=METHOD_QUASI_MONOTONE_DEFAULT_GAMMA,
+                 max_staleness=DEFAULT_MAX_STALENESS, sense='min'):
+        super(AsynchronousSGMDoubleSimpleAveraging, self).__init__(separable_oracle, projection_function,
+                                                                   dimension=dimension, max_staleness=max_staleness,
+                                                                   sense=sense)
+        # as in SGMDoubleSimpleAveraging, the method starts from 0
+        self.lambda_k = np.zeros(self.dimension, dtype=float)
+        self.gamma = gamma
+        self.s_k = np.zeros(self.dimension, dtype=float)  # this stores \sum_{k=0}^t diff_d_k
+
+        self.desc = 'Async DSA, $\\gamma = {}$, $\\tau = {}$'.format(gamma, self.max_staleness)
+        # for record keeping
+        self.method_name = 'Async DSA'
+        self.parameter = gamma
+
+    def _update_lambda(self, diff_d_k):
+        # iteration_number starts from 1 here, and from 0 in SGMDoubleSimpleAveraging
+        t = self.iteration_number - 1
+        self.s_k += diff_d_k
+        lambda_k_plus = self._work_array('lambda_k_plus')
+        np.multiply(self.s_k, self.sense_sign/float(self.gamma*np.sqrt(t+1)), out=lambda_k_plus)
+        self._project(lambda_k_plus, out=lambda_k_plus)
+
+        # lambda_k = (t+1)/(t+2)*lambda_k + 1/(t+2)*lambda_k_plus, in place
+        lambda_k = self._work_array('lambda_k', self.lambda_k)
+        lambda_k *= float(t+1)/float(t+2)
+        lambda_k_plus *= float(1.0)/float(t+2)
+        lambda_k += lambda_k_plus
+        self.lambda_k = lambda_k
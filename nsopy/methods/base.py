@@ -1,7 +1,293 @@
+import asyncio
+import copy
+import inspect
+import threading
+import time
+
+import numpy as np
+
+from nsopy.oracles import unwrap_oracle, find_batch_oracle, last_call_flags
+from nsopy.projections import accepts_out
+
+
+class BestIterateTracker(object):
+    """ Keeps the best point queried by a method (or the top_k best), with its value and inner solution, in
+    preallocated buffers: memory does not grow with the number of iterations, and nothing is copied unless the
+    incumbent improves. Values are those of the oracle; the best point is the one with the largest sense_sign*d, as
+    the method sets sense_sign to 1 for maximization and -1 for minimization (see SolutionMethod.sense_sign).
+
+    Methods are not monotone, so the incumbent is usually better than the last iterate. It can be read at any time,
+    e.g., by a caller interrupting the method on a deadline: d_best, lambda_best and x_best refer to the internal
+    buffers, while snapshot() returns a consistent copy, also while the method runs in another thread.
+    """
+    def __init__(self, top_k=1, sense_sign=1.0):
+        if top_k < 1:
+            raise ValueError('top_k should be at least 1')
+        self.top_k = top_k
+        self.sense_sign = sense_sign
+        self.values = np.full(top_k, -np.inf)  # sense_sign*d
+        self.lambdas = None  # top_k x dimension, allocated at the first update
+        self.xs = [None]*top_k
+        self.improvements = 0
+        self._lock = threading.Lock()
+
+    @property
+    def d_best(self):
+        return self.sense_sign*np.max(self.values)
+
+    @property
+    def lambda_best(self):
+        return None if self.lambdas is None else self.lambdas[np.argmax(self.values)]
+
+    @property
+    def x_best(self):
+        return self.xs[np.argmax(self.values)]
+
+    def oracle_update(self, points, results):
+        for lambda_j, (x_j, d_j, _) in zip(points, results):
+            value_j = self.sense_sign*float(np.squeeze(d_j))
+            worst = np.argmin(self.values)
+            if not value_j > self.values[worst]:
+                continue
+            with self._lock:
+                lambda_j = np.atleast_1d(lambda_j)
+                if self.lambdas is None:
+                    self.lambdas = np.full((self.top_k, len(lambda_j)), np.nan)
+                self.lambdas[worst] = lambda_j
+                self.values[worst] = value_j
+                self.xs[worst] = copy.deepcopy(x_j)
+                self.improvements += 1
+
+    def snapshot(self):
+        """ Copy of the incumbent, as (d_best, lambda_best, x_best); (-inf, None, None) before the first query (+inf
+        when minimizing). """
+        with self._lock:
+            if self.lambdas is None:
+                return self.d_best, None, None
+            best = np.argmax(self.values)
+            return self.sense_sign*self.values[best], self.lambdas[best].copy(), copy.deepcopy(self.xs[best])
+
+    def top(self):
+        """ Copies of the points kept, as a list of (d, lambda, x), best first. """
+        with self._lock:
+            return [(self.sense_sign*self.values[j], self.lambdas[j].copy(), copy.deepcopy(self.xs[j]))
+                    for j in np.argsort(-self.values) if np.isfinite(self.values[j])]
+
+
 class SolutionMethod(object):
-    """ Interface for all the nsopy implemented """
+    """ Interface for all the nsopy implemented
+
+    Methods implement one iteration in _dual_step(), a generator which yields the list of points at which the oracle
+    has to be queried next (several points are yielded together when they can be evaluated independently), and
+    receives back the list of corresponding (x_k, d_k, diff_d_k) triples. The same iteration is then driven either
+    synchronously, by dual_step(), or by dual_step_async(), which awaits asynchronous oracles.
+
+    Methods maximize sense_sign*d(lambda), where sense_sign is 1 with sense='max' and -1 with sense='min' (see
+    _set_sense()). The oracle is used as it is: d_k and diff_d_k are the oracle's outputs, and the sign is folded into
+    the steps of the methods, so no negated copy of diff_d_k is made at each call.
+
+    The results of these queries are also passed to the oracle observers (see register_oracle_observer()); among
+    them, best (a BestIterateTracker) keeps the best point queried so far.
+
+    Iterates are updated in place, in work arrays preallocated by the method (see _work_array() and
+    _projected_step()), so that a step allocates nothing besides what the oracle returns (when the projection function
+    accepts an out= argument, as those of nsopy.projections). Arrays such as lambda_k are therefore overwritten at
+    the next step: keep a copy to record them (as the loggers do).
+    """
+    def __init__(self):
+        super(SolutionMethod, self).__init__()
+        # oracle calls answered by an oracle cache (see nsopy.oracles.CachedOracle); these are included in
+        # oracle_calls, so the number of actual oracle evaluations is oracle_calls - cached_oracle_calls
+        self.cached_oracle_calls = 0
+        self._pending_cached_oracle_calls = 0
+        # oracle calls that returned inexact results (see nsopy.oracles.DeadlineSeparableOracle); also included in
+        # oracle_calls
+        self.inexact_oracle_calls = 0
+        self._pending_inexact_oracle_calls = 0
+        # optional concurrent.futures.Executor, used to query oracles without a batched version at several points
+        # concurrently
+        self.oracle_executor = None
+        # time spent in the oracle queries of dual_step() and dual_step_async(), in seconds
+        self.oracle_time = 0.0
+        # False for methods stepping along estimates of d at most iterations (from some of the blocks, or from stale
+        # ones): the oracle observers, and so best, then only receive their occasional exact evaluations
+        self.exact_oracle_results = True
+        self.sense = 'max'
+        self.sense_sign = 1.0
+        self.best = BestIterateTracker()
+        self.oracle_observers = [self.best]
+        self._work_arrays = {}
+        self._projection_function_checked = None
+        self._projection_accepts_out = False
+
+    def _set_sense(self, sense):
+        if sense == 'min':
+            self.sense_sign = -1.0
+        elif sense == 'max':
+            self.sense_sign = 1.0
+        else:
+            raise ValueError('Sense should be either "min" or "max"')
+        self.sense = sense
+        self.best.sense_sign = self.sense_sign
+
+    def track_best(self, top_k=1):
+        """ Replaces best with a tracker keeping the top_k best points queried from now on. """
+        self.remove_oracle_observer(self.best)
+        self.best = BestIterateTracker(top_k=top_k, sense_sign=self.sense_sign)
+        self.register_oracle_observer(self.best)
+
+    def register_oracle_observer(self, observer):
+        """ observer.oracle_update(points, results) will be called with the points and (x_k, d_k, diff_d_k) results
+        of each query of self.oracle made by dual_step() or dual_step_async() (results are as returned by the oracle:
+        the method maximizes sense_sign*d); queries returning inexact results are not passed on. """
+        self.oracle_observers.append(observer)
+
+    def remove_oracle_observer(self, observer):
+        self.oracle_observers.remove(observer)
+
+    def _notify_oracle_observers(self, points, results):
+        for observer in self.oracle_observers:
+            observer.oracle_update(points, results)
+
+    def _work_array(self, name, value=None, shape=None):
+        """ Float array owned by the method, of the given shape (by default, (dimension,)), allocated at the first
+        request; value is copied into it, unless it already is that array. Iterates are only updated in place in such
+        arrays, so that arrays set from outside (e.g., a starting point, method.lambda_k = lambda_0) are never
+        modified. """
+        array = self._work_arrays.get(name)
+        if array is None:
+            array = self._work_arrays[name] = np.zeros(self.dimension if shape is None else shape, dtype=float)
+        if value is not None and value is not array:
+            array[...] = value
+        return array
+
+    def _project(self, lambda_k, out):
+        """ projection_function(lambda_k), written into out (which can be lambda_k itself); without copies when the
+        projection function accepts an out= argument (see nsopy.projections). """
+        if self._projection_function_checked is not self.projection_function:
+            self._projection_function_checked = self.projection_function
+            self._projection_accepts_out = accepts_out(self.projection_function)
+        if self._projection_accepts_out:
+            result = self.projection_function(lambda_k, out=out)
+            if result is not out:
+                out[...] = result
+        else:
+            out[...] = self.projection_function(lambda_k)
+        return out
+
+    def _projected_step(self, lambda_k, stepsize, direction, out):
+        """ P(lambda_k + stepsize*direction), written into out (which can be lambda_k itself). """
+        step = self._work_array('step')
+        np.multiply(direction, stepsize, out=step)
+        np.add(lambda_k, step, out=out)
+        return self._project(out, out)
+
     def dual_step(self):
+        steps = self._dual_step()
+        try:
+            points = next(steps)
+            while True:
+                inexact_oracle_calls = self._pending_inexact_oracle_calls
+                start = time.time()
+                results = self._evaluate_oracle(points)
+                self.oracle_time += time.time() - start
+                if self._pending_inexact_oracle_calls == inexact_oracle_calls:
+                    self._notify_oracle_observers(points, results)
+                points = steps.send(results)
+        except StopIteration:
+            pass
+
+    async def dual_step_async(self):
+        """ Same as dual_step(), for asynchronous oracles (e.g., async def oracle(lambda_k), or oracles returning
+        awaitables). Points that are independent of each other are queried concurrently, so that a single event loop
+        can drive many methods and oracle evaluations. Synchronous oracles are also accepted, but they block the loop.
+        """
+        steps = self._dual_step()
+        try:
+            points = next(steps)
+            while True:
+                inexact_oracle_calls = self._pending_inexact_oracle_calls
+                start = time.time()
+                results = list(await asyncio.gather(*[self._evaluate_oracle_async(lambda_k) for lambda_k in points]))
+                self.oracle_time += time.time() - start
+                if self._pending_inexact_oracle_calls == inexact_oracle_calls:
+                    self._notify_oracle_observers(points, results)
+                points = steps.send(results)
+        except StopIteration:
+            pass
+
+    def _dual_step(self):
         raise NotImplementedError()
 
     def step(self):
-        self.dual_step()
\ No newline at end of file
+        self.dual_step()
+
+    def _evaluate_oracle(self, points):
+        """ Queries the oracle at a list of independent points, and returns the list of (x_k, d_k, diff_d_k) triples.
+        Multiple points are queried together: the batched version of the oracle is used if available (see
+        nsopy.oracles); otherwise the points are queried one by one, concurrently if an oracle_executor is set.
+        Calls are not counted here, but in _count_oracle_calls(), which methods call after each query.
+        """
+        if len(points) == 1:
+            results = self._check_synchronous([self.oracle(points[0])])
+            self._record_oracle_call()
+            return results
+
+        oracle_batch = find_batch_oracle(self.oracle)
+        if oracle_batch is not None:
+            [(X, D, diff_D)] = self._check_synchronous([oracle_batch(np.asarray(points, dtype=float))])
+            self._pending_cached_oracle_calls += getattr(unwrap_oracle(self.oracle), 'last_batch_cached_calls', 0)
+            return list(zip(X, D, diff_D))
+        elif self.oracle_executor is not None:
+            results = []
+            for result, cached, inexact in self.oracle_executor.map(_flagged_oracle_call, [self.oracle]*len(points),
+                                                                    points):
+                results.extend(self._check_synchronous([result]))
+                self._pending_cached_oracle_calls += cached
+                self._pending_inexact_oracle_calls += inexact
+            return results
+        else:
+            results = []
+            for lambda_k in points:
+                results.extend(self._check_synchronous([self.oracle(lambda_k)]))
+                self._record_oracle_call()
+            return results
+
+    async def _evaluate_oracle_async(self, lambda_k):
+        result = self.oracle(lambda_k)
+        if inspect.isawaitable(result):
+            result = await result
+        # nothing else runs on the event loop between the end of the query and this point, so the oracle still holds
+        # the flags of this query
+        self._record_oracle_call()
+        return result
+
+    @staticmethod
+    def _check_synchronous(results):
+        # dual_step() cannot await the results of asynchronous oracles
+        awaitables = [result for result in results if inspect.isawaitable(result)]
+        if awaitables:
+            for result in awaitables:
+                if inspect.iscoroutine(result):
+                    result.close()  # it will never be awaited
+            raise TypeError('The oracle is asynchronous: use dual_step_async() instead of dual_step().')
+        return results
+
+    def _record_oracle_call(self):
+        # counts the last call of the oracle among the cached or inexact ones (see nsopy.oracles)
+        cached, inexact = last_call_flags(self.oracle)
+        self._pending_cached_oracle_calls += cached
+        self._pending_inexact_oracle_calls += inexact
+
+    def _count_oracle_calls(self, n_calls):
+        self.oracle_calls += n_calls
+        self.cached_oracle_calls += self._pending_cached_oracle_calls
+        self._pending_cached_oracle_calls = 0
+        self.inexact_oracle_calls += self._pending_inexact_oracle_calls
+        self._pending_inexact_oracle_calls = 0
+
+
+def _flagged_oracle_call(oracle, lambda_k):
+    # oracle call on a worker of an oracle_executor, with the flags of the call (which are per thread)
+    result = oracle(lambda_k)
+    return (result,) + last_call_flags(oracle)
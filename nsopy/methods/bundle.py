@@ -1,40 +1,275 @@
 from nsopy.observer_pattern import Observable
 from nsopy.methods.base import SolutionMethod
+from nsopy.methods.cut_pool import CutPool
+from nsopy.methods.master_problems import make_master_problem, dual_domain_constraints
+from nsopy.oracles import unwrap_oracle, last_call_flags, SeparableOracle
 import numpy as np
-import copy
-
-from nsopy.utils import invert_oracle_sense
-
-try:
-    import gurobipy as gb
-except ImportError:
-    print('Gurobi required for Cutting Planes and Bundle nsopy.')
+import time
 
 
 DEFAULT_EPSILON = 0.01
 DEFAULT_MU = 0.5
 SEARCH_BOX_MIN = -10
 SEARCH_BOX_MAX = 10
+CUT_ACTIVITY_TOLERANCE = 1e-9
+
+
+class BundleManager(object):
+    """ Keeps the bundle of a cutting planes method (method.bundle, and the cuts of its master problem) from growing
+    without bound:
+    - remove_duplicate_cuts: a new cut with the same slope as a cut in the bundle replaces it if its offset is
+      larger (the old cut is then dominated), and is discarded otherwise
+    - max_inactive_iterations: cuts whose multiplier in the master problem has been zero for this many consecutive
+      iterations are removed
+    - max_bundle_size: when the bundle grows larger, the cuts that have been inactive for longest are removed (and,
+      if there are not enough inactive cuts, the oldest active ones)
+    - aggregate_cuts: when cuts with positive multipliers are removed, the aggregate cut sum_j alpha_j (a_j, b_j),
+      weighted with the multipliers alpha_j of all the cuts in the master problem, is added in their place (as in
+      Kiwiel's aggregation); it is active at the last solution of the master problem, which remains optimal.
+    With multi-cut models, duplicates are looked for, and cuts aggregated, within each block.
+
+    add_new_cuts() passes the cuts added to the bundle since the last call to the master problem, and update()
+    manages the bundle after each master problem solve. removed_cuts, aggregated_cuts and duplicate_cuts count the
+    cuts removed so far.
+    """
+    def __init__(self, bundle, master_problem, max_bundle_size=None, max_inactive_iterations=None,
+                 aggregate_cuts=True, remove_duplicate_cuts=False):
+        if max_bundle_size is not None and max_bundle_size < 2*bundle.n_blocks:
+            raise ValueError('max_bundle_size should be at least 2 per block (the last cut, and the aggregate cut)')
+        if max_inactive_iterations is not None and max_inactive_iterations < 1:
+            raise ValueError('max_inactive_iterations should be a positive integer')
+        self.bundle = bundle
+        self.master_problem = master_problem
+        self.max_bundle_size = max_bundle_size
+        self.max_inactive_iterations = max_inactive_iterations
+        self.aggregate_cuts = aggregate_cuts
+        self.remove_duplicate_cuts = remove_duplicate_cuts
+
+        # for each cut of the bundle, number of consecutive iterations in which it was inactive
+        self.inactive_iterations = []
+        self._n_new_cuts = 0
+        self.removed_cuts = 0
+        self.aggregated_cuts = 0
+        self.duplicate_cuts = 0
+
+    def add_new_cuts(self):
+        self._n_new_cuts = 0
+        while len(self.inactive_iterations) < len(self.bundle):
+            # the cuts before j have been passed to the master problem already
+            j = len(self.inactive_iterations)
+            a, b = self.bundle[j]
+            block = self.bundle.blocks[j]
+            if self.remove_duplicate_cuts:
+                duplicates = self.bundle.find_slope(a, n_cuts=j, block=block)
+                if np.any(b <= self.bundle.offsets[duplicates]):
+                    self.bundle.remove([j])
+                    self.duplicate_cuts += 1
+                    continue
+                if len(duplicates):
+                    self._remove_cuts(duplicates)
+                    self.duplicate_cuts += len(duplicates)
+            self.master_problem.add_cut(a, b, block=block)
+            self.inactive_iterations.append(0)
+            self._n_new_cuts += 1
+
+    def update(self):
+        multipliers = np.asarray(self.master_problem.multipliers, dtype=float)
+        active = multipliers > CUT_ACTIVITY_TOLERANCE
+        self.inactive_iterations = [0 if is_active else k + 1
+                                    for k, is_active in zip(self.inactive_iterations, active)]
+
+        remove = set()
+        if self.max_inactive_iterations is not None:
+            remove = {j for j, k in enumerate(self.inactive_iterations) if k >= self.max_inactive_iterations}
+        if self.max_bundle_size is not None:
+            # never remove the newest cuts; among the others, the longest inactive go first, then the oldest
+            candidates = sorted([j for j in range(len(self.bundle) - self._n_new_cuts) if j not in remove],
+                                key=lambda j: (-self.inactive_iterations[j], j))
+            for j in candidates:
+                if len(self.bundle) - len(remove) + len(self._aggregated_blocks(remove, active)) <= \
+                        self.max_bundle_size:
+                    break
+                remove.add(j)
+        if not remove:
+            return
+
+        blocks = self.bundle.blocks
+        aggregates = []
+        for block in self._aggregated_blocks(remove, active):
+            weights = np.where(blocks == block, multipliers, 0.0)
+            aggregates.append((block,) + tuple(self.bundle.aggregate(weights/np.sum(weights))))
+        self._remove_cuts(sorted(remove))
+        self.removed_cuts += len(remove)
+        for block, a_bar, b_bar in aggregates:
+            self.bundle.add_cut(a_bar, b_bar, block=block)
+            self.master_problem.add_cut(a_bar, b_bar, block=block)
+            self.inactive_iterations.append(0)
+            self.aggregated_cuts += 1
+
+    def _aggregated_blocks(self, remove, active):
+        # blocks some of whose active cuts are removed
+        if not self.aggregate_cuts or not remove:
+            return []
+        remove = sorted(remove)
+        return sorted(set(self.bundle.blocks[remove][active[remove]]))
+
+    def _remove_cuts(self, indices):
+        # the last cut of the bundle may not have been passed to the master problem yet
+        self.master_problem.remove_cuts([j for j in indices if j < len(self.inactive_iterations)])
+        self.bundle.remove(indices)
+        indices = set(indices)
+        self.inactive_iterations = [k for j, k in enumerate(self.inactive_iterations) if j not in indices]
+
+
+class _CutModelMixin(object):
+    """ Oracle queries and cuts of the cutting planes and bundle methods. With multi_cut=True, the oracle has to be a
+    separable oracle (see nsopy.oracles.SeparableOracle): its blocks are evaluated separately, their results are
+    kept in block_results, and one cut per block is added to a disaggregated model (see
+    nsopy.methods.master_problems).
+
+    Cuts are only valid if the values and subgradients they are built from are evaluated at the query point: when the
+    oracle returns inexact results (see nsopy.oracles.DeadlineSeparableOracle), the cuts of the late blocks (or, with a
+    single cut, the cut) are left out, and the methods do not stop, nor move their center, on inexact values.
+
+    save_cuts() and load_cuts() export the bundle and the current center to a file, and seed a new run from it. """
+    def _init_multi_cut(self, oracle, sense, multi_cut):
+        self.oracle = oracle
+        self._set_sense(sense)  # the method maximizes sense_sign*d
+        self.multi_cut = multi_cut
+        self.n_blocks = 1
+        self.block_results = None
+        if multi_cut:
+            if not hasattr(oracle, 'evaluate_blocks'):
+                raise ValueError('multi_cut requires a separable oracle (see nsopy.oracles.SeparableOracle)')
+            self.separable_oracle = oracle
+            self.n_blocks = oracle.n_blocks
+
+    def _evaluate_oracle(self, points):
+        if not self.multi_cut:
+            return super(_CutModelMixin, self)._evaluate_oracle(points)
+        results = []
+        for lambda_k in points:
+            results.append(self._aggregate_blocks(self.separable_oracle.evaluate_blocks(lambda_k)))
+            self._record_oracle_call()
+        return results
+
+    async def _evaluate_oracle_async(self, lambda_k):
+        if not self.multi_cut:
+            return await super(_CutModelMixin, self)._evaluate_oracle_async(lambda_k)
+        result = self._aggregate_blocks(await self.separable_oracle.evaluate_blocks_async(lambda_k))
+        self._record_oracle_call()
+        return result
+
+    def _aggregate_blocks(self, block_results):
+        self.block_results = block_results
+        return SeparableOracle.aggregate(block_results)
+
+    def _inexact_blocks(self):
+        # blocks of the last oracle query whose results are not evaluated at the query point
+        if not last_call_flags(self.oracle)[1]:
+            return []
+        if self.multi_cut:
+            return list(getattr(unwrap_oracle(self.separable_oracle), 'inexact_blocks', range(self.n_blocks)))
+        return [0]
+
+    def _add_cuts(self, inexact_blocks=()):
+        # cuts at lambda_k, of the function or of each of its blocks
+        results = self.block_results if self.multi_cut else [(self.x_k, self.d_k, self.diff_d_k)]
+        self._add_cuts_at(self.lambda_k, results, inexact_blocks)
+
+    def _add_cuts_at(self, lambda_k, results, inexact_blocks=()):
+        # cuts of -sense_sign*d, which the master problems minimize
+        for block, (_, d_k, diff_d_k) in enumerate(results):
+            if block in inexact_blocks:
+                continue
+            a = -self.sense_sign*diff_d_k
+            b = -self.sense_sign*d_k - np.dot(a, lambda_k)
+            self.bundle.add_cut(a, b, block=block, point=lambda_k)  # f_hat(lambda) = a*lambda + b
+
+    def save_cuts(self, file):
+        """ Writes the bundle, the center lambda_hat_k and its value d_hat_k (for the cutting planes method, the
+        last iterate lambda_k and d_k) to file, in numpy's .npz format (see CutPool.save). """
+        lambda_hat_k, d_hat_k = self._center()
+        self.bundle.save(file, sense=self.sense, lambda_hat_k=lambda_hat_k, d_hat_k=d_hat_k)
+
+    def load_cuts(self, file, revalidate='evaluate', slope_shift=None, offset_shift=None):
+        """ Seeds the bundle, and the starting point, with the cuts and center saved by save_cuts(); call before the
+        first step, on a method with the same dimension, sense and blocks.
+
+        Cuts are revalidated against the current oracle:
+        - revalidate='evaluate': the oracle is queried again at the points at which the cuts were generated (cuts
+          that were not generated at a point, such as aggregates, are dropped); the cuts must have been saved by a
+          method with keep_cut_points=True;
+        - revalidate='shift': the function changed by a known affine term, f_new(lambda) = f_old(lambda) +
+          slope_shift^T lambda + offset_shift, e.g., when the right-hand sides of the relaxed constraints (slopes) or
+          the objective constants of the inner problem (offsets) changed; cuts are shifted, without oracle calls.
+          With multi_cut, the shift of each block can be given as a n_blocks x dimension array and a vector;
+        - revalidate=None: the cuts are used as they are.
+        """
+        pool, arrays = CutPool.load(file)
+        if pool.dimension != self.dimension or pool.n_blocks != self.n_blocks or str(arrays['sense']) != self.sense:
+            raise ValueError('The saved cuts do not match the dimension, blocks or sense of the method')
+        lambda_hat_k, d_hat_k = arrays['lambda_hat_k'], float(arrays['d_hat_k'])
+
+        if revalidate == 'evaluate':
+            if not pool.keep_points:
+                raise ValueError('The cuts were saved without their points (keep_cut_points=False): revalidate them '
+                                 'with revalidate="shift" or None')
+            points = list(pool.unique_points)
+            if self.multi_cut:
+                for lambda_k in points:
+                    self._evaluate_oracle([lambda_k])
+                    self._add_cuts_at(lambda_k, self.block_results, self._inexact_blocks())
+            else:
+                for lambda_k, result in zip(points, self._evaluate_oracle(points)):
+                    self._add_cuts_at(lambda_k, [result])
+            self._count_oracle_calls(len(points))
+        elif revalidate in ['shift', None]:
+            if revalidate == 'shift':
+                # cuts are stored for the minimization of -sense_sign*d (see _add_cuts_at)
+                slopes = None if slope_shift is None else -self.sense_sign*np.asarray(slope_shift, dtype=float)
+                offsets = None if offset_shift is None else -self.sense_sign*np.asarray(offset_shift, dtype=float)
+                pool.shift(slopes=slopes, offsets=offsets)
+                if slope_shift is not None:
+                    d_hat_k += np.sum(np.reshape(slope_shift, (-1, self.dimension)), axis=0).dot(lambda_hat_k)
+                if offset_shift is not None:
+                    d_hat_k += np.sum(offset_shift)
+            points = pool.points
+            for j, (a, b) in enumerate(pool):
+                point = None if points is None or np.any(np.isnan(points[j])) else points[j]
+                self.bundle.add_cut(a, b, block=pool.blocks[j], point=point)
+        else:
+            raise ValueError('revalidate should be "evaluate", "shift" or None')
+        self._set_center(lambda_hat_k, d_hat_k)
 
 
-class CuttingPlanesMethod(SolutionMethod, Observable):
+class CuttingPlanesMethod(_CutModelMixin, SolutionMethod, Observable):
     """
     Implementation of Algorithm (CP) in [1], p.19.
 
     [1] Alexandre Belloni, Lecture Notes for IAP 2005 Course Introduction to Bundle Methods.
     pdf originally at: https://faculty.fuqua.duke.edu/~abn5/LecturesIntroBundle.pdf
+
+    The LP master problem is solved by master_problem: 'gurobi', 'scipy' or a MasterProblem instance (see
+    nsopy.methods.master_problems); by default, Gurobi if it is installed, and scipy's HiGHS otherwise.
+
+    The size of the bundle is controlled by max_bundle_size, max_inactive_iterations, aggregate_cuts and
+    remove_duplicate_cuts (see BundleManager); bundle_size and master_solve_time (of the last master problem, in
+    seconds) are available to observers. Cuts are stored in a CutPool (nsopy.methods.cut_pool), in CSR format with
+    sparse_cuts=True; keep_cut_points=True also keeps the points at which they were generated, which save_cuts()
+    writes for load_cuts(revalidate='evaluate').
+
+    For separable oracles, multi_cut=True keeps a cutting plane model per block, and adds a cut per block at each
+    oracle call, which usually takes fewer iterations to converge.
     """
 
-    def __init__(self, oracle, projection_function, dimension=0, epsilon=DEFAULT_EPSILON, search_box_min=SEARCH_BOX_MIN, search_box_max=SEARCH_BOX_MAX, sense='min'):
+    def __init__(self, oracle, projection_function, dimension=0, epsilon=DEFAULT_EPSILON, search_box_min=SEARCH_BOX_MIN, search_box_max=SEARCH_BOX_MAX, sense='min',
+                 master_problem=None, max_bundle_size=None, max_inactive_iterations=None, aggregate_cuts=True,
+                 remove_duplicate_cuts=False, sparse_cuts=False, multi_cut=False, keep_cut_points=False):
         super(CuttingPlanesMethod, self).__init__()
         self.desc = f"Cutting Planes, $\\epsilon = {epsilon}$"
 
-        if sense == 'min':
-            self.oracle = invert_oracle_sense(oracle)  # all methods have been coded to maximize the oracle model
-        elif sense == 'max':
-            self.oracle = oracle
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self._init_multi_cut(oracle, sense, multi_cut)
         self.projection_function = projection_function
 
         self.iteration_number = 1
@@ -60,49 +295,40 @@ class CuttingPlanesMethod(SolutionMethod, Observable):
 
         # initial function value
         self.f_hat_lambda_k = -np.infty
-        self.bundle = []
-
-        # --------------------------------------------------- #
-        # Initialize LP model of cutting plane
-        self.bundle_model = gb.Model()
-        # self.bundle_model.setParam(u'MIPGap', 0.745)
-        self.bundle_model.setParam(u'TimeLimit', 360)
-        # self.bundle_model.setParam('OutputFlag', False)
-        self.r = self.bundle_model.addVar(obj=1, lb=-gb.GRB.INFINITY, name='r')
-        self.lmd = {}
-        for i in range(self.dimension):
-            self.lmd[i] = self.bundle_model.addVar(vtype=gb.GRB.CONTINUOUS,
-                                                   obj=0,
-                                                   lb=self.lambda_min,
-                                                   ub=self.lambda_max,
-                                                   name='lambda_{}'.format(i))
-        self.constraints = {}
-        self.bundle_model.update()
-        # --------------------------------------------------- #
+        self.bundle = CutPool(self.dimension, sparse=sparse_cuts, n_blocks=self.n_blocks,
+                              keep_points=keep_cut_points)
+
+        # LP model of cutting plane
+        self.master_problem = make_master_problem(master_problem, self.dimension,
+                                                  lambda_min=self.lambda_min, lambda_max=self.lambda_max,
+                                                  sparse=sparse_cuts, n_blocks=self.n_blocks)
+        self.bundle_manager = BundleManager(self.bundle, self.master_problem, max_bundle_size=max_bundle_size,
+                                            max_inactive_iterations=max_inactive_iterations,
+                                            aggregate_cuts=aggregate_cuts, remove_duplicate_cuts=remove_duplicate_cuts)
+        self.bundle_size = 0
+        self.master_solve_time = 0.0
 
         self.method_name = 'CP'
         self.parameter = epsilon
 
-    def dual_step(self):
+    def _dual_step(self):
         if self.optimizer_not_yet_found:
             # Step 2
-            self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-            self.oracle_calls += 1
+            [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+            self._count_oracle_calls(1)
+            inexact_blocks = self._inexact_blocks()
 
             # Step 3
-            delta_k = abs(self.d_k - self.f_hat_lambda_k)
+            delta_k = abs(self.sense_sign*self.d_k - self.f_hat_lambda_k)
 
             # Step 4
-            if delta_k < self.epsilon:
+            if delta_k < self.epsilon and not inexact_blocks:
                 print('We have found a point satisfying optimality gap', delta_k)
                 # optimizer found
                 self.optimizer_not_yet_found = False
             else:
                 # Step 5
-                a = - self.diff_d_k
-                b = - self.d_k - np.dot(-self.diff_d_k, self.lambda_k)
-                self.bundle.append((a, b))  # f_hat(lambda) = a*lambda + b
-                print("bundle model: "+str(self.bundle))
+                self._add_cuts(inexact_blocks)
                 # Step 6, compute and solve LP
                 self.f_hat_lambda_k, self.lambda_k = self.min_of_bundle()
 
@@ -112,65 +338,61 @@ class CuttingPlanesMethod(SolutionMethod, Observable):
         # log signal to any observers connected
         self.notify_observers()
 
+    def _center(self):
+        return self.lambda_k, self.d_k
+
+    def _set_center(self, lambda_k, d_k):
+        # the run starts at the saved point
+        self.lambda_k = lambda_k
+        self.d_k = d_k
+
     def min_of_bundle(self):
         # add new constraint
-        a, b = self.bundle[-1]
-        # self.bundle_model.addConstr(self.r >= gb.quicksum([a[i]*self.lmd[i] for i in range(self.n_constr)]) + b)
-        self.constraints[self.iteration_number] = self.bundle_model.addConstr(
-            self.r >= gb.quicksum([a[i] * self.lmd[i] for i in range(self.dimension)]) + b)
+        self.bundle_manager.add_new_cuts()
 
-        self.bundle_model.update()
-        self.bundle_model.optimize()
-        optimizer = np.array([self.lmd[i].X for i in range(self.dimension)])
+        start = time.time()
+        result = self.master_problem.solve()
+        self.master_solve_time = time.time() - start
 
-        return self.bundle_model.ObjVal, optimizer
+        self.bundle_manager.update()
+        self.bundle_size = len(self.bundle)
+        return result
 
     def set_dual_domain(self, type='free', param=0):
         # constrain dual domain
-        if type == 'free':
-            pass
-        elif type == 'positive orthant':
-            for i in range(self.dimension):
-                self.bundle_model.addConstr(self.lmd[i] >= 0)
-        elif type == 'sum to param':
-            self.bundle_model.addConstr(gb.quicksum([self.lmd[i] for i in self.lmd]) == param)
-        elif type == '2 stage smps':
+        if type == '2 stage smps':
             # custom made for this inner problem type
-            inner_problem = self.oracle.__self__
-            for i in range(inner_problem.n_x):
-                self.bundle_model.addConstr(
-                    gb.quicksum([self.lmd[i+sc*(inner_problem.n_x)] for sc in range(inner_problem.n_scenarios)]) == 0
-                )
-        elif type == 'mrf':
-            for i in range(int(self.dimension/2)):
-                self.bundle_model.addConstr(
-                    self.lmd[i] + self.lmd[i + int(self.dimension / 2)] == 0
-                )
+            inner_problem = unwrap_oracle(self.oracle).__self__
         else:
-            ValueError('Type of dual domain not recognized.')
-
-        self.bundle_model.update()
+            inner_problem = None
+        lower_bounds, A_eq, b_eq = dual_domain_constraints(type, self.dimension, param=param,
+                                                           inner_problem=inner_problem)
+        if lower_bounds is not None:
+            self.master_problem.add_lower_bounds(lower_bounds)
+        if A_eq is not None:
+            self.master_problem.add_equality_constraints(A_eq, b_eq)
 
 
-class BundleMethod(SolutionMethod, Observable):
+class BundleMethod(_CutModelMixin, SolutionMethod, Observable):
     """
     Implementation of Bundle Method, based on my paper, as adapted from algorithm (BA) in [1],
     p.21 and Algorithm 7.3 in [2], p.374 (for the constrained dual case).
 
     [1] Alexandre Belloni, Lecture Notes for IAP 2005 Course Introduction to Bundle Methods.
     pdf originally at: https://faculty.fuqua.duke.edu/~abn5/LecturesIntroBundle.pdf
+
+    The QP master problem is solved by master_problem (see CuttingPlanesMethod); on a free dual domain,
+    master_problem='dual qp' solves its dual, whose size does not depend on the dimension. The bundle is managed,
+    and multi_cut works, as in CuttingPlanesMethod.
     """
 
-    def __init__(self, oracle, projection_function, dimension=0, epsilon=DEFAULT_EPSILON, mu=DEFAULT_MU, sense='min'):
+    def __init__(self, oracle, projection_function, dimension=0, epsilon=DEFAULT_EPSILON, mu=DEFAULT_MU, sense='min',
+                 master_problem=None, max_bundle_size=None, max_inactive_iterations=None, aggregate_cuts=True,
+                 remove_duplicate_cuts=False, sparse_cuts=False, multi_cut=False, keep_cut_points=False):
         super(BundleMethod, self).__init__()
         self.desc = f"Bundle Method, $\\epsilon = {epsilon}, \mu = {mu}$"
 
-        if sense == 'min':
-            self.oracle = invert_oracle_sense(oracle)  # all methods have been coded to maximize the oracle model
-        elif sense == 'max':
-            self.oracle = oracle
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self._init_multi_cut(oracle, sense, multi_cut)
         self.projection_function = projection_function
 
         self.iteration_number = 1
@@ -206,48 +428,39 @@ class BundleMethod(SolutionMethod, Observable):
         self.f_hat_lambda_k = -np.infty
 
         # bundle model
-        self.bundle = []
-
-        # --------------------------------------------------- #
-        # Initialize LP model of cutting plane
-        self.bundle_model = gb.Model()
-        # self.bundle_model.setParam(u'MIPGap', 0.745)
-        # self.bundle_model.setParam(u'TimeLimit', 120)
-        self.bundle_model.setParam('OutputFlag', False)
-        self.r = self.bundle_model.addVar(obj=1, lb=-gb.GRB.INFINITY)
-        self.lmd = {}
-        for i in range(self.dimension):
-            self.lmd[i] = self.bundle_model.addVar(vtype=gb.GRB.CONTINUOUS,
-                                                   obj=0,
-                                                   lb=-gb.GRB.INFINITY,
-                                                   )
-        self.constraints = {}
-        self.bundle_model.update()
-        # --------------------------------------------------- #
+        self.bundle = CutPool(self.dimension, sparse=sparse_cuts, n_blocks=self.n_blocks,
+                              keep_points=keep_cut_points)
+
+        # QP model of the bundle
+        self.master_problem = make_master_problem(master_problem, self.dimension, sparse=sparse_cuts,
+                                                  n_blocks=self.n_blocks)
+        self.bundle_manager = BundleManager(self.bundle, self.master_problem, max_bundle_size=max_bundle_size,
+                                            max_inactive_iterations=max_inactive_iterations,
+                                            aggregate_cuts=aggregate_cuts, remove_duplicate_cuts=remove_duplicate_cuts)
+        self.bundle_size = 0
+        self.master_solve_time = 0.0
 
         # for record keeping
         self.method_name = 'bundle'
         self.parameter = epsilon
 
-    def dual_step(self):
+    def _dual_step(self):
         if self.iteration_number == 1:
-            self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-            self.oracle_calls += 1
+            [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+            self._count_oracle_calls(1)
 
             # "hat" values
-            self.lambda_hat_k = self.projection_function(np.zeros(self.dimension, dtype=float))
-            self.d_hat_k = copy.deepcopy(self.d_k)
-            self.diff_d_hat_k = copy.deepcopy(self.diff_d_k)
+            self.lambda_hat_k = np.array(self.lambda_k, dtype=float)
+            self.d_hat_k = self.d_k
+            self.diff_d_hat_k = self.diff_d_k
 
-            a = - self.diff_d_k
-            b = - self.d_k - np.dot(-self.diff_d_k, self.lambda_k)
-            self.bundle.append((a, b))  # f_hat(lambda) = a*lambda + b
+            self._add_cuts(self._inexact_blocks())
 
         if self.optimizer_not_yet_found:
             # Step 1
             d_star_k, self.lambda_k = self.min_of_bundle()
 
-            delta_k = abs(-self.d_k -d_star_k)
+            delta_k = abs(-self.sense_sign*self.d_k - d_star_k)
 
             # Step 2, 3
             if delta_k < self.epsilon:
@@ -255,15 +468,14 @@ class BundleMethod(SolutionMethod, Observable):
                 # print('optimizer found')
             else:
                 # Step 4
-                self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-                self.oracle_calls += 1
+                [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+                self._count_oracle_calls(1)
+                inexact_blocks = self._inexact_blocks()
 
-                a = - self.diff_d_k
-                b = - self.d_k - np.dot(-self.diff_d_k, self.lambda_k)
-                self.bundle.append((a, b))  # f_hat(lambda) = a*lambda + b
+                self._add_cuts(inexact_blocks)
 
                 # Step 5
-                if self.d_k - self.d_hat_k >= self.gamma*self.epsilon:
+                if self.sense_sign*(self.d_k - self.d_hat_k) >= self.gamma*self.epsilon and not inexact_blocks:
                     # SERIOUS STEP
                     self.d_hat_k = self.d_k
                     self.lambda_hat_k = self.lambda_k
@@ -278,59 +490,37 @@ class BundleMethod(SolutionMethod, Observable):
         # log signal to any observers connected
         self.notify_observers()
 
-    def min_of_bundle(self):
-        # set objective
-        objective = self.r + float(self.mu)/float(2)*gb.quicksum(
-            [(self.lmd[i] - self.lambda_hat_k[i]) * (self.lmd[i] - self.lambda_hat_k[i]) for i in range(self.dimension)]
-        )
-        self.bundle_model.setObjective(objective)
+    def _center(self):
+        return self.lambda_hat_k, self.d_hat_k
+
+    def _set_center(self, lambda_hat_k, d_hat_k):
+        # the run starts at the saved center, whose value is refreshed by the first oracle call
+        self.lambda_k = lambda_hat_k
+        self.lambda_hat_k = lambda_hat_k
+        self.d_hat_k = d_hat_k
 
-        # rest below is same as cutting planes
+    def min_of_bundle(self):
         # add new constraint
-        a, b = self.bundle[-1]
-        # print(a,b)
-        # self.bundle_model.addConstr(self.r >= gb.quicksum([a[i]*self.lmd[i] for i in range(self.n_constr)]) + b)
-        self.constraints[self.iteration_number] = self.bundle_model.addConstr(
-            self.r >= gb.quicksum([a[i] * self.lmd[i] for i in range(self.dimension)]) + b)
-
-        self.bundle_model.update()
-        # print("constr coeffs lambda mu: " + str(
-        #     [self.bundle_model.getCoeff(self.constraints[self.iteration_number], self.lmd[i]) for i in
-        #      range(self.n_constr)]))
-        # print("constr coeffs r: " + str(self.bundle_model.getCoeff(self.constraints[self.iteration_number], self.r)))
-
-        # self.bundle_model.write('test_model.lp')
-        self.bundle_model.optimize()
-        optimizer = np.array([self.lmd[i].X for i in range(self.dimension)])
-        # return 0, np.array([0, 0])
-        # print("optimizer: " + str(optimizer))
-        # print("val: " + str(self.r.X))
-
-        return self.bundle_model.ObjVal, optimizer
+        self.bundle_manager.add_new_cuts()
+
+        start = time.time()
+        result = self.master_problem.solve(center=self.lambda_hat_k, mu=self.mu)
+        self.master_solve_time = time.time() - start
+
+        self.bundle_manager.update()
+        self.bundle_size = len(self.bundle)
+        return result
 
     def set_dual_domain(self, type='free', param=0):
         # constrain dual domain
-        if type == 'free':
-            pass
-        elif type == 'positive orthant':
-            for i in range(self.dimension):
-                self.bundle_model.addConstr(self.lmd[i] >= 0)
-        elif type == 'sum to param':
-            self.bundle_model.addConstr(gb.quicksum([self.lmd[i] for i in self.lmd]) == param)
-        elif type == '2 stage smps':
+        if type == '2 stage smps':
             # custom made for this inner problem type
-            inner_problem = self.oracle.__self__
-            for i in range(inner_problem.n_x):
-                self.bundle_model.addConstr(
-                    gb.quicksum([self.lmd[i+sc*(inner_problem.n_x)] for sc in range(inner_problem.n_scenarios)]) == 0
-                )
-        elif type == 'mrf':
-            for i in range(int(self.dimension/2)):
-                self.bundle_model.addConstr(
-                    self.lmd[i] + self.lmd[i + int(self.dimension / 2)] == 0
-                )
+            inner_problem = unwrap_oracle(self.oracle).__self__
         else:
-            ValueError('Type of dual domain not recognized.')
-
-        self.bundle_model.update()
-
+            inner_problem = None
+        lower_bounds, A_eq, b_eq = dual_domain_constraints(type, self.dimension, param=param,
+                                                           inner_problem=inner_problem)
+        if lower_bounds is not None:
+            self.master_problem.add_lower_bounds(lower_bounds)
+        if A_eq is not None:
+            self.master_problem.add_equality_constraints(A_eq, b_eq)
@@ -0,0 +1,326 @@
+""" Storage of the cuts of cutting plane models, f_hat(lambda) = max_j a_j^T lambda + b_j.
+
+Cuts are kept in a preallocated slopes matrix (one row per cut) and an offsets vector, whose capacity doubles when
+they are full, so that adding a cut is a single row copy and evaluating the model at a point is a single
+matrix-vector product. With sparse=True, slopes are stored in CSR format (the nonzeros of each cut, contiguous), and
+exposed as a scipy.sparse.csr_matrix.
+
+Disaggregated (multi-cut) models of separable functions, f_hat(lambda) = sum_i max_{j in J_i} a_j^T lambda + b_j, are
+stored in the same way, with the index i of the block of each cut in blocks.
+
+With keep_points=True, the point at which each cut was generated is also kept, so that cuts can be re-evaluated when
+the function changes (see points). Points are stored once, however many cuts share them (e.g., the cuts of the blocks
+of a multi-cut model): each cut holds the index of its point in a table of distinct points. save() and load() write
+and read pools in numpy's .npz format.
+"""
+import numpy as np
+
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
+DEFAULT_CUT_CAPACITY = 16
+
+
+def _is_sparse(a):
+    return sp is not None and sp.issparse(a)
+
+
+class CutPool(object):
+    """ Cuts a_j^T lambda + b_j, in the order they were added (see module docstring).
+
+    A CutPool behaves like the list of (a_j, b_j) tuples it replaces: len(), indexing, iteration, append() and pop()
+    are supported; slopes are returned as 1-d arrays, or as 1 x dimension CSR matrices if the pool is sparse.
+    """
+    def __init__(self, dimension, sparse=False, capacity=DEFAULT_CUT_CAPACITY, n_blocks=1, keep_points=False):
+        if sparse and sp is None:
+            raise ImportError('scipy is required to store sparse cuts.')
+        self.dimension = dimension
+        self.sparse = sparse
+        self.n_blocks = n_blocks
+        self.keep_points = keep_points
+        self.n_cuts = 0
+        self._offsets = np.zeros(capacity)
+        self._blocks = np.zeros(capacity, dtype=np.int64)
+        if keep_points:
+            # index of the point of each cut in _unique_points (-1 for cuts without a point)
+            self._point_indices = np.full(capacity, -1, dtype=np.int64)
+            self._unique_points = np.zeros((capacity, dimension))
+            self.n_points = 0
+            self._point_rows = {}
+        if sparse:
+            self._data = np.zeros(capacity)
+            self._indices = np.zeros(capacity, dtype=np.int64)
+            self._indptr = np.zeros(capacity + 1, dtype=np.int64)
+        else:
+            self._slopes = np.zeros((capacity, dimension))
+
+    @property
+    def slopes(self):
+        """ The slopes of the cuts, as a n_cuts x dimension array (or CSR matrix, if the pool is sparse); the array
+        is a view of the storage, and is invalidated when cuts are added or removed. """
+        if self.sparse:
+            nnz = self._indptr[self.n_cuts]
+            return sp.csr_matrix((self._data[:nnz], self._indices[:nnz], self._indptr[:self.n_cuts + 1]),
+                                 shape=(self.n_cuts, self.dimension))
+        return self._slopes[:self.n_cuts]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self.n_cuts]
+
+    @property
+    def blocks(self):
+        return self._blocks[:self.n_cuts]
+
+    @property
+    def points(self):
+        """ The points at which the cuts were generated, as a new n_cuts x dimension array (rows of NaN for cuts
+        without a point), or None if the pool does not keep points. """
+        if not self.keep_points:
+            return None
+        points = np.full((self.n_cuts, self.dimension), np.nan)
+        indices = self._point_indices[:self.n_cuts]
+        points[indices >= 0] = self.unique_points[indices[indices >= 0]]
+        return points
+
+    @property
+    def unique_points(self):
+        """ The distinct points at which the cuts were generated, as a n_points x dimension view of the storage
+        (invalidated when cuts are added or removed), or None if the pool does not keep points. """
+        return self._unique_points[:self.n_points] if self.keep_points else None
+
+    def __len__(self):
+        return self.n_cuts
+
+    def __getitem__(self, j):
+        """ The cut (a_j, b_j); its block is blocks[j]. """
+        if j < 0:
+            j += self.n_cuts
+        if not 0 <= j < self.n_cuts:
+            raise IndexError('cut index out of range')
+        if self.sparse:
+            start, end = self._indptr[j], self._indptr[j + 1]
+            a = sp.csr_matrix((self._data[start:end].copy(), self._indices[start:end].copy(), [0, end - start]),
+                              shape=(1, self.dimension))
+        else:
+            a = self._slopes[j].copy()
+        return a, self._offsets[j]
+
+    def __iter__(self):
+        for j in range(self.n_cuts):
+            yield self[j]
+
+    def append(self, cut):
+        a, b = cut
+        self.add_cut(a, b)
+
+    def add_cut(self, a, b, block=0, point=None):
+        """ Adds the cut a^T lambda + b (to the model of block), generated at point (ignored if the pool does not
+        keep points); a can be a 1-d array, or a 1 x dimension sparse matrix. """
+        if not 0 <= block < self.n_blocks:
+            raise ValueError('block should be in 0, ..., {}'.format(self.n_blocks - 1))
+        m = self.n_cuts
+        if m == len(self._offsets):
+            capacity = max(2*m, 1)
+            self._offsets = self._grow(self._offsets, capacity)
+            self._blocks = self._grow(self._blocks, capacity)
+            if self.keep_points:
+                self._point_indices = self._grow(self._point_indices, capacity, fill_value=-1)
+            if self.sparse:
+                self._indptr = self._grow(self._indptr, capacity + 1)
+            else:
+                self._slopes = self._grow(self._slopes, capacity)
+        self._offsets[m] = np.asarray(b, dtype=float).item()
+        self._blocks[m] = block
+        if self.keep_points:
+            self._point_indices[m] = -1 if point is None else self._point_row(point)
+
+        if self.sparse:
+            if _is_sparse(a):
+                a = sp.csr_matrix(a, copy=True)
+                a.sum_duplicates()
+                a.eliminate_zeros()
+                indices, data = a.indices, a.data
+            else:
+                a = np.asarray(a, dtype=float)
+                indices = np.flatnonzero(a)
+                data = a[indices]
+            start = self._indptr[m]
+            end = start + len(indices)
+            if end > len(self._data):
+                self._data = self._grow(self._data, max(2*len(self._data), end))
+                self._indices = self._grow(self._indices, len(self._data))
+            self._data[start:end] = data
+            self._indices[start:end] = indices
+            self._indptr[m + 1] = end
+        else:
+            self._slopes[m] = a.toarray().ravel() if _is_sparse(a) else a
+        self.n_cuts += 1
+
+    def _point_row(self, point):
+        point = np.asarray(point, dtype=float)
+        key = (point + 0.0).tobytes()  # adding 0.0 maps -0.0 to 0.0
+        row = self._point_rows.get(key)
+        if row is None:
+            row = self._point_rows[key] = self.n_points
+            if row == len(self._unique_points):
+                self._unique_points = self._grow(self._unique_points, max(2*row, 1))
+            self._unique_points[row] = point
+            self.n_points += 1
+        return row
+
+    @staticmethod
+    def _grow(array, length, fill_value=0):
+        grown = np.full((length,) + array.shape[1:], fill_value, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def pop(self):
+        """ Removes the last cut, and returns it. """
+        cut = self[-1]
+        self.n_cuts -= 1
+        return cut
+
+    def remove(self, indices):
+        """ Removes the cuts at positions indices. """
+        keep = np.setdiff1d(np.arange(self.n_cuts), np.asarray(indices, dtype=int))
+        k = len(keep)
+        if self.sparse:
+            lengths = np.diff(self._indptr[:self.n_cuts + 1])
+            kept_nonzeros = np.repeat(np.isin(np.arange(self.n_cuts), keep), lengths)
+            nnz = int(np.sum(kept_nonzeros))
+            self._data[:nnz] = self._data[:len(kept_nonzeros)][kept_nonzeros]
+            self._indices[:nnz] = self._indices[:len(kept_nonzeros)][kept_nonzeros]
+            self._indptr[1:k + 1] = np.cumsum(lengths[keep])
+        else:
+            self._slopes[:k] = self._slopes[keep]
+        self._offsets[:k] = self._offsets[keep]
+        self._blocks[:k] = self._blocks[keep]
+        if self.keep_points:
+            self._point_indices[:k] = self._point_indices[keep]
+            self._drop_unused_points(k)
+        self.n_cuts = k
+
+    def _drop_unused_points(self, n_cuts):
+        indices = self._point_indices[:n_cuts]
+        used = np.unique(indices[indices >= 0])
+        if len(used) == self.n_points:
+            return
+        new_rows = np.full(self.n_points, -1, dtype=np.int64)
+        new_rows[used] = np.arange(len(used))
+        self._point_indices[:n_cuts] = np.where(indices >= 0, new_rows[indices], -1)
+        self._unique_points[:len(used)] = self._unique_points[used]
+        self.n_points = len(used)
+        self._point_rows = {(point + 0.0).tobytes(): row for row, point in enumerate(self.unique_points)}
+
+    def values(self, lambda_k):
+        """ Values of all the cuts at lambda_k. """
+        return self.slopes.dot(lambda_k) + self.offsets
+
+    def evaluate(self, lambda_k):
+        """ Value of the model at lambda_k: max_j a_j^T lambda_k + b_j, or, with several blocks, the sum of the block
+        models. """
+        if self.n_blocks == 1:
+            return np.max(self.values(lambda_k)) if self.n_cuts else -np.inf
+        return np.sum(self.evaluate_blocks(lambda_k))
+
+    def evaluate_blocks(self, lambda_k):
+        """ Values of the models of each block at lambda_k (-inf for blocks without cuts). """
+        block_values = np.full(self.n_blocks, -np.inf)
+        np.maximum.at(block_values, self.blocks, self.values(lambda_k))
+        return block_values
+
+    def aggregate(self, weights):
+        """ The cut sum_j weights_j (a_j, b_j), with a dense slope. """
+        weights = np.asarray(weights, dtype=float)
+        if self.sparse:
+            return self.slopes.T.dot(weights), weights.dot(self.offsets)
+        return weights.dot(self.slopes), weights.dot(self.offsets)
+
+    def find_slope(self, a, n_cuts=None, block=None):
+        """ Positions, among the first n_cuts cuts (all, by default) and those of block (any, by default), of the
+        cuts with slope equal to a. """
+        n_cuts = self.n_cuts if n_cuts is None else n_cuts
+        matches = self._find_slope(a, n_cuts)
+        if block is not None:
+            matches = matches[self._blocks[matches] == block]
+        return matches
+
+    def _find_slope(self, a, n_cuts):
+        if not self.sparse:
+            a = a.toarray().ravel() if _is_sparse(a) else np.asarray(a, dtype=float)
+            return np.flatnonzero(np.all(self._slopes[:n_cuts] == a, axis=1))
+        a = sp.csr_matrix(a, copy=True)
+        a.sum_duplicates()
+        a.eliminate_zeros()
+        lengths = np.diff(self._indptr[:n_cuts + 1])
+        matches = []
+        for j in np.flatnonzero(lengths == a.nnz):
+            start, end = self._indptr[j], self._indptr[j + 1]
+            if np.array_equal(self._indices[start:end], a.indices) and np.array_equal(self._data[start:end], a.data):
+                matches.append(j)
+        return np.array(matches, dtype=int)
+
+    def shift(self, slopes=None, offsets=None):
+        """ Turns the cuts of f into cuts of f + slopes^T lambda + offsets, where slopes and offsets are those of
+        the whole function (added to the model of block 0), or, as a n_blocks x dimension array and a n_blocks
+        vector, those of each block. """
+        if slopes is not None:
+            slopes = np.reshape(np.asarray(slopes, dtype=float), (-1, self.dimension))
+            for block, block_slopes in enumerate(slopes):
+                rows = np.flatnonzero(self.blocks == block)
+                if self.sparse:
+                    self._shift_sparse_slopes(rows, block_slopes)
+                else:
+                    self._slopes[rows] += block_slopes
+        if offsets is not None:
+            offsets = np.atleast_1d(np.asarray(offsets, dtype=float))
+            self.offsets[:] += np.pad(offsets, (0, self.n_blocks - len(offsets)))[self.blocks]
+
+    def _shift_sparse_slopes(self, rows, block_slopes):
+        # rebuilds the CSR storage, since the sparsity pattern of the shifted rows changes
+        indicator = sp.csr_matrix((np.ones(len(rows)), (rows, np.zeros(len(rows), dtype=int))),
+                                  shape=(self.n_cuts, 1))
+        slopes = sp.csr_matrix(self.slopes + indicator.dot(sp.csr_matrix(block_slopes)))
+        slopes.eliminate_zeros()
+        self._data, self._indices = slopes.data.copy(), slopes.indices.astype(np.int64)
+        self._indptr[:self.n_cuts + 1] = slopes.indptr
+
+    def save(self, file, **arrays):
+        """ Writes the cuts, their points if the pool keeps them, and any additional arrays to file, in numpy's .npz
+        format. """
+        if self.sparse:
+            nnz = self._indptr[self.n_cuts]
+            slopes = {'data': self._data[:nnz], 'indices': self._indices[:nnz],
+                      'indptr': self._indptr[:self.n_cuts + 1]}
+        else:
+            slopes = {'slopes': self.slopes}
+        if self.keep_points:
+            slopes.update(point_indices=self._point_indices[:self.n_cuts], unique_points=self.unique_points)
+        np.savez_compressed(file, dimension=self.dimension, sparse=self.sparse, n_blocks=self.n_blocks,
+                            offsets=self.offsets, blocks=self.blocks, **slopes, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """ Reads cuts written by save(); returns the CutPool, and a dict with the additional arrays. """
+        with np.load(file) as contents:
+            arrays = dict(contents)
+        dimension, sparse, n_blocks = int(arrays.pop('dimension')), bool(arrays.pop('sparse')), \
+            int(arrays.pop('n_blocks'))
+        offsets, blocks = arrays.pop('offsets'), arrays.pop('blocks')
+        keep_points = 'point_indices' in arrays
+        if keep_points:
+            point_indices, unique_points = arrays.pop('point_indices'), arrays.pop('unique_points')
+        pool = cls(dimension, sparse=sparse, capacity=max(len(offsets), 1), n_blocks=n_blocks,
+                   keep_points=keep_points)
+        if sparse:
+            slopes = sp.csr_matrix((arrays.pop('data'), arrays.pop('indices'), arrays.pop('indptr')),
+                                   shape=(len(offsets), dimension))
+        else:
+            slopes = arrays.pop('slopes')
+        for j in range(len(offsets)):
+            point = unique_points[point_indices[j]] if keep_points and point_indices[j] >= 0 else None
+            pool.add_cut(slopes[j], offsets[j], block=blocks[j], point=point)
+        return pool, arrays
@@ -0,0 +1,534 @@
+""" Master problems of the cutting planes and bundle methods.
+
+Both methods build a cutting plane model of (the negative of) the dual function,
+
+    f_hat(lambda) = max_j  a_j^T lambda + b_j,
+
+and, at each iteration, minimize it over the dual domain: CuttingPlanesMethod solves the LP
+
+    min  f_hat(lambda)                                          (written as: min r, s.t. r >= a_j^T lambda + b_j)
+
+and BundleMethod the QP with proximal term centered at lambda_hat,
+
+    min  f_hat(lambda) + mu/2 ||lambda - lambda_hat||^2.
+
+For separable functions, the methods can instead keep a disaggregated (multi-cut) model, with one cutting plane model
+per block, f_hat(lambda) = sum_i max_{j in J_i} a_j^T lambda + b_j; the master problems then have one epigraph
+variable r_i per block (min sum_i r_i, s.t. r_i >= a_j^T lambda + b_j for the cuts j of block i).
+
+A MasterProblem holds the cuts and the constraints of the dual domain (bounds, and linear equalities), and solves
+either problem. Methods accept a master_problem argument, which can be the name of one of the backends below or an
+instance of a MasterProblem subclass:
+- 'gurobi': GurobiMasterProblem, which requires gurobipy
+- 'scipy': ScipyMasterProblem, on scipy: the LP is solved with HiGHS (scipy.optimize.linprog); the QP is solved
+  through its dual (with solve_simplex_qp(), warm started from the previous multipliers) on a free dual domain, and
+  with SLSQP (scipy.optimize.minimize) otherwise
+- 'dual qp': DualQPMasterProblem, for the QP on a free dual domain only; it solves the dual of the QP, whose size is
+  the number of cuts rather than the dimension, with no external solver
+None (default) selects 'gurobi' if gurobipy is installed, and 'scipy' otherwise.
+"""
+import numpy as np
+
+from nsopy.methods.cut_pool import CutPool
+
+try:
+    import gurobipy as gb
+except ImportError:
+    gb = None
+
+try:
+    from scipy.optimize import linprog, minimize, LinearConstraint, Bounds
+    import scipy.sparse as sp
+except ImportError:
+    linprog = None
+    sp = None
+
+AVAILABLE_MASTER_PROBLEMS = ('gurobi', 'scipy', 'dual qp')
+GUROBI_TIME_LIMIT = 360  # seconds, per master problem
+
+
+class MasterProblem(object):
+    """ Interface of the master problem backends (see module docstring).
+
+    The dual domain is the box lambda_min <= lambda <= lambda_max, intersected with the constraints added with
+    add_lower_bounds() and add_equality_constraints().
+    """
+    def __init__(self, dimension, lambda_min=-np.inf, lambda_max=np.inf, n_blocks=1):
+        self.dimension = dimension
+        self.lambda_min = lambda_min
+        self.lambda_max = lambda_max
+        self.n_blocks = n_blocks
+        # optimal multipliers of the cuts, in the order they were added, set by solve(); they are nonnegative, sum
+        # to one (over the cuts of each block), and are zero for the cuts that are not active at the solution
+        self.multipliers = np.zeros(0)
+
+    def add_cut(self, a, b, block=0):
+        """ Adds the cut  f_hat(lambda) >= a^T lambda + b (to the model of block, for multi-cut models); a is a 1-d
+        array, or a 1 x dimension sparse matrix. """
+        raise NotImplementedError()
+
+    def remove_cuts(self, indices):
+        """ Removes the cuts at positions indices (positions among the current cuts, in the order they were added).
+        """
+        raise NotImplementedError()
+
+    def add_lower_bounds(self, lower_bounds):
+        """ Constrains lambda >= lower_bounds (entrywise). """
+        raise NotImplementedError()
+
+    def add_equality_constraints(self, A_eq, b_eq):
+        """ Constrains A_eq lambda == b_eq. """
+        raise NotImplementedError()
+
+    def solve(self, center=None, mu=0.0):
+        """ Minimizes f_hat(lambda) (+ mu/2 ||lambda - center||^2, if center is given) over the dual domain, and
+        returns the optimal value and the minimizer. """
+        raise NotImplementedError()
+
+
+def make_master_problem(master_problem, dimension, lambda_min=-np.inf, lambda_max=np.inf, sparse=False, n_blocks=1):
+    """ Instantiates the master_problem backend (see module docstring); MasterProblem instances are returned as they
+    are. With sparse=True, the backends store the cuts in sparse (CSR) format; with n_blocks > 1, the model is
+    disaggregated into n_blocks block models. """
+    if isinstance(master_problem, MasterProblem):
+        if master_problem.n_blocks != n_blocks:
+            raise ValueError('The master problem has {} blocks, {} are needed'.format(master_problem.n_blocks,
+                                                                                      n_blocks))
+        return master_problem
+    if master_problem is None:
+        master_problem = 'gurobi' if gb is not None else 'scipy'
+    if master_problem == 'gurobi':
+        return GurobiMasterProblem(dimension, lambda_min=lambda_min, lambda_max=lambda_max, n_blocks=n_blocks)
+    elif master_problem == 'scipy':
+        return ScipyMasterProblem(dimension, lambda_min=lambda_min, lambda_max=lambda_max, sparse=sparse,
+                                  n_blocks=n_blocks)
+    elif master_problem == 'dual qp':
+        return DualQPMasterProblem(dimension, lambda_min=lambda_min, lambda_max=lambda_max, sparse=sparse,
+                                   n_blocks=n_blocks)
+    raise ValueError('master_problem should be one of {}, or a MasterProblem'.format(AVAILABLE_MASTER_PROBLEMS))
+
+
+def dual_domain_constraints(type, dimension, param=0, inner_problem=None):
+    """ Constraints defining the dual domains of set_dual_domain(), as (lower_bounds, A_eq, b_eq); entries are None
+    when the domain has no such constraints. """
+    if type == 'free':
+        return None, None, None
+    elif type == 'positive orthant':
+        return np.zeros(dimension), None, None
+    elif type == 'sum to param':
+        return None, np.ones((1, dimension)), np.array([float(param)])
+    elif type == '2 stage smps':
+        # custom made for this inner problem type: the copies of each first stage variable sum to zero
+        A_eq = np.zeros((inner_problem.n_x, dimension))
+        for i in range(inner_problem.n_x):
+            A_eq[i, [i + sc*inner_problem.n_x for sc in range(inner_problem.n_scenarios)]] = 1
+        return None, A_eq, np.zeros(inner_problem.n_x)
+    elif type == 'mrf':
+        half = int(dimension/2)
+        A_eq = np.zeros((half, dimension))
+        A_eq[range(half), range(half)] = 1
+        A_eq[range(half), range(half, 2*half)] = 1
+        return None, A_eq, np.zeros(half)
+    raise ValueError('Type of dual domain not recognized.')
+
+
+class GurobiMasterProblem(MasterProblem):
+    """ Master problem on Gurobi; cuts are added to a persistent model, which Gurobi re-optimizes from the previous
+    basis. Cuts, constraints and the proximal objective are passed through Gurobi's matrix API (with the variables
+    ordered as (r, lambda), where r holds the epigraph variables of the blocks), so that no expression is built
+    coefficient by coefficient. Each solve is limited to time_limit seconds (None for no limit). """
+    def __init__(self, dimension, lambda_min=-np.inf, lambda_max=np.inf, n_blocks=1, time_limit=GUROBI_TIME_LIMIT):
+        if gb is None:
+            raise ImportError('Gurobi (gurobipy) is required for the gurobi master problem; use '
+                              "master_problem='scipy' instead.")
+        super(GurobiMasterProblem, self).__init__(dimension, lambda_min=lambda_min, lambda_max=lambda_max,
+                                                  n_blocks=n_blocks)
+
+        self.bundle_model = gb.Model()
+        self.bundle_model.setParam('OutputFlag', False)
+        if time_limit is not None:
+            self.bundle_model.setParam('TimeLimit', time_limit)
+        self.r = [self.bundle_model.addVar(obj=1, lb=-gb.GRB.INFINITY, name='r_{}'.format(block))
+                  for block in range(n_blocks)]
+        self.lmd = {}
+        for i in range(self.dimension):
+            self.lmd[i] = self.bundle_model.addVar(vtype=gb.GRB.CONTINUOUS,
+                                                   obj=0,
+                                                   lb=lambda_min if np.isfinite(lambda_min) else -gb.GRB.INFINITY,
+                                                   ub=lambda_max if np.isfinite(lambda_max) else gb.GRB.INFINITY,
+                                                   name='lambda_{}'.format(i))
+        self.lambda_variables = [self.lmd[i] for i in range(self.dimension)]
+        self.constraints = []
+        self.bundle_model.update()
+
+    def _constraint_matrix(self, r_coefficients, A):
+        # rows of coefficients for the variables (r, lambda)
+        r_coefficients = np.reshape(r_coefficients, (-1, self.n_blocks))
+        if sp is not None and sp.issparse(A):
+            return sp.hstack([sp.csr_matrix(r_coefficients), A], format='csr')
+        return np.hstack([r_coefficients, np.atleast_2d(A)])
+
+    def add_cut(self, a, b, block=0):
+        # a^T lambda - r_block <= -b
+        r_coefficients = np.zeros(self.n_blocks)
+        r_coefficients[block] = -1.0
+        self.constraints.append(self.bundle_model.addMConstr(
+            self._constraint_matrix(r_coefficients, a), None, '<', np.array([-np.asarray(b, dtype=float).item()])))
+
+    def remove_cuts(self, indices):
+        indices = set(indices)
+        for j in indices:
+            self.bundle_model.remove(self.constraints[j])
+        self.constraints = [constraint for j, constraint in enumerate(self.constraints) if j not in indices]
+
+    def add_lower_bounds(self, lower_bounds):
+        current = np.array(self.bundle_model.getAttr('LB', self.lambda_variables))
+        self.bundle_model.setAttr('LB', self.lambda_variables, np.maximum(current, lower_bounds).tolist())
+        self.bundle_model.update()
+
+    def add_equality_constraints(self, A_eq, b_eq):
+        self.bundle_model.addMConstr(self._constraint_matrix(np.zeros((len(b_eq), self.n_blocks)), A_eq), None, '=',
+                                     np.asarray(b_eq, dtype=float))
+        self.bundle_model.update()
+
+    def solve(self, center=None, mu=0.0):
+        if center is not None:
+            # sum(r) + mu/2 ||lambda - center||^2
+            center = np.asarray(center, dtype=float)
+            mu = float(mu)
+            diagonal = np.concatenate([np.zeros(self.n_blocks), np.full(self.dimension, mu/2)])
+            Q = sp.diags(diagonal) if sp is not None else np.diag(diagonal)
+            self.bundle_model.setMObjective(Q, np.concatenate([np.ones(self.n_blocks), -mu*center]),
+                                            mu/2*center.dot(center))
+
+        self.bundle_model.update()
+        self.bundle_model.optimize()
+        optimizer = np.array(self.bundle_model.getAttr('X', self.lambda_variables))
+        # the duals (Pi) of the '<' rows of a minimization are nonpositive in Gurobi
+        self.multipliers = -np.concatenate([np.atleast_1d(constraint.Pi) for constraint in self.constraints])
+
+        return self.bundle_model.ObjVal, optimizer
+
+
+class ScipyMasterProblem(MasterProblem):
+    """ Master problem on scipy's open source solvers. The LP is solved with HiGHS (scipy.optimize.linprog).
+
+    On a free dual domain, the QP is solved through its dual (see DualQPMasterProblem), with solve_simplex_qp()
+    started from the multipliers of the previous solution: its active set is then usually identified in a few
+    iterations, as consecutive master problems differ by a single cut. With bounds or equality constraints, the QP
+    is solved with SLSQP (scipy.optimize.minimize), as a fallback: it is started from the previous solution, but it
+    has no warm started active set, and it only handles dense constraints.
+
+    scipy's interface to HiGHS does not accept an initial basis, so LPs are solved from scratch. Cuts are stored in a
+    CutPool, and passed to HiGHS as a whole (in CSR format, with sparse=True).
+    """
+    def __init__(self, dimension, lambda_min=-np.inf, lambda_max=np.inf, sparse=False, n_blocks=1):
+        if linprog is None:
+            raise ImportError('scipy is required for the scipy master problem.')
+        super(ScipyMasterProblem, self).__init__(dimension, lambda_min=lambda_min, lambda_max=lambda_max,
+                                                 n_blocks=n_blocks)
+        self.cuts = CutPool(dimension, sparse=sparse, n_blocks=n_blocks)
+        self.lower_bounds = np.full(dimension, lambda_min, dtype=float)
+        self.upper_bounds = np.full(dimension, lambda_max, dtype=float)
+        self.A_eq = np.zeros((0, dimension))
+        self.b_eq = np.zeros(0)
+        self.lambda_k = None
+
+    @property
+    def slopes(self):
+        return self.cuts.slopes
+
+    @property
+    def offsets(self):
+        return self.cuts.offsets
+
+    def add_cut(self, a, b, block=0):
+        self.cuts.add_cut(a, b, block=block)
+
+    def remove_cuts(self, indices):
+        if len(self.multipliers) == len(self.cuts):
+            self.multipliers = np.delete(self.multipliers, list(indices))
+        self.cuts.remove(indices)
+
+    def _block_indicators(self):
+        # E[j, i] = 1 if cut j belongs to block i
+        m = len(self.cuts)
+        if self.cuts.sparse:
+            return sp.csr_matrix((np.ones(m), (np.arange(m), self.cuts.blocks)), shape=(m, self.n_blocks))
+        E = np.zeros((m, self.n_blocks))
+        E[np.arange(m), self.cuts.blocks] = 1.0
+        return E
+
+    def add_lower_bounds(self, lower_bounds):
+        self.lower_bounds = np.maximum(self.lower_bounds, lower_bounds)
+
+    def add_equality_constraints(self, A_eq, b_eq):
+        self.A_eq = np.vstack([self.A_eq, A_eq])
+        self.b_eq = np.concatenate([self.b_eq, b_eq])
+
+    def solve(self, center=None, mu=0.0):
+        if center is None:
+            value, self.lambda_k = self._solve_lp()
+        else:
+            value, self.lambda_k = self._solve_qp(np.asarray(center, dtype=float), float(mu))
+        return value, self.lambda_k
+
+    def _solve_lp(self):
+        # variables are (lambda, r), with an epigraph variable r_i per block
+        c = np.concatenate([np.zeros(self.dimension), np.ones(self.n_blocks)])
+        if self.cuts.sparse:
+            A_ub = sp.hstack([self.slopes, -self._block_indicators()], format='csr')
+        else:
+            A_ub = np.hstack([self.slopes, -self._block_indicators()])
+        b_ub = -self.offsets
+        A_eq = np.hstack([self.A_eq, np.zeros((len(self.A_eq), self.n_blocks))]) if len(self.A_eq) else None
+        b_eq = self.b_eq if len(self.b_eq) else None
+        bounds = [(lb if np.isfinite(lb) else None, ub if np.isfinite(ub) else None)
+                  for lb, ub in zip(self.lower_bounds, self.upper_bounds)] + [(None, None)]*self.n_blocks
+
+        result = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds, method='highs')
+        if result.status != 0:
+            raise RuntimeError('The cutting planes master problem could not be solved: {}'.format(result.message))
+        self.multipliers = -result.ineqlin.marginals
+        return result.fun, result.x[:self.dimension]
+
+    def _solve_qp(self, center, mu):
+        if np.all(np.isinf(self.lower_bounds)) and np.all(np.isinf(self.upper_bounds)) and not len(self.A_eq):
+            return self._solve_dual_qp(center, mu)
+        return self._solve_qp_slsqp(center, mu)
+
+    def _solve_dual_qp(self, center, mu):
+        # max_{alpha} sum_j alpha_j (a_j^T center + b_j) - 1/(2 mu) alpha^T G alpha (see DualQPMasterProblem), from
+        # the previous multipliers, padded with zeros for the new cuts
+        A = self.slopes
+        gram = A.dot(A.T)
+        gram = gram.toarray() if self.cuts.sparse else gram
+        linear_term = A.dot(center) + self.offsets
+        alpha_0 = None
+        if 0 < len(self.multipliers) <= len(linear_term):
+            alpha_0 = np.concatenate([self.multipliers, np.zeros(len(linear_term) - len(self.multipliers))])
+
+        alpha = solve_simplex_qp(gram/mu, linear_term, alpha_0=alpha_0, blocks=self.cuts.blocks)
+        self.multipliers = alpha
+        value = alpha.dot(linear_term) - alpha.dot(gram.dot(alpha))/(2*mu)
+        return value, center - self.cuts.aggregate(alpha)[0]/mu
+
+    def _solve_qp_slsqp(self, center, mu):
+        A = self.slopes.toarray() if self.cuts.sparse else self.slopes
+        b = self.offsets
+        n = self.dimension
+        E = self._block_indicators()
+        E = E.toarray() if self.cuts.sparse else E
+
+        # warm start from the previous solution (or the center), with r at the value of the block models there
+        lambda_0 = self.lambda_k if self.lambda_k is not None else center
+        lambda_0 = np.clip(lambda_0, self.lower_bounds, self.upper_bounds)
+        z_0 = np.concatenate([lambda_0, self.cuts.evaluate_blocks(lambda_0)])
+
+        def objective(z):
+            return np.sum(z[n:]) + mu/2*np.sum((z[:n] - center)**2)
+
+        def gradient(z):
+            return np.concatenate([mu*(z[:n] - center), np.ones(self.n_blocks)])
+
+        # r_i - a_j^T lambda >= b_j for the cuts j of block i, and A_eq lambda = b_eq
+        constraints = [LinearConstraint(np.hstack([-A, E]), b, np.inf)]
+        if len(self.A_eq):
+            constraints.append(LinearConstraint(np.hstack([self.A_eq, np.zeros((len(self.A_eq), self.n_blocks))]),
+                                                self.b_eq, self.b_eq))
+        bounds = Bounds(np.concatenate([self.lower_bounds, np.full(self.n_blocks, -np.inf)]),
+                        np.concatenate([self.upper_bounds, np.full(self.n_blocks, np.inf)]))
+
+        result = minimize(objective, z_0, jac=gradient, method='SLSQP', bounds=bounds, constraints=constraints,
+                          options={'ftol': 1e-12, 'maxiter': 1000})
+        if not result.success:
+            raise RuntimeError('The bundle master problem could not be solved: {}'.format(result.message))
+        if getattr(result, 'multipliers', None) is not None:
+            # equality constraints come first
+            self.multipliers = np.maximum(result.multipliers[len(self.A_eq):len(self.A_eq) + len(A)], 0.0)
+        else:
+            # older scipy versions do not return the multipliers of SLSQP: spread them over the active cuts
+            r = result.x[n:][self.cuts.blocks]
+            active = A.dot(result.x[:n]) + b >= r - 1e-8*(1.0 + np.abs(r))
+            self.multipliers = active/np.bincount(self.cuts.blocks, weights=active)[self.cuts.blocks]
+        return result.fun, result.x[:n]
+
+
+class DualQPMasterProblem(MasterProblem):
+    """ Solves the proximal (bundle) master problem on a free dual domain through its dual, a QP over the unit
+    simplex in the space of cuts:
+
+        max_{alpha in simplex}  sum_j alpha_j (a_j^T lambda_hat + b_j) - 1/(2 mu) alpha^T G alpha,
+
+    where G = [a_i^T a_j] is the Gram matrix of the slopes; the minimizer is then
+    lambda = lambda_hat - 1/mu sum_j alpha_j a_j. G, and the products a_j^T lambda_hat, are updated as cuts arrive
+    (O(m n) per cut, with m cuts in the bundle) and as the center moves to the last solution (O(m^2)), so the QP
+    itself, solved by solve_simplex_qp() from the previous alpha, does not depend on the dimension n.
+
+    With multi-cut models, alpha ranges over the product of the simplices of the blocks instead.
+
+    Only the QP is supported, and only on a free dual domain (as in BundleMethod without set_dual_domain()).
+    """
+    def __init__(self, dimension, lambda_min=-np.inf, lambda_max=np.inf, sparse=False, n_blocks=1):
+        if np.isfinite(lambda_min) or np.isfinite(lambda_max):
+            raise ValueError('The dual QP master problem only supports a free dual domain.')
+        super(DualQPMasterProblem, self).__init__(dimension, lambda_min=lambda_min, lambda_max=lambda_max,
+                                                  n_blocks=n_blocks)
+        self.cuts = CutPool(dimension, sparse=sparse, n_blocks=n_blocks)
+        self._gram = np.zeros((0, 0))
+        # a_j^T center and a_j^T lambda_k, for the current center and the last solution
+        self._slopes_dot_center = np.zeros(0)
+        self._slopes_dot_solution = np.zeros(0)
+        self.center = None
+        self.mu = None
+        self.alpha = np.zeros(0)
+        self.lambda_k = None
+
+    @property
+    def n_cuts(self):
+        return len(self.cuts)
+
+    @property
+    def slopes(self):
+        return self.cuts.slopes
+
+    @property
+    def offsets(self):
+        return self.cuts.offsets
+
+    @property
+    def gram(self):
+        return self._gram[:self.n_cuts, :self.n_cuts]
+
+    def add_cut(self, a, b, block=0):
+        m = self.n_cuts
+        if m == len(self._gram):
+            # grow the storage geometrically
+            capacity = max(2*m, 8)
+            self._slopes_dot_center = np.concatenate([self._slopes_dot_center, np.zeros(capacity - m)])
+            self._slopes_dot_solution = np.concatenate([self._slopes_dot_solution, np.zeros(capacity - m)])
+            gram = np.zeros((capacity, capacity))
+            gram[:m, :m] = self._gram[:m, :m]
+            self._gram = gram
+        self.cuts.add_cut(a, b, block=block)
+        a = a.toarray().ravel() if sp is not None and sp.issparse(a) else np.asarray(a, dtype=float)
+        products = self.cuts.slopes.dot(a)
+        self._gram[m, :m+1] = products
+        self._gram[:m+1, m] = products
+        if self.center is not None:
+            self._slopes_dot_center[m] = a.dot(self.center)
+            self._slopes_dot_solution[m] = a.dot(self.lambda_k)
+        self.alpha = np.append(self.alpha, 0.0)
+
+    def remove_cuts(self, indices):
+        keep = np.setdiff1d(np.arange(self.n_cuts), indices)
+        k = len(keep)
+        self.cuts.remove(indices)
+        self._gram[:k, :k] = self._gram[np.ix_(keep, keep)]
+        self._slopes_dot_center[:k] = self._slopes_dot_center[keep]
+        self._slopes_dot_solution[:k] = self._slopes_dot_solution[keep]
+        self.alpha = self.alpha[keep]
+        self.multipliers = self.alpha
+
+    def add_lower_bounds(self, lower_bounds):
+        raise ValueError('The dual QP master problem only supports a free dual domain.')
+
+    def add_equality_constraints(self, A_eq, b_eq):
+        raise ValueError('The dual QP master problem only supports a free dual domain.')
+
+    def solve(self, center=None, mu=0.0):
+        if center is None or mu <= 0:
+            raise ValueError('The dual QP master problem only solves the proximal master problem (mu > 0).')
+        m = self.n_cuts
+        mu = float(mu)
+        if self.center is not None and center is self.lambda_k:
+            # the center moved to the last solution
+            self._slopes_dot_center[:m] = self._slopes_dot_solution[:m]
+        elif self.center is None or not np.array_equal(center, self.center):
+            self._slopes_dot_center[:m] = self.slopes.dot(center)
+        self.center = np.array(center, dtype=float)
+        self.mu = mu
+
+        linear_term = self._slopes_dot_center[:m] + self.offsets
+        self.alpha = solve_simplex_qp(self.gram/mu, linear_term, alpha_0=self.alpha, blocks=self.cuts.blocks)
+        self.lambda_k = self.center - self.cuts.aggregate(self.alpha)[0]/mu
+        # lambda_k = center - 1/mu A^T alpha
+        self._slopes_dot_solution[:m] = self._slopes_dot_center[:m] - self.gram.dot(self.alpha)/mu
+        self.multipliers = self.alpha
+        value = self.alpha.dot(linear_term) - self.alpha.dot(self.gram.dot(self.alpha))/(2*mu)
+        return value, self.lambda_k
+
+
+def solve_simplex_qp(Q, c, alpha_0=None, blocks=None, tolerance=1e-10, max_iterations=None):
+    """ Solves  max_{alpha in unit simplex}  c^T alpha - 1/2 alpha^T Q alpha,  for Q positive semidefinite, with a
+    primal active set method started from alpha_0 (a point of the simplex, e.g., the solution of a previous problem
+    differing by a few cuts). If the block of each entry of alpha is given in blocks, alpha is instead constrained to
+    the product of the unit simplices of the blocks (the entries of each block sum to one).
+
+    Q is typically singular (cuts can be repeated, or outnumber the dimension): on faces where the objective is
+    unbounded, the method moves along a direction of increase until a component of alpha reaches zero. """
+    m = len(c)
+    if m == 0:
+        raise ValueError('The bundle is empty.')
+    blocks = np.zeros(m, dtype=int) if blocks is None else np.asarray(blocks, dtype=int)
+    n_blocks = np.max(blocks) + 1
+    if len(np.unique(blocks)) != n_blocks:
+        raise ValueError('Every block needs at least one cut.')
+    scale = 1.0 + np.max(np.abs(c)) + np.max(np.abs(np.diag(Q)))
+    tolerance = tolerance*scale
+    if max_iterations is None:
+        max_iterations = 10*m + 100
+
+    alpha = np.zeros(m) if alpha_0 is None else np.maximum(alpha_0, 0.0)
+    block_sums = np.bincount(blocks, weights=alpha, minlength=n_blocks)
+    for block in np.flatnonzero(block_sums <= 0):
+        # start from the best vertex of the simplex of the block
+        in_block = np.flatnonzero(blocks == block)
+        alpha[in_block[np.argmax(c[in_block] - np.diag(Q)[in_block]/2)]] = 1.0
+    alpha /= np.bincount(blocks, weights=alpha, minlength=n_blocks)[blocks]
+    active = alpha > 0
+
+    for iteration in range(max_iterations):
+        S = np.flatnonzero(active)
+        # maximizer on the face {alpha_i = 0, i not in S}: Q_SS beta + E^T nu = c_S, E beta = 1, where the rows of E
+        # are the indicators of the blocks
+        kkt = np.zeros((len(S) + n_blocks, len(S) + n_blocks))
+        kkt[:len(S), :len(S)] = Q[np.ix_(S, S)]
+        kkt[np.arange(len(S)), len(S) + blocks[S]] = 1.0
+        kkt[len(S) + blocks[S], np.arange(len(S))] = 1.0
+        rhs = np.concatenate([c[S], np.ones(n_blocks)])
+        solution = np.linalg.lstsq(kkt, rhs, rcond=1e-12)[0]
+        residual = rhs - kkt.dot(solution)
+
+        if np.linalg.norm(residual) > tolerance:
+            # no maximizer on the face: the residual is a direction d of the face (Q_SS d = 0, E d = 0) along which
+            # the objective increases linearly; follow it until the first component of alpha reaches zero
+            direction = residual[:len(S)]
+            blocking = direction < 0
+            steps = alpha[S][blocking]/(-direction[blocking])
+            t = np.min(steps)
+            alpha[S] += t*direction
+        else:
+            beta, nu = solution[:len(S)], solution[len(S):]
+            if np.all(beta > 0):
+                alpha = np.zeros(m)
+                alpha[S] = beta
+                # optimal if no cut outside S improves the objective: c_j - (Q alpha)_j <= nu_i, for j in block i
+                gradient = c - Q.dot(alpha) - nu[blocks]
+                gradient[S] = -np.inf
+                j = np.argmax(gradient)
+                if gradient[j] <= tolerance:
+                    return alpha
+                active[j] = True
+                continue
+            # move towards beta until the first component of alpha reaches zero
+            blocking = beta <= 0
+            steps = alpha[S][blocking]/(alpha[S][blocking] - beta[blocking])
+            t = np.min(steps)
+            alpha[S] += t*(beta - alpha[S])
+        dropped = S[blocking][steps <= t]
+        alpha[dropped] = 0.0
+        active[dropped] = False
+        alpha = np.maximum(alpha, 0.0)
+
+    raise RuntimeError('The dual QP master problem did not converge in {} iterations.'.format(max_iterations))
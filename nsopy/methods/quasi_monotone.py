@@ -1,10 +1,8 @@
 from __future__ import division
 import numpy as np
-import copy
 
 from nsopy.methods.base import SolutionMethod
 from nsopy.observer_pattern import Observable
-from nsopy.utils import invert_oracle_sense
 
 METHOD_QUASI_MONOTONE_DEFAULT_GAMMA = 1.0
 LARGE_VAL = 10000
@@ -21,12 +19,7 @@ class SGMDoubleSimpleAveraging(SolutionMethod, Observable):
 
         self.desc = 'DSA, $\gamma = {}$'.format(gamma)
         self.oracle = oracle
-        if sense == 'min':
-            self.oracle = invert_oracle_sense(oracle)  # all methods have been coded to maximize the oracle model
-        elif sense == 'max':
-            self.oracle = oracle
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self._set_sense(sense)  # the method maximizes sense_sign*d
         self.projection_function = projection_function
 
         self.oracle_calls = 0
@@ -51,17 +44,22 @@ class SGMDoubleSimpleAveraging(SolutionMethod, Observable):
         self.method_name = 'DSA'
         self.parameter = gamma
 
-    def dual_step(self):
-        self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-        self.oracle_calls += 1
+    def _dual_step(self):
+        [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+        self._count_oracle_calls(1)
         self.notify_observers()  # placed here to avoid mismatch between lambda_k and d_k
 
         self.s_k += self.diff_d_k
-        lambda_k_plus = float(1.0)/float(self.gamma*np.sqrt(self.iteration_number+1)) * self.s_k
-        lambda_k_plus = self.projection_function(lambda_k_plus)
+        lambda_k_plus = self._work_array('lambda_k_plus')
+        np.multiply(self.s_k, self.sense_sign/float(self.gamma*np.sqrt(self.iteration_number+1)), out=lambda_k_plus)
+        self._project(lambda_k_plus, out=lambda_k_plus)
 
-        self.lambda_k = float(self.iteration_number+1)/float(self.iteration_number+2)*self.lambda_k \
-                        + float(1.0)/float(self.iteration_number+2)*lambda_k_plus
+        # lambda_k = (t+1)/(t+2)*lambda_k + 1/(t+2)*lambda_k_plus, in place
+        lambda_k = self._work_array('lambda_k', self.lambda_k)
+        lambda_k *= float(self.iteration_number+1)/float(self.iteration_number+2)
+        lambda_k_plus *= float(1.0)/float(self.iteration_number+2)
+        lambda_k += lambda_k_plus
+        self.lambda_k = lambda_k
 
         self.iteration_number += 1
         # self.notify_observers()
@@ -102,9 +100,9 @@ class SGMDoubleSimpleAveragingEntropy(SolutionMethod, Observable):
         self.method_name = 'DSA-Entropy'
         self.parameter = gamma
 
-    def dual_step(self):
-        self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-        self.oracle_calls += 1
+    def _dual_step(self):
+        [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+        self._count_oracle_calls(1)
         self.notify_observers()  # placed here to avoid mismatch between lambda_k and d_k
 
         self.s_k += self.diff_d_k
@@ -127,12 +125,8 @@ class SGMTripleAveraging(SolutionMethod, Observable):
 
         self.desc = 'TA, $\gamma = {}$'.format(gamma)
 
-        if sense == 'min':
-            self.oracle = invert_oracle_sense(oracle)  # all methods have been coded to maximize the oracle model
-        elif sense == 'max':
-            self.oracle = oracle
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self.oracle = oracle
+        self._set_sense(sense)  # the method maximizes sense_sign*d
         self.projection_function = projection_function
 
         self.oracle_calls = 0
@@ -148,7 +142,7 @@ class SGMTripleAveraging(SolutionMethod, Observable):
             self.dimension = dimension
             self.lambda_k = self.projection_function(np.zeros(self.dimension, dtype=float))
 
-        self.lambda_0 = copy.deepcopy(self.lambda_k)
+        self.lambda_0 = np.array(self.lambda_k, dtype=float)
         self.x_k = 0
 
         self.s_k = np.zeros(self.dimension, dtype=float)  # this stores \sum_{k=0}^t diff_d_k
@@ -157,9 +151,9 @@ class SGMTripleAveraging(SolutionMethod, Observable):
         self.method_name = 'TA'
         self.parameter = gamma
 
-    def dual_step(self):
-        self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-        self.oracle_calls += 1
+    def _dual_step(self):
+        [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+        self._count_oracle_calls(1)
         self.notify_observers()
 
         # step 1
@@ -174,7 +168,9 @@ class SGMTripleAveraging(SolutionMethod, Observable):
         elif self.variant == 2:
             self.desc = 'TA 2, $\gamma = {}$'.format(self.gamma)
             self.method_name = 'TA 2'
-            self.s_k += (self.iteration_number+1)*self.diff_d_k
+            weighted_diff_d_k = self._work_array('weighted_diff_d_k')
+            np.multiply(self.diff_d_k, self.iteration_number+1, out=weighted_diff_d_k)
+            self.s_k += weighted_diff_d_k
             # OLD Version: verbatim as in Paper
             # gamma_t = (self.iteration_number+1)**(float(3.0)/float(2.0))
             # gamma_t_plus_1 = (self.iteration_number+2)**(float(3.0)/float(2.0))
@@ -187,15 +183,23 @@ class SGMTripleAveraging(SolutionMethod, Observable):
             raise ValueError('Supported variants are 1: a_t = 1, gamma_t = gamma*sqrt(t+1) and '
                              '2: a_t = t, gamma_t = t^(3/2).')
 
-        lambda_k_plus = float(1.0)/float(gamma_t) * self.s_k
-        lambda_k_plus = self.projection_function(lambda_k_plus)
+        lambda_k_plus = self._work_array('lambda_k_plus')
+        np.multiply(self.s_k, self.sense_sign/float(gamma_t), out=lambda_k_plus)
+        self._project(lambda_k_plus, out=lambda_k_plus)
 
         # step 2
-        lambda_k_hat = float(gamma_t)/float(gamma_t_plus_1) * lambda_k_plus \
-                       + (1 - float(gamma_t)/float(gamma_t_plus_1))* self.lambda_0
-
+        # lambda_k_hat = gamma_t/gamma_t_plus_1*lambda_k_plus + (1 - gamma_t/gamma_t_plus_1)*lambda_0, in place
+        lambda_k_hat = lambda_k_plus
+        lambda_k_hat -= self.lambda_0
+        lambda_k_hat *= float(gamma_t)/float(gamma_t_plus_1)
+        lambda_k_hat += self.lambda_0
 
         # step 4
-        self.lambda_k = (1-tau_t)*self.lambda_k + tau_t*lambda_k_hat
+        # lambda_k = (1-tau_t)*lambda_k + tau_t*lambda_k_hat, in place
+        lambda_k = self._work_array('lambda_k', self.lambda_k)
+        lambda_k_hat -= lambda_k
+        lambda_k_hat *= tau_t
+        lambda_k += lambda_k_hat
+        self.lambda_k = lambda_k
 
         self.iteration_number += 1
@@ -2,7 +2,20 @@ import numpy as np
 
 from nsopy.methods.base import SolutionMethod
 from nsopy.observer_pattern import Observable
-from nsopy.utils import invert_oracle_sense
+from nsopy.oracles import SeparableOracle, last_call_flags
+
+STEPSIZE_RULES = ['1/k', 'constant', '1/sqrt(k)']
+
+
+def subgradient_stepsize(stepsize_rule, stepsize_0, iteration_number):
+    """ Stepsize of the subgradient method at iteration_number (starting from 1). """
+    if stepsize_rule == '1/k':
+        return stepsize_0 / iteration_number
+    elif stepsize_rule == 'constant':
+        return stepsize_0
+    elif stepsize_rule == '1/sqrt(k)':
+        return stepsize_0 / np.sqrt(iteration_number)
+    raise ValueError("stepsize_rule has to be either '1/k', 'constant' ot '1/sqrt(k)'")
 
 
 class SubgradientMethod(SolutionMethod, Observable):
@@ -12,17 +25,13 @@ class SubgradientMethod(SolutionMethod, Observable):
 
         self.desc = 'SG, $s_0 = {}$'.format(stepsize_0)
 
-        if sense == 'min':
-            self.oracle = invert_oracle_sense(oracle)  # all methods have been coded to maximize the oracle model
-        elif sense == 'max':
-            self.oracle = oracle
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self.oracle = oracle
+        self._set_sense(sense)  # the method maximizes sense_sign*d
 
         self.projection_function = projection_function
 
         self.stepsize_0 = float(stepsize_0)  # ensures it's float, for division
-        assert stepsize_rule in ['1/k', 'constant', '1/sqrt(k)'], "stepsize_rule has to be either '1/k', 'constant' ot '1/sqrt(k)'"
+        assert stepsize_rule in STEPSIZE_RULES, "stepsize_rule has to be either '1/k', 'constant' ot '1/sqrt(k)'"
         self.stepsize_rule = stepsize_rule
         if self.stepsize_rule == '1/k':
             self.desc = 'SG 1/k, $s_0 = {}$'.format(self.stepsize_0)
@@ -30,7 +39,7 @@ class SubgradientMethod(SolutionMethod, Observable):
         elif self.stepsize_rule == 'constant':
             self.desc = 'SG const,  $s_0 = {}$'.format(self.stepsize_0)
             self.method_name = 'SG const'
-        elif self.step() == '1/sqrt(k)':
+        elif self.stepsize_rule == '1/sqrt(k)':
             self.desc = 'SG 1/sqrt(k),  $s_0 = {}$'.format(self.stepsize_0)
 
         self.iteration_number = 1
@@ -49,26 +58,249 @@ class SubgradientMethod(SolutionMethod, Observable):
         self.method_name = 'SG'
         self.parameter = stepsize_0
 
-    def dual_step(self):
+    def _dual_step(self):
         # get subgradient
-        self.x_k, self.d_k, diff_d_k = self.oracle(self.lambda_k)
+        [(self.x_k, self.d_k, diff_d_k)] = yield [self.lambda_k]
         # log signal to any observers connected
         self.notify_observers()
 
         # print(diff_d_k)
-        self.oracle_calls += 1
+        self._count_oracle_calls(1)
 
-        if self.stepsize_rule == '1/k':
-            stepsize = self.stepsize_0 / self.iteration_number
-        elif self.stepsize_rule == 'constant':
-            stepsize = self.stepsize_0
-        elif self.step() == '1/sqrt(k)':
-            stepsize = self.stepsize_0 / np.sqrt(self.iteration_number)
+        stepsize = subgradient_stepsize(self.stepsize_rule, self.stepsize_0, self.iteration_number)
 
         # perform dual step
-        # lambda_kp1 = P_{lambda>=0} (lambda_k + stepsize*diff_d_k)
-        # self.lambda_k += stepsize * diff_d_k  # this doesnt work anymore with the new version of numpy.
-        self.lambda_k = self.lambda_k + stepsize * diff_d_k
-        self.lambda_k = self.projection_function(self.lambda_k)
+        # lambda_kp1 = P_{lambda>=0} (lambda_k + sense_sign*stepsize*diff_d_k), in place
+        lambda_k = self._work_array('lambda_k', self.lambda_k)
+        self.lambda_k = self._projected_step(lambda_k, self.sense_sign*stepsize, diff_d_k, out=lambda_k)
+
+        self.iteration_number += 1
+
+
+BLOCK_SAMPLING_RULES = ['uniform', 'importance', 'cyclic']
+
+
+class IncrementalSubgradientMethod(SolutionMethod, Observable):
+    """ Incremental (stochastic block) subgradient method, for separable dual functions d(lambda) = sum_i d_i(lambda)
+    (see nsopy.oracles.SeparableOracle).
+
+    At each iteration, only batch_size of the n_blocks blocks are evaluated, and the step is taken along an estimate of
+    diff_d_k built from them. Blocks are sampled according to sampling:
+    - 'uniform': batch_size distinct blocks, uniformly at random; the estimate is n_blocks/batch_size times their sum
+    - 'importance': batch_size blocks, drawn (with replacement) with probabilities p_i proportional to block_weights
+      (e.g., the cost of the blocks, or bounds on the norm of their subgradients); the estimate averages d_i / p_i
+    - 'cyclic': the blocks are visited in order, batch_size at a time, and scaled as in 'uniform'
+    The 'uniform' and 'importance' estimates are unbiased; d_k is estimated in the same way.
+
+    x_k concatenates the last x_i of every block, kept in block_x (so blocks not sampled at this iteration contribute
+    their x_i at an earlier iterate); it is None until every block has been evaluated.
+
+    oracle_calls counts the block evaluations as fractions of a full oracle call; block_calls counts them. The oracle
+    observers (see register_oracle_observer()) are only notified of the queries of all the blocks, whose results are
+    exact (see exact_oracle_results).
+    """
+    def __init__(self, separable_oracle, projection_function, dimension=0, stepsize_rule='1/k', stepsize_0=1.0,
+                 batch_size=1, sampling='uniform', block_weights=None, seed=None, sense='min'):
+        super(IncrementalSubgradientMethod, self).__init__()
+
+        self.oracle = separable_oracle
+        self.n_blocks = separable_oracle.n_blocks
+        self._set_sense(sense)  # the method maximizes sense_sign*d
+        self.projection_function = projection_function
+
+        self.stepsize_0 = float(stepsize_0)
+        assert stepsize_rule in STEPSIZE_RULES, "stepsize_rule has to be either '1/k', 'constant' ot '1/sqrt(k)'"
+        self.stepsize_rule = stepsize_rule
+
+        if not 1 <= batch_size <= self.n_blocks:
+            raise ValueError('batch_size should be between 1 and the number of blocks')
+        self.batch_size = batch_size
+        if sampling not in BLOCK_SAMPLING_RULES:
+            raise ValueError("sampling has to be either 'uniform', 'importance' or 'cyclic'")
+        self.sampling = sampling
+        if sampling == 'importance':
+            if block_weights is None or len(block_weights) != self.n_blocks or np.any(np.asarray(block_weights) <= 0):
+                raise ValueError("'importance' sampling needs n_blocks positive block_weights")
+            self.block_probabilities = np.asarray(block_weights, dtype=float) / np.sum(block_weights)
+        else:
+            self.block_probabilities = np.ones(self.n_blocks) / self.n_blocks
+        self.random_state = np.random.RandomState(seed)
+        # 'importance' sampling draws with replacement, so it need not query every block even with batch_size=n_blocks
+        self.exact_oracle_results = batch_size == self.n_blocks and sampling != 'importance'
+
+        self.iteration_number = 1
+        self.oracle_calls = 0
+        self.block_calls = 0
+
+        self.d_k = np.zeros(1, dtype=float)
+        if dimension == 0:
+            self.lambda_k = self.projection_function(0)
+            self.dimension = len(self.lambda_k)
+        else:
+            self.dimension = dimension
+            self.lambda_k = self.projection_function(np.zeros(self.dimension, dtype=float))
+        self.x_k = None
+        self.block_x = [None] * self.n_blocks
+        self.diff_d_k = np.zeros(self.dimension, dtype=float)
+        self.sampled_blocks = []
+        self._query_blocks = np.arange(self.n_blocks)
+
+        self.desc = 'ISG {}, $s_0 = {}$, $b = {}$'.format(sampling, self.stepsize_0, batch_size)
+        # for record keeping
+        self.method_name = 'ISG'
+        self.parameter = stepsize_0
+
+    def _dual_step(self):
+        blocks = self._sample_blocks()
+        # lambda_k is queried on the sampled blocks only (see _evaluate_oracle)
+        self._query_blocks = np.unique(blocks)
+        [block_results] = yield [self.lambda_k]
+        self._incremental_step(blocks, block_results)
+
+    def _evaluate_oracle(self, points):
+        results = []
+        for lambda_k in points:
+            results.append(self.oracle.evaluate_blocks(lambda_k, blocks=self._query_blocks))
+            self._record_block_query()
+        return results
+
+    async def _evaluate_oracle_async(self, lambda_k):
+        block_results = await self.oracle.evaluate_blocks_async(lambda_k, blocks=self._query_blocks)
+        self._record_block_query()
+        return block_results
+
+    def _record_block_query(self):
+        # as _record_oracle_call(), counting the query as a fraction of a full oracle call
+        cached, inexact = last_call_flags(self.oracle)
+        fraction = len(self._query_blocks) / self.n_blocks
+        self._pending_cached_oracle_calls += fraction * cached
+        self._pending_inexact_oracle_calls += fraction * inexact
+
+    def _notify_oracle_observers(self, points, results):
+        if len(self._query_blocks) == self.n_blocks:
+            super(IncrementalSubgradientMethod, self)._notify_oracle_observers(
+                points, [SeparableOracle.aggregate(block_results) for block_results in results])
+
+    def _sample_blocks(self):
+        if self.sampling == 'uniform':
+            return self.random_state.choice(self.n_blocks, size=self.batch_size, replace=False)
+        elif self.sampling == 'importance':
+            return self.random_state.choice(self.n_blocks, size=self.batch_size, p=self.block_probabilities)
+        else:
+            start = (self.iteration_number - 1) * self.batch_size
+            return np.arange(start, start + self.batch_size) % self.n_blocks
+
+    def _incremental_step(self, blocks, unique_block_results):
+        results = dict(zip(np.unique(blocks), unique_block_results))
+
+        # estimates of d_k and diff_d_k; repeated blocks (importance sampling) are counted with their multiplicity
+        weights = 1.0 / (self.batch_size * self.block_probabilities[blocks])
+        d_k = 0
+        diff_d_k = self._work_array('diff_d_k')
+        diff_d_k.fill(0.0)
+        weighted_diff_d_i = self._work_array('weighted_diff_d_i')
+        for block, weight in zip(blocks, weights):
+            _, d_i, diff_d_i = results[block]
+            d_k += weight * d_i
+            np.multiply(diff_d_i, weight, out=weighted_diff_d_i)
+            diff_d_k += weighted_diff_d_i
+
+        self.sampled_blocks = blocks
+        self._update_x_k(results)
+        self.d_k = d_k
+        self.diff_d_k = diff_d_k
+        # log signal to any observers connected
+        self.notify_observers()
+
+        self.block_calls += len(results)
+        self._count_oracle_calls(len(results) / self.n_blocks)
+
+        stepsize = subgradient_stepsize(self.stepsize_rule, self.stepsize_0, self.iteration_number)
+        lambda_k = self._work_array('lambda_k', self.lambda_k)
+        self.lambda_k = self._projected_step(lambda_k, self.sense_sign*stepsize, self.diff_d_k, out=lambda_k)
+
+        self.iteration_number += 1
+
+    def _update_x_k(self, results):
+        # results: block -> (x_i, d_i, diff_d_i)
+        for block, (x_i, _, _) in results.items():
+            self.block_x[block] = x_i
+        if all(x_i is not None for x_i in self.block_x):
+            self.x_k = np.concatenate([np.atleast_1d(x_i) for x_i in self.block_x])
+
+
+class AggregatedIncrementalSubgradientMethod(IncrementalSubgradientMethod):
+    """ Aggregated incremental subgradient method (SAG-style), for separable dual functions.
+
+    The method keeps a table with the last value and subgradient of every block: all blocks are evaluated at the first
+    iteration, and then only batch_size blocks per iteration, sampled as in IncrementalSubgradientMethod. The step is
+    taken along the sum of the table, which is kept as a running sum, so each iteration costs O(batch_size) block
+    evaluations and updates. d_k and diff_d_k are the (aggregated) values of the table, and x_k concatenates its x_i
+    (see IncrementalSubgradientMethod).
+
+    By default, the subgradients are stored in a dense (n_blocks, dimension) array. When blocks only depend on a few
+    multipliers, block_support can list, for each block, the indices of the entries of lambda its subgradients can be
+    nonzero on; the table then only stores those entries, in a flat array (in CSR layout, see block_table_indptr and
+    block_table_indices).
+    """
+    def __init__(self, separable_oracle, projection_function, dimension=0, stepsize_rule='1/k', stepsize_0=1.0,
+                 batch_size=1, sampling='uniform', block_weights=None, block_support=None, seed=None, sense='min'):
+        super(AggregatedIncrementalSubgradientMethod, self).__init__(separable_oracle, projection_function,
+                                                                     dimension=dimension, stepsize_rule=stepsize_rule,
+                                                                     stepsize_0=stepsize_0, batch_size=batch_size,
+                                                                     sampling=sampling, block_weights=block_weights,
+                                                                     seed=seed, sense=sense)
+        self.block_values = np.zeros(self.n_blocks, dtype=float)
+        if block_support is None:
+            self.block_table_indptr = None
+            self.block_table_indices = None
+            self.block_subgradients = np.zeros((self.n_blocks, self.dimension), dtype=float)
+        else:
+            if len(block_support) != self.n_blocks:
+                raise ValueError('block_support should list the support of each of the n_blocks blocks')
+            supports = [np.asarray(support, dtype=int) for support in block_support]
+            self.block_table_indptr = np.concatenate([[0], np.cumsum([len(support) for support in supports])])
+            self.block_table_indices = np.concatenate(supports) if supports else np.zeros(0, dtype=int)
+            self.block_subgradients = np.zeros(len(self.block_table_indices), dtype=float)
+        self._sum_d = 0.0
+        self._sum_diff_d = np.zeros(self.dimension, dtype=float)
+
+        self.desc = 'SAG {}, $s_0 = {}$, $b = {}$'.format(sampling, self.stepsize_0, batch_size)
+        # for record keeping
+        self.method_name = 'SAG'
+
+    def _sample_blocks(self):
+        if self.iteration_number == 1:
+            return np.arange(self.n_blocks)
+        return super(AggregatedIncrementalSubgradientMethod, self)._sample_blocks()
+
+    def _incremental_step(self, blocks, unique_block_results):
+        blocks = np.unique(blocks)
+        for block, (_, d_i, diff_d_i) in zip(blocks, unique_block_results):
+            self._sum_d += d_i - self.block_values[block]
+            self.block_values[block] = d_i
+            if self.block_table_indptr is None:
+                self._sum_diff_d += diff_d_i - self.block_subgradients[block]
+                self.block_subgradients[block] = diff_d_i
+            else:
+                entries = slice(self.block_table_indptr[block], self.block_table_indptr[block+1])
+                indices = self.block_table_indices[entries]
+                diff_d_i = np.asarray(diff_d_i)[indices]
+                np.add.at(self._sum_diff_d, indices, diff_d_i - self.block_subgradients[entries])
+                self.block_subgradients[entries] = diff_d_i
+
+        self.sampled_blocks = blocks
+        self._update_x_k(dict(zip(blocks, unique_block_results)))
+        self.d_k = self._sum_d
+        self.diff_d_k = self._work_array('diff_d_k', self._sum_diff_d)
+        # log signal to any observers connected
+        self.notify_observers()
+
+        self.block_calls += len(blocks)
+        self._count_oracle_calls(len(blocks) / self.n_blocks)
+
+        stepsize = subgradient_stepsize(self.stepsize_rule, self.stepsize_0, self.iteration_number)
+        lambda_k = self._work_array('lambda_k', self.lambda_k)
+        self.lambda_k = self._projected_step(lambda_k, self.sense_sign*stepsize, self.diff_d_k, out=lambda_k)
 
         self.iteration_number += 1
@@ -1,21 +1,24 @@
 import numpy as np
-import copy
 
 from nsopy.methods.base import SolutionMethod
 from nsopy.observer_pattern import Observable
-from nsopy.utils import invert_oracle_sense
 
 UGM_DEFAULT_EPSILON = 1.0
 UGM_DEFAULT_L_0 = 1.1
 
 
-def _bregman_map(M, lambda_k, diff_d_k):
-    """ Bregman map, according to [1], Eq. 2.9, with f(x) := -d(lambda), and M*psi(x,y) := M/2*||lambda-lambda_k||_2
-    Old:
-    lambda_bregman = lambda_k + float(1.0)/M*diff_d_k
-    return self._project_on_dual_feasible_set(lambda_bregman)
-    """
-    return lambda_k + float(1.0)/M*diff_d_k
+def _convex_combination(tau, lambda_1, lambda_2, out):
+    """ tau*lambda_1 + (1-tau)*lambda_2, written into out. """
+    np.subtract(lambda_1, lambda_2, out=out)
+    out *= tau
+    out += lambda_2
+    return out
+
+
+def _squared_distance(lambda_1, lambda_2, difference):
+    """ ||lambda_1 - lambda_2||_2^2, with lambda_1 - lambda_2 written into difference. """
+    np.subtract(lambda_1, lambda_2, out=difference)
+    return np.dot(difference, difference)
 
 
 class UniversalPGM(SolutionMethod, Observable):
@@ -27,7 +30,8 @@ class UniversalPGM(SolutionMethod, Observable):
     [1] Universal Gradient Methods for Convex Optimization Problems, Yu. Nesterov, CORE Discussion Paper, 2013.
     Note: zeta(x,y) = ||y-x||^2_2 is used as the prox function, throughout.
     """
-    def __init__(self, oracle, projection_function, dimension=0, epsilon=UGM_DEFAULT_EPSILON, averaging=False, sense='min'):
+    def __init__(self, oracle, projection_function, dimension=0, epsilon=UGM_DEFAULT_EPSILON, averaging=False, sense='min',
+                 speculative_trials=1, oracle_executor=None):
         """
         Averaging: Nesterov's nsopy give guarantees on variables marked with a tilde. Those are supposed to be the
         actual outputs of the method, but they require extra computations (evaluation of d(lambda_tilde)), and these can
@@ -41,16 +45,19 @@ class UniversalPGM(SolutionMethod, Observable):
         TL;DR: both options deliver valid iterates, but only the iterates produced with averaging=True are endowed with
         his theoretical properties; on the other hand, they require extra computations (one extra oracle calls per
         iteration).
+
+        Speculative backtracking: the search for the smallest i_k in Step 1 normally queries the oracle at one test
+        point at a time. With speculative_trials=m > 1, the test points of m consecutive values of i_k are queried at
+        once (with the batched oracle if available, otherwise concurrently on oracle_executor, if given), and the
+        smallest i_k satisfying the condition is retained. Iterates are the same as in the sequential search, at the
+        price of some wasted oracle calls (counted in oracle_calls), but each backtracking round costs one round of
+        oracle time. The same options are available in UniversalDGM and UniversalFGM.
         """
         super(UniversalPGM, self).__init__()
 
         self.desc = 'UPGM, $\epsilon = {}$'.format(epsilon)
-        if sense == 'min':
-            self.oracle = oracle
-        elif sense == 'max':
-            self.oracle = invert_oracle_sense(oracle)
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self.oracle = oracle
+        self._set_sense(sense)  # the method maximizes sense_sign*d
         self.projection_function = projection_function
 
         self.iteration_number = 1
@@ -70,13 +77,17 @@ class UniversalPGM(SolutionMethod, Observable):
         self.L_k = float(UGM_DEFAULT_L_0)  # if you use something else, make sure it's a float!
         self.epsilon = float(epsilon)
         self.i_k = 0
+        if speculative_trials < 1:
+            raise ValueError('speculative_trials should be a positive integer')
+        self.speculative_trials = int(speculative_trials)
+        self.oracle_executor = oracle_executor
 
         # -- Averaging -- Synthesize averaged outputs
         # Variables to synthesize solution from algorithm's process
         # records of d_tilda_k and lambda_tilda_k ("averages") according to Eqns. below 2.17
         self.S_k = float(1)/float(self.L_k)
-        self.lambda_tilde_k = copy.deepcopy(self.lambda_hat_k)
-        self.sum_lambda_tilde_k = copy.deepcopy(self.lambda_hat_k)  # \sum_i=0^k lambda_tilda_k
+        self.lambda_tilde_k = self._work_array('lambda_tilde_k', self.lambda_hat_k)
+        self.sum_lambda_tilde_k = self._work_array('sum_lambda_tilde_k', self.lambda_hat_k)  # \sum_i=0^k lambda_tilda_k
         self.d_tilde_k = 0
         self.sum_d_tilde_k = 0
 
@@ -97,10 +108,12 @@ class UniversalPGM(SolutionMethod, Observable):
         self.method_name = 'UPGM'
         self.parameter = epsilon
 
-    def _bregman_map(self, M, lambda_k, subgrad_lambda_k):
-        return self.projection_function(_bregman_map(M, lambda_k, subgrad_lambda_k))
+    def _bregman_map(self, M, lambda_k, subgrad_lambda_k, out):
+        """ Bregman map, according to [1], Eq. 2.9, with f(x) := -d(lambda), and M*psi(x,y) := M/2*||lambda-lambda_k||_2,
+        written into out. """
+        return self._projected_step(lambda_k, self.sense_sign/M, subgrad_lambda_k, out)
 
-    def dual_step(self):
+    def _dual_step(self):
         ###############
         # Preparation #
         ###############
@@ -109,8 +122,8 @@ class UniversalPGM(SolutionMethod, Observable):
         # for lambda_0; the algorithm assumes that these quantities are known for each iterate (including 0-th)
         # if not self.diff_d_k:
         if self.iteration_number == 1:
-            self.x_hat_k, self.d_hat_k, self.diff_d_hat_k = self.oracle(self.lambda_hat_k)
-            self.oracle_calls += 1
+            [(self.x_hat_k, self.d_hat_k, self.diff_d_hat_k)] = yield [self.lambda_hat_k]
+            self._count_oracle_calls(1)
             self.lambda_k = self.lambda_hat_k
             self.d_k = self.d_hat_k
             self.diff_d_k = self.diff_d_hat_k
@@ -122,20 +135,25 @@ class UniversalPGM(SolutionMethod, Observable):
 
         i_k = 0
         smallest_i_k_found = 0
+        difference = self._work_array('difference')
 
         while not smallest_i_k_found:
-            # find next test point
-            lambda_k_plus = self._bregman_map(2 ** i_k * self.L_k, self.lambda_hat_k, self.diff_d_hat_k)
-            # query oracle at test point
-            x_k_plus, d_k_plus, diff_d_k_plus, = self.oracle(lambda_k_plus)
-            self.oracle_calls += 1
-
-            # check condition given in the inequality of Step 1.
-            if (-d_k_plus <= -self.d_hat_k
-                             + np.dot(-self.diff_d_hat_k, lambda_k_plus - self.lambda_hat_k)
-                             + 2**(i_k-1)*self.L_k*(np.linalg.norm(lambda_k_plus-self.lambda_hat_k, 2)**2)
-                             + 0.5*self.epsilon):
-                smallest_i_k_found = 1
+            # find next test points (more than one in speculative mode, for consecutive values of i_k)
+            trial_i_ks = range(i_k, i_k + self.speculative_trials)
+            trial_buffer = self._work_array('trial_lambdas', shape=(self.speculative_trials, self.dimension))
+            trial_lambdas = [self._bregman_map(2 ** i * self.L_k, self.lambda_hat_k, self.diff_d_hat_k, out=trial_lambda)
+                             for i, trial_lambda in zip(trial_i_ks, trial_buffer)]
+            # query oracle at test points
+            trial_results = yield trial_lambdas
+            self._count_oracle_calls(len(trial_results))
+
+            for i_k, lambda_k_plus, (x_k_plus, d_k_plus, diff_d_k_plus) in zip(trial_i_ks, trial_lambdas, trial_results):
+                # check condition given in the inequality of Step 1.
+                squared_distance = _squared_distance(lambda_k_plus, self.lambda_hat_k, difference)
+                if (self.sense_sign*(self.d_hat_k + np.dot(self.diff_d_hat_k, difference) - d_k_plus)
+                        <= 2**(i_k-1)*self.L_k*squared_distance + 0.5*self.epsilon):
+                    smallest_i_k_found = 1
+                    break
             else:
                 i_k += 1
 
@@ -146,10 +164,11 @@ class UniversalPGM(SolutionMethod, Observable):
         self.iteration_number += 1
         self.L_k = 2**(i_k-1)*self.L_k
 
-        # -- Averaging -- Synthesize outputs
+        # -- Averaging -- Synthesize outputs (in place)
         self.S_k += float(1)/float(self.L_k)
-        self.sum_lambda_tilde_k += float(1) / float(self.L_k) * self.lambda_hat_k
-        self.lambda_tilde_k = float(1) / float(self.S_k) * self.sum_lambda_tilde_k
+        np.multiply(self.lambda_hat_k, float(1) / float(self.L_k), out=difference)
+        self.sum_lambda_tilde_k += difference
+        np.multiply(self.sum_lambda_tilde_k, float(1) / float(self.S_k), out=self.lambda_tilde_k)
         self.sum_d_tilde_k += float(1) / float(self.L_k) * self.d_hat_k
         self.d_tilde_k = float(1) / float(self.S_k) * self.sum_d_tilde_k
 
@@ -161,7 +180,7 @@ class UniversalPGM(SolutionMethod, Observable):
         # -- Averaging --
 
         # Update
-        self.lambda_hat_k = lambda_k_plus
+        self.lambda_hat_k = self._work_array('lambda_hat_k', lambda_k_plus)
 
         # and for record keeping...
         self.d_hat_k = d_k_plus
@@ -174,9 +193,9 @@ class UniversalPGM(SolutionMethod, Observable):
             # we have an additional oracle call
             # projection here would not be required technically, but because of numerics when constructing the convex
             # combination, we call it
-            self.lambda_k = self.projection_function(self.lambda_tilde_k)
-            self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-            self.oracle_calls += 1
+            self.lambda_k = self._project(self.lambda_tilde_k, out=self._work_array('lambda_k'))
+            [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+            self._count_oracle_calls(1)
         else:
             self.x_k = self.x_hat_k
             self.d_k = self.d_hat_k
@@ -196,18 +215,14 @@ class UniversalDGM(SolutionMethod, Observable):
     [1] Universal Gradient Methods for Convex Optimization Problems, Yu. Nesterov, CORE Discussion Paper, 2013.
     Note: zeta(x,y) = ||y-x||^2_2 is used as the prox function, throughout.
     """
-    def __init__(self, oracle, projection_function, dimension=0, epsilon=UGM_DEFAULT_EPSILON, averaging=False, sense='min'):
+    def __init__(self, oracle, projection_function, dimension=0, epsilon=UGM_DEFAULT_EPSILON, averaging=False, sense='min',
+                 speculative_trials=1, oracle_executor=None):
         super(UniversalDGM, self).__init__()
 
         self.desc = 'UDGM, $\epsilon = {}$'.format(epsilon)
 
         self.oracle = oracle
-        if sense == 'min':
-            self.oracle = oracle
-        elif sense == 'max':
-            self.oracle = invert_oracle_sense(oracle)
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self._set_sense(sense)  # the method maximizes sense_sign*d
         self.projection_function = projection_function
 
         self.iteration_number = 1
@@ -237,14 +252,18 @@ class UniversalDGM(SolutionMethod, Observable):
         self.L_k = float(UGM_DEFAULT_L_0)  # if you use something else, make sure it's a float!
         self.epsilon = float(epsilon)
         self.i_k = 0
-        self.phi_k = copy.deepcopy(self.lambda_hat_k)
+        if speculative_trials < 1:
+            raise ValueError('speculative_trials should be a positive integer')
+        self.speculative_trials = int(speculative_trials)
+        self.oracle_executor = oracle_executor
+        self.phi_k = self._work_array('phi_k', self.lambda_hat_k)
 
         # -- Averaging -- Synthesize outputs
         # Variables to synthesize solution from algorithm's process
         # records of d_tilda_k and lambda_tilda_k ("averages") according to Eqns. below 2.17
         self.S_k = float(1)/float(self.L_k)
-        self.lambda_tilde_k = copy.deepcopy(self.lambda_hat_k)
-        self.sum_lambda_tilde_k = copy.deepcopy(self.lambda_hat_k)  # \sum_i=0^k lambda_tilda_k
+        self.lambda_tilde_k = self._work_array('lambda_tilde_k', self.lambda_hat_k)
+        self.sum_lambda_tilde_k = self._work_array('sum_lambda_tilde_k', self.lambda_hat_k)  # \sum_i=0^k lambda_tilda_k
         self.d_tilde_k = 0
         self.sum_d_tilde_k = 0
 
@@ -265,10 +284,12 @@ class UniversalDGM(SolutionMethod, Observable):
         self.method_name = 'UDGM'
         self.parameter = epsilon
 
-    def _bregman_map(self, M, lambda_k, subgrad_lambda_k):
-        return self.projection_function(_bregman_map(M, lambda_k, subgrad_lambda_k))
+    def _bregman_map(self, M, lambda_k, subgrad_lambda_k, out):
+        """ Bregman map, according to [1], Eq. 2.9, with f(x) := -d(lambda), and M*psi(x,y) := M/2*||lambda-lambda_k||_2,
+        written into out. """
+        return self._projected_step(lambda_k, self.sense_sign/M, subgrad_lambda_k, out)
 
-    def dual_step(self):
+    def _dual_step(self):
         # Implementation of Algorithm (3.2) in [1], the Universal Dual Gradient Method.
 
         if self.iteration_number == 1:
@@ -276,8 +297,8 @@ class UniversalDGM(SolutionMethod, Observable):
             # if it's the first iteration, we have to make an oracle call to fill the subgradient and the d_k
             # for lambda_0; the algorithm assumes that these quantities are known for each iterate (including 0-th)
             # if self.iteration_number == 1:
-            self.x_hat_k, self.d_hat_k, self.diff_d_hat_k = self.oracle(self.lambda_hat_k)
-            self.oracle_calls += 1
+            [(self.x_hat_k, self.d_hat_k, self.diff_d_hat_k)] = yield [self.lambda_hat_k]
+            self._count_oracle_calls(1)
             self.lambda_k = self.lambda_hat_k
             self.d_k = self.d_hat_k
             self.diff_d_k = self.diff_d_hat_k
@@ -289,28 +310,39 @@ class UniversalDGM(SolutionMethod, Observable):
 
         i_k = 0
         smallest_i_k_found = 0
+        difference = self._work_array('difference')
 
         while not smallest_i_k_found:
+            # test points are computed for one value of i_k, or for several consecutive ones in speculative mode
+            trial_i_ks = range(i_k, i_k + self.speculative_trials)
+
             # first, calculate lambda_k_ik (test point)
-            lambda_k_ik = self.phi_k + float(1.0)/(2**i_k*self.L_k)*self.diff_d_hat_k
-            lambda_k_ik = self.projection_function(lambda_k_ik)
+            trial_buffer = self._work_array('trial_lambdas', shape=(self.speculative_trials, self.dimension))
+            trial_lambdas = [self._projected_step(self.phi_k, self.sense_sign/(2**i*self.L_k), self.diff_d_hat_k,
+                                                  out=trial_lambda)
+                             for i, trial_lambda in zip(trial_i_ks, trial_buffer)]
 
             # then, call oracle at lambda_k_ik (test point)
-            x_k_ik, d_k_ik, diff_d_k_ik, = self.oracle(lambda_k_ik)
-            self.oracle_calls += 1
+            trial_results = yield trial_lambdas
+            self._count_oracle_calls(len(trial_results))
 
             # before I can test the condition I have to calculate the Bregman point, and invoke once again the oracle
             # to evaluate d(bregman(lambda_k_ik))
-            bregman_lambda_k_ik = self._bregman_map(2**i_k*self.L_k, lambda_k_ik, diff_d_k_ik)
-            bregman_x_k_ik, bregman_d_k_ik, bregman_subgrad_lambda_k_ik, = self.oracle(bregman_lambda_k_ik)
-            self.oracle_calls += 1
-
-            # then test condition
-            if (-bregman_d_k_ik <= -d_k_ik
-                                    + np.dot(-diff_d_k_ik, bregman_lambda_k_ik - lambda_k_ik)
-                                    + float(2**i_k*self.L_k)/float(2)*(np.linalg.norm(lambda_k_ik - bregman_lambda_k_ik, 2)**2)
-                                    + float(self.epsilon)/float(2)):
-                smallest_i_k_found = 1
+            bregman_buffer = self._work_array('trial_bregman_lambdas', shape=(self.speculative_trials, self.dimension))
+            trial_bregman_lambdas = [self._bregman_map(2**i*self.L_k, lambda_k_ik, diff_d_k_ik, out=bregman_lambda)
+                                     for i, lambda_k_ik, (_, _, diff_d_k_ik), bregman_lambda
+                                     in zip(trial_i_ks, trial_lambdas, trial_results, bregman_buffer)]
+            trial_bregman_results = yield trial_bregman_lambdas
+            self._count_oracle_calls(len(trial_bregman_results))
+
+            for i_k, lambda_k_ik, (x_k_ik, d_k_ik, diff_d_k_ik), bregman_lambda_k_ik, (_, bregman_d_k_ik, _) in zip(
+                    trial_i_ks, trial_lambdas, trial_results, trial_bregman_lambdas, trial_bregman_results):
+                # then test condition
+                squared_distance = _squared_distance(bregman_lambda_k_ik, lambda_k_ik, difference)
+                if (self.sense_sign*(d_k_ik + np.dot(diff_d_k_ik, difference) - bregman_d_k_ik)
+                        <= float(2**i_k*self.L_k)/float(2)*squared_distance + float(self.epsilon)/float(2)):
+                    smallest_i_k_found = 1
+                    break
             else:
                 i_k += 1
 
@@ -321,16 +353,18 @@ class UniversalDGM(SolutionMethod, Observable):
         self.iteration_number += 1
         self.L_k = 2**(i_k-1)*self.L_k
 
-        # -- Averaging -- Synthesize outputs
+        # -- Averaging -- Synthesize outputs (in place)
         self.S_k += float(1)/float(self.L_k)
-        self.sum_lambda_tilde_k += float(1) / float(self.L_k) * bregman_lambda_k_ik
-        self.lambda_tilde_k = float(1) / float(self.S_k) * self.sum_lambda_tilde_k
+        np.multiply(bregman_lambda_k_ik, float(1) / float(self.L_k), out=difference)
+        self.sum_lambda_tilde_k += difference
+        np.multiply(self.sum_lambda_tilde_k, float(1) / float(self.S_k), out=self.lambda_tilde_k)
         self.sum_d_tilde_k += float(1) / float(self.L_k) * bregman_d_k_ik
         self.d_tilde_k = float(1) / float(self.S_k) * self.sum_d_tilde_k
         # -- Averaging --
 
-        self.lambda_hat_k = lambda_k_ik
-        self.phi_k += float(1.0)/(2*self.L_k)*self.diff_d_hat_k
+        self.lambda_hat_k = self._work_array('lambda_hat_k', lambda_k_ik)
+        np.multiply(self.diff_d_hat_k, self.sense_sign/(2*self.L_k), out=difference)
+        self.phi_k += difference
         # and for the record ...
         self.d_hat_k = d_k_ik
         self.diff_d_hat_k = diff_d_k_ik
@@ -342,9 +376,9 @@ class UniversalDGM(SolutionMethod, Observable):
             # we have an additional oracle call
             # projection here would not be required technically, but because of numerics when constructing the convex
             # combination, we call it
-            self.lambda_k = self.projection_function(self.lambda_tilde_k)
-            self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-            self.oracle_calls += 1
+            self.lambda_k = self._project(self.lambda_tilde_k, out=self._work_array('lambda_k'))
+            [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+            self._count_oracle_calls(1)
         else:
             self.x_k = self.x_hat_k
             self.d_k = self.d_hat_k
@@ -364,18 +398,14 @@ class UniversalFGM(SolutionMethod, Observable):
     [1] Universal Gradient Methods for Convex Optimization Problems, Yu. Nesterov, CORE Discussion Paper, 2013.
     Note: zeta(x,y) = ||y-x||^2_2 is used as the prox function, throughout.
     """
-    def __init__(self, oracle, projection_function, dimension=0, epsilon=UGM_DEFAULT_EPSILON, averaging=False, sense='min'):
+    def __init__(self, oracle, projection_function, dimension=0, epsilon=UGM_DEFAULT_EPSILON, averaging=False, sense='min',
+                 speculative_trials=1, oracle_executor=None):
         super(UniversalFGM, self).__init__()
 
         self.desc = 'UFGM, $\epsilon = {}$'.format(epsilon)
 
         self.oracle = oracle
-        if sense == 'min':
-            self.oracle = oracle
-        elif sense == 'max':
-            self.oracle = invert_oracle_sense(oracle)
-        else:
-            raise ValueError('Sense should be either "min" or "max"')
+        self._set_sense(sense)  # the method maximizes sense_sign*d
         self.projection_function = projection_function
 
         self.iteration_number = 1
@@ -395,11 +425,15 @@ class UniversalFGM(SolutionMethod, Observable):
         self.L_k = float(UGM_DEFAULT_L_0)  # if you use something else, make sure it's a float!
         self.epsilon = float(epsilon)
         self.i_k = 0
-        self.phi_k = copy.deepcopy(self.lambda_hat_k)
+        if speculative_trials < 1:
+            raise ValueError('speculative_trials should be a positive integer')
+        self.speculative_trials = int(speculative_trials)
+        self.oracle_executor = oracle_executor
+        self.phi_k = self._work_array('phi_k', self.lambda_hat_k)
 
-        self.y_k = copy.deepcopy(self.lambda_hat_k)
+        self.y_k = self._work_array('y_k', self.lambda_hat_k)
         self.A_k = 0
-        self.a_k = copy.deepcopy(self.lambda_hat_k)
+        self.a_k = 0
         self.tau_k = 0
         self.v_k = 0
 
@@ -419,16 +453,18 @@ class UniversalFGM(SolutionMethod, Observable):
         self.method_name = 'UFGM'
         self.parameter = epsilon
 
-    def _bregman_map(self, M, lambda_k, subgrad_lambda_k):
-        return self.projection_function(_bregman_map(M, lambda_k, subgrad_lambda_k))
+    def _bregman_map(self, M, lambda_k, subgrad_lambda_k, out):
+        """ Bregman map, according to [1], Eq. 2.9, with f(x) := -d(lambda), and M*psi(x,y) := M/2*||lambda-lambda_k||_2,
+        written into out. """
+        return self._projected_step(lambda_k, self.sense_sign/M, subgrad_lambda_k, out)
 
-    def dual_step(self):
+    def _dual_step(self):
         ##########
         # Step 1 #
         ##########
 
         # find v_k
-        v_k = self.projection_function(self.phi_k)
+        v_k = self._project(self.phi_k, out=self._work_array('v_k'))
 
         ##########
         # Step 2 #
@@ -436,29 +472,39 @@ class UniversalFGM(SolutionMethod, Observable):
 
         smallest_i_k_found = 0
         i_k = 0
+        difference = self._work_array('difference')
 
         while not smallest_i_k_found:
-            a_kp_ik = float(1 + np.sqrt(1+self.A_k*2**(i_k+2)*self.L_k))/float(2**(i_k+1)*self.L_k)
-            A_kp_ik = self.A_k + a_kp_ik
-            tau_k_ik = float(a_kp_ik)/float(A_kp_ik)
-            # Find test point
-            lambda_kp_ik = tau_k_ik*v_k + (1-tau_k_ik)*self.y_k
+            # test points are computed for one value of i_k, or for several consecutive ones in speculative mode
+            trial_i_ks = range(i_k, i_k + self.speculative_trials)
+            trial_a_kps = [float(1 + np.sqrt(1+self.A_k*2**(i+2)*self.L_k))/float(2**(i+1)*self.L_k) for i in trial_i_ks]
+            trial_taus = [float(a_kp_ik)/float(self.A_k + a_kp_ik) for a_kp_ik in trial_a_kps]
+            # Find test point, tau_k_ik*v_k + (1-tau_k_ik)*y_k
+            trial_buffer = self._work_array('trial_lambdas', shape=(self.speculative_trials, self.dimension))
+            trial_lambdas = [_convex_combination(tau_k_ik, v_k, self.y_k, out=trial_lambda)
+                             for tau_k_ik, trial_lambda in zip(trial_taus, trial_buffer)]
             # Query oracle at test point
-            x_kp_ik, d_kp_ik, diff_kp_ik, = self.oracle(lambda_kp_ik)
-            self.oracle_calls += 1
+            trial_results = yield trial_lambdas
+            self._count_oracle_calls(len(trial_results))
             # Continue with the computations
-            hat_lambda_kp_ik = v_k + a_kp_ik*diff_kp_ik
-            hat_lambda_kp_ik = self.projection_function(hat_lambda_kp_ik)
-            y_kp_ik = tau_k_ik*hat_lambda_kp_ik + (1-tau_k_ik)*self.y_k
+            hat_lambda_kp_ik = self._work_array('hat_lambda_kp_ik')
+            y_buffer = self._work_array('trial_ys', shape=(self.speculative_trials, self.dimension))
+            trial_ys = []
+            for a_kp_ik, tau_k_ik, (_, _, diff_kp_ik), trial_y in zip(trial_a_kps, trial_taus, trial_results, y_buffer):
+                self._projected_step(v_k, self.sense_sign*a_kp_ik, diff_kp_ik, out=hat_lambda_kp_ik)
+                trial_ys.append(_convex_combination(tau_k_ik, hat_lambda_kp_ik, self.y_k, out=trial_y))
             # Query oracle again at y_kp_ik
-            x_y_kp_ik, d_y_kp_ik, diff_y_kp_ik, = self.oracle(y_kp_ik)
-            self.oracle_calls += 1
-            # Test condition
-            if -d_y_kp_ik <= (-d_kp_ik
-                            + np.dot(-diff_kp_ik,y_kp_ik-lambda_kp_ik)
-                            + 2**(i_k-1)*self.L_k*(np.linalg.norm(y_kp_ik - lambda_kp_ik,2)**2)
-                            + float(self.epsilon)/float(2.0)*tau_k_ik):
-                smallest_i_k_found = 1
+            trial_y_results = yield trial_ys
+            self._count_oracle_calls(len(trial_y_results))
+
+            for i_k, a_kp_ik, tau_k_ik, lambda_kp_ik, (x_kp_ik, d_kp_ik, diff_kp_ik), y_kp_ik, (_, d_y_kp_ik, _) in zip(
+                    trial_i_ks, trial_a_kps, trial_taus, trial_lambdas, trial_results, trial_ys, trial_y_results):
+                # Test condition
+                squared_distance = _squared_distance(y_kp_ik, lambda_kp_ik, difference)
+                if (self.sense_sign*(d_kp_ik + np.dot(diff_kp_ik, difference) - d_y_kp_ik)
+                        <= 2**(i_k-1)*self.L_k*squared_distance + float(self.epsilon)/float(2.0)*tau_k_ik):
+                    smallest_i_k_found = 1
+                    break
             else:
                 i_k += 1
 
@@ -468,13 +514,14 @@ class UniversalFGM(SolutionMethod, Observable):
 
         self.iteration_number += 1
         # Perform step
-        self.lambda_hat_k = lambda_kp_ik
-        self.y_k = y_kp_ik
+        self.lambda_hat_k = self._work_array('lambda_hat_k', lambda_kp_ik)
+        self.y_k = self._work_array('y_k', y_kp_ik)
         self.a_k = a_kp_ik
         self.tau_k = tau_k_ik
         self.A_k = self.A_k + self.a_k
         self.L_k = 2**(i_k-1)*self.L_k
-        self.phi_k += self.a_k * self.diff_d_hat_k
+        np.multiply(self.diff_d_hat_k, self.sense_sign*self.a_k, out=difference)
+        self.phi_k += difference
 
         # Record additional information about iterate
         self.d_hat_k= d_kp_ik
@@ -486,8 +533,8 @@ class UniversalFGM(SolutionMethod, Observable):
         if self.averaging:
             # we have an additional oracle call
             self.lambda_k = self.y_k
-            self.x_k, self.d_k, self.diff_d_k = self.oracle(self.lambda_k)
-            self.oracle_calls += 1
+            [(self.x_k, self.d_k, self.diff_d_k)] = yield [self.lambda_k]
+            self._count_oracle_calls(1)
         else:
             self.x_k = self.x_hat_k
             self.d_k = self.d_hat_k
@@ -0,0 +1,936 @@
+""" Oracle wrappers and combinators.
+
+All the methods in nsopy query a first order oracle with signature
+
+    x_k, d_k, diff_d_k = oracle(lambda_k)
+
+The classes in this module build such oracles out of simpler components (e.g., the independent subproblems of a
+dual decomposition), and can be passed wherever an oracle is expected.
+
+Batched oracles
+Oracles can optionally implement a batched version of the query,
+
+    X, D, diff_D = oracle_batch(Lambda)
+
+where Lambda is a (B, n) array of query points, and X, D and diff_D stack the B corresponding x_k, d_k and diff_d_k
+along their first axis. Methods use it (see find_batch_oracle) when they have several independent points to evaluate,
+and fall back to querying the oracle point by point otherwise. The batched version is found either as an
+oracle_batch attribute of the oracle itself, or, when the oracle is a bound method (e.g., inner_problem.oracle), as
+an oracle_batch method of the same object.
+
+Call flags
+Some oracles describe their last call with flags: last_call_cached (the result was reused, e.g., by CachedOracle) and
+last_call_inexact (some blocks were filled with earlier values, by DeadlineSeparableOracle). Methods read them right
+after each call (see last_call_flags), to count such calls and to keep inexact results from their oracle observers.
+Flags are kept per thread, so that concurrent calls each report their own.
+"""
+import asyncio
+import heapq
+import inspect
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, Executor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+AVAILABLE_EXECUTORS = ('serial', 'thread', 'process')
+AVAILABLE_SCHEDULES = (None, 'lpt')
+BLOCK_TIME_SMOOTHING = 0.5  # weight of the last measurement in the estimated evaluation time of a block
+DEFAULT_CACHE_SIZE = 128
+DEFAULT_LAMBDA_SLOTS = 4
+
+
+class BlockTimeoutError(TimeoutError):
+    """ Raised by DeadlineSeparableOracle when a block with no earlier result to fall back on does not return within
+    the timeout. """
+    pass
+
+
+class _CallFlag(object):
+    """ Call flag of an oracle class (see module docstring), with a value per thread and oracle instance. """
+    _flags = threading.local()
+
+    def __init__(self, default):
+        self.default = default
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, oracle, owner=None):
+        if oracle is None:
+            return self
+        return self._oracle_flags(oracle).get(self.name, self.default)
+
+    def __set__(self, oracle, value):
+        self._oracle_flags(oracle)[self.name] = value
+
+    def _oracle_flags(self, oracle):
+        flags = getattr(self._flags, 'oracles', None)
+        if flags is None:
+            flags = self._flags.oracles = weakref.WeakKeyDictionary()
+        return flags.setdefault(oracle, {})
+
+
+def last_call_flags(oracle):
+    """ Returns the (last_call_cached, last_call_inexact) flags of the last call of oracle in this thread (False for
+    oracles without flags). """
+    oracle = unwrap_oracle(oracle)
+    return bool(getattr(oracle, 'last_call_cached', False)), bool(getattr(oracle, 'last_call_inexact', False))
+
+
+def unwrap_oracle(oracle):
+    """ Returns the oracle wrapped by (possibly nested) wrappers such as nsopy.utils.invert_oracle_sense. """
+    while hasattr(oracle, '__wrapped__'):
+        oracle = oracle.__wrapped__
+    return oracle
+
+
+def find_batch_oracle(oracle):
+    """ Returns the batched version of oracle (see module docstring), or None if the oracle does not provide one. """
+    oracle_batch = getattr(oracle, 'oracle_batch', None)
+    if oracle_batch is None:
+        oracle_batch = getattr(getattr(oracle, '__self__', None), 'oracle_batch', None)
+    return oracle_batch
+
+
+def stack_oracle_results(results):
+    """ Stacks a list of (x_k, d_k, diff_d_k) triples into the (X, D, diff_D) arrays returned by batched oracles. """
+    X = np.array([x_k for x_k, _, _ in results])
+    D = np.array([d_k for _, d_k, _ in results], dtype=float)
+    diff_D = np.array([diff_d_k for _, _, diff_d_k in results], dtype=float)
+    return X, D, diff_D
+
+
+def evaluate_batch(oracle, Lambda):
+    """ Evaluates oracle at the rows of Lambda, with its batched version if available, or point by point otherwise. """
+    oracle_batch = find_batch_oracle(oracle)
+    if oracle_batch is not None:
+        return oracle_batch(np.asarray(Lambda, dtype=float))
+    return stack_oracle_results([oracle(lambda_k) for lambda_k in Lambda])
+
+
+def _evaluate_block_function(block_function, block_id, lambda_k):
+    # module level, so that it can be pickled and sent to process pools
+    return block_function(block_id, lambda_k)
+
+
+def _evaluate_timed_chunk(evaluations, lambda_k):
+    # evaluations is a list of (function, arguments), each called as function(*arguments, lambda_k); returns their
+    # results, together with the time each of them took
+    results = []
+    for function, arguments in evaluations:
+        start = time.perf_counter()
+        result = function(*(tuple(arguments) + (lambda_k,)))
+        results.append((result, time.perf_counter() - start))
+    return results
+
+
+# state of the workers of a SharedMemorySeparableOracle, set once per worker by _init_shared_memory_worker
+_shared_memory_worker = {}
+
+
+def _attach_shared_array(name, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=float, buffer=shm.buf)
+
+
+def _init_shared_memory_worker(block_oracles, block_function, block_ids, lambda_name, lambda_shape, out_name,
+                               out_shape):
+    lambda_shm, lambda_slots = _attach_shared_array(lambda_name, lambda_shape)
+    out_shm, block_subgradients = _attach_shared_array(out_name, out_shape)
+    _shared_memory_worker.update(block_oracles=block_oracles, block_function=block_function, block_ids=block_ids,
+                                 lambda_slots=lambda_slots, block_subgradients=block_subgradients,
+                                 _segments=(lambda_shm, out_shm))
+
+
+def _evaluate_shared_memory_block(block, slot, write_subgradient, lambda_k=None):
+    worker = _shared_memory_worker
+    if lambda_k is None:
+        lambda_k = worker['lambda_slots'][slot]
+        lambda_k.flags.writeable = False
+    if worker['block_function'] is not None:
+        x_i, d_i, diff_d_i = worker['block_function'](worker['block_ids'][block], lambda_k)
+    else:
+        x_i, d_i, diff_d_i = worker['block_oracles'][block](lambda_k)
+    if write_subgradient:
+        worker['block_subgradients'][block] = diff_d_i
+        return x_i, d_i, None
+    return x_i, d_i, diff_d_i
+
+
+class SeparableOracle(object):
+    """ Oracle of a separable dual function,
+
+        d(lambda) = sum_i d_i(lambda),
+
+    as obtained for instance when dualizing the coupling constraints of a problem made of independent subproblems
+    (see the OptimalShedding example in the notebooks). Each block is evaluated independently, possibly in parallel
+    on a pool of threads or processes; block values and subgradients are summed, and the inner solutions x_i are
+    concatenated (along their first axis) into x_k.
+
+    Blocks are specified either as
+    - a list of block oracles, each with the usual signature  x_i, d_i, diff_d_i = block_oracle(lambda_k), or
+    - a single block_function, with signature  x_i, d_i, diff_d_i = block_function(block_id, lambda_k), together
+      with the list of block_ids it should be evaluated on.
+
+    Terms that do not decompose (e.g., the -lambda^T b contribution of the dualized constraints) can simply be
+    supplied as an additional block.
+
+    executor can be 'serial', 'thread', 'process', or an existing concurrent.futures.Executor (which is then not
+    shut down by close()). With 'process', the block oracles (or block_function) and lambda_k are pickled and sent
+    to the workers, so they must be picklable (e.g., module level functions, or methods of picklable objects).
+
+    With schedule='lpt', the time taken by each block is recorded across queries, and full queries (evaluate_blocks,
+    or calling the oracle) dispatch the blocks longest-first (longest processing time first, which keeps the workers
+    busy until the end instead of leaving them idle while one long block finishes). Cheap blocks are grouped into
+    chunks taking at least min_chunk_time seconds, which are evaluated in a single task. block_times holds the
+    estimated time of each block (nan until it has been evaluated), and predicted_makespan and actual_makespan the
+    predicted (by simulating the pool on the estimated times) and measured duration of the last query; both are also
+    appended to makespan_history.
+
+    Block oracles (or block_function) can also be coroutine functions (async def); the separable oracle is then
+    asynchronous itself, i.e., calling it returns an awaitable, and blocks are awaited concurrently. This is meant to
+    be used with SolutionMethod.dual_step_async(). Synchronous blocks can also be awaited concurrently from an event
+    loop with evaluate_blocks_async(), in which case they run on the executor.
+    """
+    def __init__(self, block_oracles=None, block_function=None, block_ids=None, executor='thread', n_workers=None,
+                 schedule=None, min_chunk_time=0.0):
+        if block_oracles is not None:
+            if block_function is not None:
+                raise ValueError('Provide either block_oracles or block_function (with block_ids), not both.')
+            self.block_oracles = list(block_oracles)
+            self.block_function = None
+            self.block_ids = list(range(len(self.block_oracles)))
+        elif block_function is not None:
+            if block_ids is None:
+                raise ValueError('block_ids are required together with block_function.')
+            self.block_oracles = None
+            self.block_function = block_function
+            self.block_ids = list(block_ids)
+        else:
+            raise ValueError('Provide either block_oracles or block_function (with block_ids).')
+
+        if len(self.block_ids) == 0:
+            raise ValueError('A separable oracle needs at least one block.')
+
+        if isinstance(executor, Executor):
+            self.executor = executor
+            self._owns_executor = False
+        elif executor in AVAILABLE_EXECUTORS:
+            self.executor = None  # created lazily, at the first oracle call
+            self._owns_executor = True
+        else:
+            raise ValueError('executor should be one of {} or a concurrent.futures.Executor'.format(AVAILABLE_EXECUTORS))
+        self.executor_type = executor
+        self.n_workers = n_workers
+
+        if self.block_function is not None:
+            self.asynchronous = inspect.iscoroutinefunction(self.block_function)
+        else:
+            self.asynchronous = any(inspect.iscoroutinefunction(block_oracle) for block_oracle in self.block_oracles)
+
+        if schedule not in AVAILABLE_SCHEDULES:
+            raise ValueError('schedule should be one of {}'.format(AVAILABLE_SCHEDULES))
+        self.schedule = schedule
+        self.min_chunk_time = float(min_chunk_time)
+        self.block_times = np.full(len(self.block_ids), np.nan)
+        self.predicted_makespan = np.nan
+        self.actual_makespan = np.nan
+        self.makespan_history = []
+
+    @property
+    def n_blocks(self):
+        return len(self.block_ids)
+
+    def __call__(self, lambda_k):
+        if self.asynchronous:
+            return self._call_async(lambda_k)
+        return self.aggregate(self.evaluate_blocks(lambda_k))
+
+    async def _call_async(self, lambda_k):
+        return self.aggregate(await self.evaluate_blocks_async(lambda_k))
+
+    def evaluate_blocks(self, lambda_k, blocks=None):
+        """ Evaluates the blocks with indices in blocks (all of them by default) at lambda_k, and returns the list of
+        their (x_i, d_i, diff_d_i) triples, in the same order. """
+        if blocks is None:
+            blocks = range(self.n_blocks)
+        if self.schedule == 'lpt' and not self.asynchronous:
+            return self._evaluate_scheduled(lambda_k, list(blocks))
+        futures = [self.submit(i, lambda_k) for i in blocks]
+        return [future.result() for future in futures]
+
+    async def evaluate_blocks_async(self, lambda_k, blocks=None):
+        """ Same as evaluate_blocks, but awaits the blocks concurrently on the running event loop. """
+        if blocks is None:
+            blocks = range(self.n_blocks)
+        return list(await asyncio.gather(*[self._evaluate_async(i, lambda_k) for i in blocks]))
+
+    async def _evaluate_async(self, block, lambda_k):
+        if self.asynchronous:
+            result = self._evaluate(block, lambda_k)
+            return (await result) if inspect.isawaitable(result) else result
+        return await asyncio.wrap_future(self.submit(block, lambda_k))
+
+    def submit(self, block, lambda_k):
+        """ Schedules the evaluation of block (an index in 0, ..., n_blocks-1) at lambda_k and returns a
+        concurrent.futures.Future of its (x_i, d_i, diff_d_i) triple. """
+        if self.executor_type == 'serial':
+            future = Future()
+            try:
+                future.set_result(self._evaluate(block, lambda_k))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        executor = self._get_executor()
+        if self.block_function is not None:
+            return executor.submit(_evaluate_block_function, self.block_function, self.block_ids[block], lambda_k)
+        return executor.submit(self.block_oracles[block], lambda_k)
+
+    def _evaluate(self, block, lambda_k):
+        if self.block_function is not None:
+            return self.block_function(self.block_ids[block], lambda_k)
+        return self.block_oracles[block](lambda_k)
+
+    def _evaluate_scheduled(self, lambda_k, blocks):
+        if not blocks:
+            # e.g., all the blocks were reused by a LazySeparableOracle: nothing to schedule, nor to time
+            return []
+        start = time.perf_counter()
+        executor = self._get_executor()
+        chunks = self._lpt_chunks(blocks)
+        self.predicted_makespan = self._simulate_makespan(chunks)
+
+        evaluations = [[(self.block_function, (self.block_ids[i],)) if self.block_function is not None
+                        else (self.block_oracles[i], ()) for i in chunk] for chunk in chunks]
+        if executor is None:
+            chunk_results = [_evaluate_timed_chunk(chunk_evaluations, lambda_k) for chunk_evaluations in evaluations]
+        else:
+            futures = [executor.submit(_evaluate_timed_chunk, chunk_evaluations, lambda_k)
+                       for chunk_evaluations in evaluations]
+            chunk_results = [future.result() for future in futures]
+
+        results = {}
+        for chunk, timed_results in zip(chunks, chunk_results):
+            for i, (result, elapsed) in zip(chunk, timed_results):
+                results[i] = result
+                if np.isnan(self.block_times[i]):
+                    self.block_times[i] = elapsed
+                else:
+                    self.block_times[i] += BLOCK_TIME_SMOOTHING * (elapsed - self.block_times[i])
+
+        self.actual_makespan = time.perf_counter() - start
+        self.makespan_history.append((self.predicted_makespan, self.actual_makespan))
+        return [results[i] for i in blocks]
+
+    def _lpt_chunks(self, blocks):
+        # blocks never evaluated come first (their time is unknown), then by decreasing estimated time
+        unique_blocks = list(OrderedDict.fromkeys(blocks))
+        estimated_times = np.nan_to_num(self.block_times[unique_blocks], nan=np.inf)
+        ordered_blocks = [unique_blocks[j] for j in np.argsort(-estimated_times, kind='stable')]
+
+        chunks = []
+        chunk_time = np.inf
+        for i in ordered_blocks:
+            if chunk_time < self.min_chunk_time:
+                chunks[-1].append(i)
+                chunk_time += self.block_times[i]
+            else:
+                chunks.append([i])
+                chunk_time = self.block_times[i]
+        return chunks
+
+    def _simulate_makespan(self, chunks):
+        # list scheduling of the chunks, in order, on the workers of the pool
+        if any(np.isnan(self.block_times[chunk]).any() for chunk in chunks):
+            return np.nan
+        if self.executor is None:
+            n_workers = 1
+        else:
+            n_workers = self.n_workers or getattr(self.executor, '_max_workers', None) or os.cpu_count() or 1
+        workers = [0.0]*min(n_workers, len(chunks))
+        for chunk in chunks:
+            heapq.heappush(workers, heapq.heappop(workers) + np.sum(self.block_times[chunk]))
+        return max(workers)
+
+    @staticmethod
+    def aggregate(block_results):
+        """ Combines a list of block (x_i, d_i, diff_d_i) triples into the (x_k, d_k, diff_d_k) triple of their sum. """
+        x_k = np.concatenate([np.atleast_1d(x_i) for x_i, _, _ in block_results])
+        d_k = 0
+        diff_d_k = None
+        for _, d_i, diff_d_i in block_results:
+            d_k += d_i
+            if diff_d_k is None:
+                diff_d_k = np.array(diff_d_i, dtype=float)  # copy, we accumulate in place
+            else:
+                diff_d_k += diff_d_i
+
+        return x_k, d_k, diff_d_k
+
+    def _get_executor(self):
+        if self.executor is None:
+            if self.executor_type == 'thread':
+                self.executor = ThreadPoolExecutor(max_workers=self.n_workers)
+            elif self.executor_type == 'process':
+                self.executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        return self.executor
+
+    def close(self):
+        """ Shuts down the worker pool, if it was created by this oracle. """
+        if self._owns_executor and self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SharedMemorySeparableOracle(SeparableOracle):
+    """ SeparableOracle evaluating the blocks on a pool of processes, with worker-resident problem data.
+
+    The block oracles (or block_function) are sent to each worker once, when the pool starts; if they are methods of
+    a problem object (e.g., block_function=problem.solve_subproblem), the problem data is shipped along with them,
+    and stays in the workers. At each query, lambda_k is written into a shared memory buffer, which workers read in
+    place: only the block index and the buffer slot are sent to the workers. Block subgradients are written back by
+    the workers into a shared (n_blocks, dimension) array, so only x_i and d_i are pickled.
+
+    The buffer has n_lambda_slots slots, so that blocks can be in flight at several points at once (e.g., with the
+    asynchronous methods); a slot is reused once all the evaluations reading it have completed. Block functions
+    receive a read-only view of the slot, which they should copy if they need to keep it. When all slots are busy, or
+    a block is already being evaluated, the query falls back to sending lambda_k and the subgradient by pickling.
+
+    The buffers are allocated at the first query and released by close() (or at the end of a with block).
+    """
+    def __init__(self, block_oracles=None, block_function=None, block_ids=None, dimension=None, n_workers=None,
+                 n_lambda_slots=DEFAULT_LAMBDA_SLOTS):
+        super(SharedMemorySeparableOracle, self).__init__(block_oracles=block_oracles, block_function=block_function,
+                                                          block_ids=block_ids, executor='process', n_workers=n_workers)
+        if self.asynchronous:
+            raise ValueError('Block oracles of a SharedMemorySeparableOracle should be synchronous.')
+        if dimension is None or dimension < 1:
+            raise ValueError('The dimension of lambda is required, to allocate the shared buffers.')
+        if n_lambda_slots < 1:
+            raise ValueError('n_lambda_slots should be a positive integer.')
+        self.dimension = dimension
+        self.n_lambda_slots = n_lambda_slots
+
+        self._lambda_shm = None
+        self._out_shm = None
+        self._lambda_slots = None
+        self._block_subgradients = None
+        self._lock = threading.Lock()
+        self._slot_in_flight = np.zeros(n_lambda_slots, dtype=int)
+        self._slot_filled = np.zeros(n_lambda_slots, dtype=bool)
+        self._blocks_in_flight = set()
+        # number of evaluations that had to fall back to pickling lambda_k or the subgradient
+        self.pickled_calls = 0
+
+    def submit(self, block, lambda_k):
+        lambda_k = np.asarray(lambda_k, dtype=float).reshape(self.dimension)
+        executor = self._get_executor()
+        with self._lock:
+            slot = self._acquire_slot(lambda_k)
+            write_subgradient = slot is not None and block not in self._blocks_in_flight
+            if write_subgradient:
+                self._blocks_in_flight.add(block)
+            if slot is None or not write_subgradient:
+                self.pickled_calls += 1
+
+        if slot is None:
+            inner_future = executor.submit(_evaluate_shared_memory_block, block, None, False, lambda_k)
+        else:
+            inner_future = executor.submit(_evaluate_shared_memory_block, block, slot, write_subgradient)
+
+        future = Future()
+        inner_future.add_done_callback(lambda f: self._complete(block, slot, write_subgradient, f, future))
+        return future
+
+    def _acquire_slot(self, lambda_k):
+        # a slot already holding lambda_k, or a free one
+        for slot in range(self.n_lambda_slots):
+            if self._slot_filled[slot] and np.array_equal(self._lambda_slots[slot], lambda_k):
+                self._slot_in_flight[slot] += 1
+                return slot
+        for slot in range(self.n_lambda_slots):
+            if self._slot_in_flight[slot] == 0:
+                self._lambda_slots[slot] = lambda_k
+                self._slot_filled[slot] = True
+                self._slot_in_flight[slot] = 1
+                return slot
+        return None
+
+    def _complete(self, block, slot, write_subgradient, inner_future, future):
+        try:
+            x_i, d_i, diff_d_i = inner_future.result()
+            if write_subgradient:
+                diff_d_i = self._block_subgradients[block].copy()
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result((x_i, d_i, diff_d_i))
+        finally:
+            with self._lock:
+                if slot is not None:
+                    self._slot_in_flight[slot] -= 1
+                if write_subgradient:
+                    self._blocks_in_flight.discard(block)
+
+    def _get_executor(self):
+        if self.executor is None:
+            self._lambda_shm = shared_memory.SharedMemory(create=True, size=8*self.n_lambda_slots*self.dimension)
+            self._out_shm = shared_memory.SharedMemory(create=True, size=8*self.n_blocks*self.dimension)
+            self._lambda_slots = np.ndarray((self.n_lambda_slots, self.dimension), dtype=float,
+                                            buffer=self._lambda_shm.buf)
+            self._block_subgradients = np.ndarray((self.n_blocks, self.dimension), dtype=float,
+                                                  buffer=self._out_shm.buf)
+            self.executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_shared_memory_worker,
+                                                initargs=(self.block_oracles, self.block_function, self.block_ids,
+                                                          self._lambda_shm.name, self._lambda_slots.shape,
+                                                          self._out_shm.name, self._block_subgradients.shape))
+        return self.executor
+
+    def close(self):
+        """ Shuts down the worker pool and releases the shared memory buffers. """
+        super(SharedMemorySeparableOracle, self).close()
+        self._lambda_slots = self._block_subgradients = None  # views on the buffers, which must be released first
+        for shm in [self._lambda_shm, self._out_shm]:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._lambda_shm = self._out_shm = None
+        self._slot_in_flight[:] = 0
+        self._slot_filled[:] = False
+        self._blocks_in_flight = set()
+
+
+class CachedOracle(object):
+    """ Memoizes the results of an (expensive) oracle, keyed on the query point lambda_k.
+
+    Methods such as UniversalFGM (with averaging) query the oracle several times at the same point; wrapping the
+    oracle in a CachedOracle avoids evaluating it twice. Only the maxsize most recently used points are kept.
+
+    With tolerance=0 (default), two query points hit the same cache entry only if they are exactly equal. With
+    tolerance > 0, query points are rounded to a grid with that spacing, and points falling in the same grid cell
+    share the cached value; only use this if the oracle is insensitive to such perturbations.
+
+    Cached results are returned as they are, and should not be modified in place. Hits and misses are counted in
+    the hits and misses attributes; methods additionally count cache hits in their cached_oracle_calls.
+
+    Batched queries (oracle_batch) are served from the cache where possible, and the remaining points are evaluated
+    with a single call to the batched version of the wrapped oracle, if it has one.
+    """
+    last_call_cached = _CallFlag(False)
+
+    def __init__(self, oracle, maxsize=DEFAULT_CACHE_SIZE, tolerance=0.0):
+        if maxsize < 1:
+            raise ValueError('maxsize should be a positive integer.')
+        if tolerance < 0:
+            raise ValueError('tolerance should be non-negative.')
+        self.oracle = oracle
+        self.maxsize = maxsize
+        self.tolerance = float(tolerance)
+
+        self.hits = 0
+        self.misses = 0
+        self.last_batch_cached_calls = 0
+        self._cache = OrderedDict()
+
+    def __call__(self, lambda_k):
+        key = self._key(lambda_k)
+        try:
+            result = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            self.last_call_cached = False
+            result = self.oracle(lambda_k)
+            self._cache[key] = result
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)  # evict the least recently used point
+        else:
+            self.hits += 1
+            self.last_call_cached = True
+            self._cache.move_to_end(key)
+
+        return result
+
+    def oracle_batch(self, Lambda):
+        Lambda = np.asarray(Lambda, dtype=float)
+        keys = [self._key(lambda_k) for lambda_k in Lambda]
+
+        results = [None]*len(keys)
+        missing = OrderedDict()  # key -> index of the first row of Lambda with that key
+        for i, key in enumerate(keys):
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                results[i] = self._cache[key]
+            elif key not in missing:
+                missing[key] = i
+
+        if missing:
+            X, D, diff_D = evaluate_batch(self.oracle, Lambda[list(missing.values())])
+            for j, key in enumerate(missing):
+                missing[key] = (X[j], D[j], diff_D[j])
+                self._cache[key] = missing[key]
+                if len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = missing[key]
+
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        self.last_batch_cached_calls = len(keys) - len(missing)
+
+        return stack_oracle_results(results)
+
+    def _key(self, lambda_k):
+        lambda_k = np.asarray(lambda_k, dtype=float)
+        if self.tolerance > 0:
+            lambda_k = np.round(lambda_k / self.tolerance)
+        # adding 0.0 maps -0.0 to 0.0, which otherwise have different byte representations
+        return lambda_k.shape, (lambda_k + 0.0).tobytes()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        """ Empties the cache (counters are not reset). """
+        self._cache.clear()
+
+
+class LazySeparableOracle(object):
+    """ Reuses the results of the blocks of a SeparableOracle whose multipliers have (almost) not moved.
+
+    Blocks of a separable dual often depend on a few entries of lambda only, and late in a run (or when many multipliers
+    are pinned at zero by the projection) most of them see the same values as in the previous query. For each block,
+    the last result is kept together with the slice of lambda it was evaluated at, i.e., lambda_k[block_support[i]]
+    (the whole lambda_k if block_support is None); a block is re-evaluated only if some entry of its slice changed by
+    more than tolerance (with tolerance=0, the default, only if its slice changed at all).
+
+    Note that with tolerance > 0 the returned values are those at a nearby point, and are exact only if the block is
+    insensitive to such perturbations.
+
+    The wrapper can be used wherever the separable oracle can. The number of reused blocks in each query (call to the
+    oracle, or to evaluate_blocks) is appended to reused_blocks; hits and misses count reused and evaluated blocks
+    overall. When all blocks of a query are reused, the call is counted by methods as cached (see CachedOracle).
+    """
+    last_call_cached = _CallFlag(False)
+
+    def __init__(self, separable_oracle, block_support=None, tolerance=0.0):
+        if tolerance < 0:
+            raise ValueError('tolerance should be non-negative.')
+        if block_support is not None and len(block_support) != separable_oracle.n_blocks:
+            raise ValueError('block_support should list the support of each block of the separable oracle.')
+        self.separable_oracle = separable_oracle
+        self.block_support = None if block_support is None else [np.asarray(support, dtype=int)
+                                                                 for support in block_support]
+        self.tolerance = float(tolerance)
+
+        self.hits = 0
+        self.misses = 0
+        self.reused_blocks = []
+        # block -> (lambda slice, result)
+        self._block_results = {}
+
+    @property
+    def n_blocks(self):
+        return self.separable_oracle.n_blocks
+
+    @property
+    def asynchronous(self):
+        return self.separable_oracle.asynchronous
+
+    aggregate = staticmethod(SeparableOracle.aggregate)
+
+    def __call__(self, lambda_k):
+        if self.asynchronous:
+            return self._call_async(lambda_k)
+        return self.aggregate(self.evaluate_blocks(lambda_k))
+
+    async def _call_async(self, lambda_k):
+        return self.aggregate(await self.evaluate_blocks_async(lambda_k))
+
+    def evaluate_blocks(self, lambda_k, blocks=None):
+        """ Same as SeparableOracle.evaluate_blocks, re-evaluating only the blocks whose slice of lambda_k moved. """
+        blocks, results, stale_blocks = self._lookup(lambda_k, blocks)
+        fresh_results = self.separable_oracle.evaluate_blocks(lambda_k, blocks=[blocks[j] for j in stale_blocks])
+        return self._store(lambda_k, blocks, results, stale_blocks, fresh_results)
+
+    async def evaluate_blocks_async(self, lambda_k, blocks=None):
+        blocks, results, stale_blocks = self._lookup(lambda_k, blocks)
+        fresh_results = await self.separable_oracle.evaluate_blocks_async(lambda_k,
+                                                                          blocks=[blocks[j] for j in stale_blocks])
+        return self._store(lambda_k, blocks, results, stale_blocks, fresh_results)
+
+    def submit(self, block, lambda_k):
+        """ Same as SeparableOracle.submit; reused results are returned as already completed futures. """
+        result = self._reusable_result(block, lambda_k)
+        if result is not None:
+            self.hits += 1
+            future = Future()
+            future.set_result(result)
+            return future
+
+        self.misses += 1
+        lambda_slice = self._slice(block, lambda_k)
+        future = self.separable_oracle.submit(block, lambda_k)
+        future.add_done_callback(lambda f: self._store_future_result(block, lambda_slice, f))
+        return future
+
+    def _store_future_result(self, block, lambda_slice, future):
+        if not future.cancelled() and future.exception() is None:
+            self._block_results[block] = (lambda_slice, future.result())
+
+    def _slice(self, block, lambda_k):
+        lambda_k = np.asarray(lambda_k, dtype=float)
+        if self.block_support is None:
+            return lambda_k.copy()
+        return lambda_k[self.block_support[block]]
+
+    def _reusable_result(self, block, lambda_k):
+        try:
+            lambda_slice, result = self._block_results[block]
+        except KeyError:
+            return None
+        if np.all(np.abs(self._slice(block, lambda_k) - lambda_slice) <= self.tolerance):
+            return result
+        return None
+
+    def _lookup(self, lambda_k, blocks):
+        blocks = list(range(self.n_blocks)) if blocks is None else list(blocks)
+        results = [self._reusable_result(block, lambda_k) for block in blocks]
+        stale_blocks = [j for j, result in enumerate(results) if result is None]
+        return blocks, results, stale_blocks
+
+    def _store(self, lambda_k, blocks, results, stale_blocks, fresh_results):
+        for j, result in zip(stale_blocks, fresh_results):
+            self._block_results[blocks[j]] = (self._slice(blocks[j], lambda_k), result)
+            results[j] = result
+
+        self.hits += len(blocks) - len(stale_blocks)
+        self.misses += len(stale_blocks)
+        self.reused_blocks.append(len(blocks) - len(stale_blocks))
+        self.last_call_cached = len(stale_blocks) == 0
+        return results
+
+    def clear(self):
+        """ Forgets all stored block results (counters are not reset). """
+        self._block_results.clear()
+
+    def close(self):
+        self.separable_oracle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DeadlineSeparableOracle(object):
+    """ Returns within a deadline, even if some blocks of a SeparableOracle are slow, hung, or failing.
+
+    Each query (call to the oracle, or to evaluate_blocks) waits at most deadline seconds for the blocks. Blocks that
+    are late are filled with their last known value and subgradient (possibly evaluated at an earlier lambda), and
+    reported in inexact_blocks; such queries are counted by methods in their inexact_oracle_calls. Methods that
+    tolerate inexact oracles (e.g., the universal methods, through epsilon) keep making progress, instead of stalling
+    on the slowest block.
+
+    - A late block is not evaluated again while it is still running; its result is used as soon as it comes back.
+    - A block evaluation that has been running for more than timeout seconds is considered hung, and is abandoned and
+      resubmitted (the worker itself cannot be interrupted, and stays busy until the evaluation returns); also without
+      a deadline, a query never waits for an evaluation beyond its timeout.
+    - A block evaluation that fails or hangs is retried up to max_retries times per query; when a process pool breaks
+      (e.g., a worker crashed), the pool is restarted.
+    - Blocks that have never been evaluated have no value to fall back on, and are waited for (up to timeout); if they
+      still fail or time out, the error (or a BlockTimeoutError) is raised.
+
+    inexact_blocks and last_call_inexact describe the last query of the calling thread (see module docstring).
+    Counters: late_blocks, failures, retries and timeouts, over all queries.
+    """
+    last_call_inexact = _CallFlag(False)
+    inexact_blocks = _CallFlag(())
+
+    def __init__(self, separable_oracle, deadline, timeout=None, max_retries=1):
+        if separable_oracle.asynchronous:
+            raise ValueError('DeadlineSeparableOracle needs the blocks of the separable oracle to be synchronous.')
+        if deadline is not None and deadline < 0:
+            raise ValueError('deadline should be non-negative (or None, for no deadline).')
+        if timeout is not None and timeout <= 0:
+            raise ValueError('timeout should be positive (or None, for no timeout).')
+        if max_retries < 0:
+            raise ValueError('max_retries should be a non-negative integer.')
+        self.separable_oracle = separable_oracle
+        self.deadline = deadline
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.late_blocks = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+        # last result of each block, and evaluations in flight: block -> (future, submission time)
+        self._last_results = {}
+        self._in_flight = {}
+
+    @property
+    def n_blocks(self):
+        return self.separable_oracle.n_blocks
+
+    asynchronous = False
+    aggregate = staticmethod(SeparableOracle.aggregate)
+
+    def __call__(self, lambda_k):
+        return self.aggregate(self.evaluate_blocks(lambda_k))
+
+    def evaluate_blocks(self, lambda_k, blocks=None):
+        """ Same as SeparableOracle.evaluate_blocks, within the deadline (see class docstring). """
+        start = time.perf_counter()
+        # late evaluations outlive the query, while methods update lambda_k in place
+        lambda_k = np.array(lambda_k, dtype=float)
+        blocks = list(range(self.n_blocks)) if blocks is None else list(blocks)
+        retries = dict.fromkeys(blocks, 0)
+
+        # future -> (block, whether it is evaluated at lambda_k, submission time)
+        pending = {}
+        for block in retries:
+            in_flight = self._in_flight.get(block)
+            if in_flight is not None and not self._hung(block, in_flight):
+                pending[in_flight[0]] = (block, False, in_flight[1])
+            else:
+                self._resubmit(block, lambda_k, pending)
+
+        results = {}
+        errors = {}
+        while pending:
+            now = time.perf_counter()
+            timeout = None if self.deadline is None else start + self.deadline - now
+            if timeout is not None and timeout <= 0:
+                break
+            if self.timeout is not None:
+                # also wake up when the first pending evaluation becomes hung
+                expiry = min(submission_time for _, _, submission_time in pending.values()) + self.timeout - now
+                timeout = max(expiry, 0) if timeout is None else max(min(timeout, expiry), 0)
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                block, current, _ = pending.pop(future)
+                if future.exception() is not None:
+                    self.failures += 1
+                    errors[block] = future.exception()
+                    self._retry(block, lambda_k, retries, pending)
+                elif current:
+                    results[block] = future.result()
+                    errors.pop(block, None)
+                else:
+                    # a late block from an earlier query came back: evaluate it at lambda_k
+                    self._resubmit(block, lambda_k, pending)
+            for future, (block, _, submission_time) in list(pending.items()):
+                if future not in done and self._hung(block, (future, submission_time)):
+                    del pending[future]
+                    errors[block] = BlockTimeoutError('Block {} did not return within the timeout ({} s).'.format(
+                        block, self.timeout))
+                    self._retry(block, lambda_k, retries, pending)
+
+        inexact_blocks = []
+        for block in retries:
+            if block in results:
+                continue
+            if block not in self._last_results:
+                results[block] = self._wait_for_first_result(block, lambda_k, errors.get(block))
+                continue
+            inexact_blocks.append(block)
+            results[block] = self._last_results[block][1]
+        self.late_blocks += len(inexact_blocks)
+        self.inexact_blocks = inexact_blocks
+        self.last_call_inexact = len(inexact_blocks) > 0
+
+        return [results[block] for block in blocks]
+
+    def _resubmit(self, block, lambda_k, pending):
+        future, submission_time = self._submit(block, lambda_k)
+        pending[future] = (block, True, submission_time)
+
+    def _retry(self, block, lambda_k, retries, pending):
+        # after a failure or a timeout, within the max_retries of the query
+        if retries[block] < self.max_retries:
+            retries[block] += 1
+            self.retries += 1
+            self._resubmit(block, lambda_k, pending)
+
+    def _wait_for_first_result(self, block, lambda_k, error):
+        # nothing to fall back on: wait for the block, or raise its error
+        in_flight = self._in_flight.get(block)
+        if in_flight is None:
+            if block in self._last_results:  # it just came back
+                return self._last_results[block][1]
+            if error is not None:
+                raise error
+            in_flight = self._submit(block, lambda_k)
+        future, submission_time = in_flight
+        timeout = None if self.timeout is None else submission_time + self.timeout - time.perf_counter()
+        try:
+            return future.result(timeout=max(timeout, 0) if timeout is not None else None)
+        except (FutureTimeoutError, TimeoutError):
+            # concurrent.futures.TimeoutError is the builtin TimeoutError only from Python 3.11
+            self.timeouts += 1
+            self._abandon(block, future)
+            raise BlockTimeoutError('Block {} did not return within the timeout ({} s).'.format(block, self.timeout))
+
+    def _submit(self, block, lambda_k):
+        # returns (future, submission time), which the evaluation may already have removed from _in_flight
+        try:
+            future = self.separable_oracle.submit(block, lambda_k)
+        except BrokenProcessPool:
+            # a worker died: restart the pool (it is created again at the next submission)
+            if not getattr(self.separable_oracle, '_owns_executor', False):
+                raise
+            self.separable_oracle.close()
+            future = self.separable_oracle.submit(block, lambda_k)
+        submission_time = time.perf_counter()
+        self._in_flight[block] = (future, submission_time)
+        future.add_done_callback(lambda f: self._store_result(block, submission_time, f))
+        return future, submission_time
+
+    def _store_result(self, block, submission_time, future):
+        # called from the executor threads
+        if self._in_flight.get(block, (None,))[0] is future:
+            self._in_flight.pop(block, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        # abandoned evaluations may come back after more recent ones
+        if block not in self._last_results or self._last_results[block][0] < submission_time:
+            self._last_results[block] = (submission_time, future.result())
+
+    def _hung(self, block, in_flight):
+        future, submission_time = in_flight
+        if self.timeout is None or time.perf_counter() - submission_time <= self.timeout:
+            return False
+        self.timeouts += 1
+        self._abandon(block, future)
+        return True
+
+    def _abandon(self, block, future):
+        if self._in_flight.get(block, (None,))[0] is future:
+            self._in_flight.pop(block, None)
+        future.cancel()
+
+    def close(self):
+        self.separable_oracle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
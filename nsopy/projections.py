@@ -0,0 +1,302 @@
+""" Projections on common dual domains, to be passed to the methods as projection_function.
+
+Projections are callables, project(lambda_k, out=None): the result is written to out if given (which can be lambda_k
+itself, to project in place), and to a new array otherwise. All of them are vectorized; the simplex and capped
+simplex projections find their threshold by randomized selection, in O(n) expected time, and AffineProjection
+projects on general polyhedral domains A lambda = b, lower <= lambda <= upper, with a factorization computed once.
+
+As with hand-written projection functions, project(0) returns the projection of the origin, when the dimension is
+known (see the Important Remarks of the README); dual_domain_projection() returns the projection on the domains of
+set_dual_domain().
+"""
+import inspect
+
+import numpy as np
+
+# only AffineProjection needs scipy: the methods import this module (see accepts_out), and must not depend on it
+try:
+    import scipy.sparse as sp
+    import scipy.sparse.linalg as spla
+except ImportError:
+    sp = None
+    spla = None
+
+
+class Projection(object):
+    """ Base class of the projections: subclasses implement _project(lambda_k, out). """
+    def __init__(self, dimension=None):
+        self.dimension = dimension
+
+    def __call__(self, lambda_k, out=None):
+        if np.ndim(lambda_k) == 0 and self.dimension is not None:
+            lambda_k = np.zeros(self.dimension)
+        lambda_k = np.asarray(lambda_k, dtype=float)
+        if out is None:
+            out = np.empty_like(lambda_k)
+        self._project(lambda_k, out)
+        return out
+
+    def _project(self, lambda_k, out):
+        raise NotImplementedError()
+
+
+class Free(Projection):
+    """ No constraints. """
+    def _project(self, lambda_k, out):
+        if out is not lambda_k:
+            np.copyto(out, lambda_k)
+
+
+class Box(Projection):
+    """ lower <= lambda <= upper, with scalar or per-coordinate bounds (possibly infinite). """
+    def __init__(self, lower=-np.inf, upper=np.inf, dimension=None):
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        if np.any(self.lower > self.upper):
+            raise ValueError('lower bounds should not exceed upper bounds')
+        if dimension is None and (self.lower.ndim or self.upper.ndim):
+            dimension = np.broadcast(self.lower, self.upper).shape[0]
+        super(Box, self).__init__(dimension)
+
+    def _project(self, lambda_k, out):
+        np.clip(lambda_k, self.lower, self.upper, out=out)
+
+
+class NonnegativeOrthant(Projection):
+    """ lambda_i >= 0 for the coordinates i in indices (all, by default), e.g., for the multipliers of the inequality
+    constraints of a dual with both equality and inequality constraints. indices can be a list of integers, or a
+    boolean mask. """
+    def __init__(self, indices=None, dimension=None):
+        self.mask = None
+        if indices is not None:
+            indices = np.asarray(indices)
+            if indices.dtype == bool:
+                self.mask = indices
+            else:
+                if dimension is None:
+                    raise ValueError('the dimension is required with integer indices')
+                self.mask = np.zeros(dimension, dtype=bool)
+                self.mask[indices] = True
+            dimension = len(self.mask)
+        super(NonnegativeOrthant, self).__init__(dimension)
+
+    def _project(self, lambda_k, out):
+        if self.mask is None:
+            np.maximum(lambda_k, 0.0, out=out)
+        else:
+            np.maximum(lambda_k, 0.0, out=out, where=self.mask)
+            if out is not lambda_k:
+                np.copyto(out, lambda_k, where=~self.mask)
+
+
+class Simplex(Projection):
+    """ lambda >= 0, sum(lambda) = radius. """
+    def __init__(self, radius=1.0, dimension=None, seed=0):
+        if radius <= 0:
+            raise ValueError('radius should be positive')
+        self.radius = float(radius)
+        self.random_state = np.random.RandomState(seed)
+        super(Simplex, self).__init__(dimension)
+
+    def _project(self, lambda_k, out):
+        np.subtract(lambda_k, self._threshold(lambda_k), out=out)
+        np.maximum(out, 0.0, out=out)
+
+    def _threshold(self, v):
+        # the tau with sum(max(v - tau, 0)) = radius, by randomized selection of the smallest entry of the support
+        # (Duchi et al., Efficient projections onto the l1-ball for learning in high dimensions, 2008)
+        candidates = v.ravel()
+        total, count = 0.0, 0
+        while candidates.size:
+            pivot = candidates[self.random_state.randint(candidates.size)]
+            greater = candidates >= pivot
+            greater_total = total + np.sum(candidates[greater])
+            greater_count = count + np.count_nonzero(greater)
+            if greater_total - greater_count*pivot < self.radius:
+                # the entries >= pivot are all in the support
+                total, count = greater_total, greater_count
+                candidates = candidates[~greater]
+            else:
+                candidates = candidates[candidates > pivot]
+        return (total - self.radius)/count
+
+
+class CappedSimplex(Projection):
+    """ 0 <= lambda <= cap, sum(lambda) = total; requires 0 <= total <= n*cap. """
+    def __init__(self, total=1.0, cap=1.0, dimension=None, seed=0):
+        if cap <= 0 or total < 0:
+            raise ValueError('cap should be positive, and total nonnegative')
+        self.total = float(total)
+        self.cap = float(cap)
+        self.random_state = np.random.RandomState(seed)
+        super(CappedSimplex, self).__init__(dimension)
+
+    def _project(self, lambda_k, out):
+        if self.total > lambda_k.size*self.cap:
+            raise ValueError('the capped simplex is empty: total > n*cap')
+        np.subtract(lambda_k, self._threshold(lambda_k), out=out)
+        np.clip(out, 0.0, self.cap, out=out)
+
+    def _threshold(self, v):
+        # the tau with g(tau) = sum(clip(v - tau, 0, cap)) = total; g is piecewise linear and nonincreasing, with
+        # breakpoints v_i and v_i - cap. The interval (low, high) containing tau is narrowed around random
+        # breakpoints, and the coordinates whose breakpoints fall outside of it are summed up: they contribute cap,
+        # 0, or v_i - tau on the whole interval.
+        low, high = -np.inf, np.inf
+        v = v.ravel()
+        constant, linear_total, linear_count = 0.0, 0.0, 0
+        while v.size:
+            breakpoints = np.concatenate([v, v - self.cap])
+            breakpoints = breakpoints[(breakpoints > low) & (breakpoints < high)]
+            if breakpoints.size:
+                tau = breakpoints[self.random_state.randint(breakpoints.size)]
+                g = constant + linear_total - linear_count*tau + np.sum(np.clip(v - tau, 0.0, self.cap))
+                if g >= self.total:
+                    low = tau
+                else:
+                    high = tau
+            at_cap = v - self.cap >= high
+            at_zero = v <= low
+            linear = (v - self.cap <= low) & (v >= high)
+            constant += self.cap*np.count_nonzero(at_cap)
+            linear_total += np.sum(v[linear])
+            linear_count += np.count_nonzero(linear)
+            v = v[~(at_cap | at_zero | linear)]
+        if linear_count:
+            return (constant + linear_total - self.total)/linear_count
+        # g is constant (and equal to total) on (low, high)
+        return low if np.isfinite(low) else high
+
+
+class L2Ball(Projection):
+    """ ||lambda - center||_2 <= radius. """
+    def __init__(self, radius=1.0, center=0.0, dimension=None):
+        if radius < 0:
+            raise ValueError('radius should be nonnegative')
+        self.radius = float(radius)
+        self.center = np.asarray(center, dtype=float)
+        if dimension is None and self.center.ndim:
+            dimension = len(self.center)
+        super(L2Ball, self).__init__(dimension)
+
+    def _project(self, lambda_k, out):
+        np.subtract(lambda_k, self.center, out=out)
+        norm = np.linalg.norm(out)
+        if norm > self.radius:
+            out *= self.radius/norm
+        out += self.center
+
+
+class SumToParam(Projection):
+    """ sum(lambda) = param (the 'sum to param' domain of set_dual_domain()). """
+    def __init__(self, param=0.0, dimension=None):
+        self.param = float(param)
+        super(SumToParam, self).__init__(dimension)
+
+    def _project(self, lambda_k, out):
+        np.subtract(lambda_k, (np.sum(lambda_k) - self.param)/lambda_k.size, out=out)
+
+
+class SumZeroGroups(Projection):
+    """ The coordinates of each group sum to zero, where coordinate j belongs to group j % n_groups (as the copies of
+    the first stage variables of the '2 stage smps' domain, or the pairs (i, i + n/2) of the 'mrf' domain). """
+    def __init__(self, n_groups, dimension=None):
+        if dimension is not None and dimension % n_groups:
+            raise ValueError('the dimension should be a multiple of n_groups')
+        self.n_groups = n_groups
+        self._means = np.zeros(n_groups)
+        super(SumZeroGroups, self).__init__(dimension)
+
+    def _project(self, lambda_k, out):
+        lambda_k = lambda_k.reshape(-1, self.n_groups)
+        np.mean(lambda_k, axis=0, out=self._means)
+        np.subtract(lambda_k, self._means, out=out.reshape(-1, self.n_groups))
+
+
+class AffineProjection(Projection):
+    """ A lambda = b, and optionally lower <= lambda <= upper, for a (sparse) A of full row rank, e.g., the
+    A_eq, b_eq and lower_bounds of nsopy.methods.master_problems.dual_domain_constraints().
+
+    A sparse LU factorization of A A^T is computed once, so that the projection on the affine set (which needs scipy),
+        lambda - A^T (A A^T)^-1 (A lambda - b),
+    takes a product by A and by A^T, and a pair of triangular solves. With bounds, the projection on the intersection
+    is computed by Dykstra's algorithm, alternating projections on the affine set and on the box (only the latter
+    needs Dykstra's correction), until the iterate moves less than tolerance and is within tolerance of the affine
+    set, or after max_iterations; the result is always within the bounds.
+    """
+    def __init__(self, A, b, lower=None, upper=None, tolerance=1e-9, max_iterations=10000):
+        if sp is None:
+            raise ImportError('scipy is required for affine projections.')
+        self.A = sp.csr_matrix(A, dtype=float)
+        self.b = np.asarray(b, dtype=float).ravel()
+        if self.A.shape[0] != len(self.b):
+            raise ValueError('A and b should have the same number of rows')
+        self.A_T = self.A.T.tocsr()
+        try:
+            self.factorization = spla.splu(sp.csc_matrix(self.A.dot(self.A_T)))
+        except RuntimeError:
+            raise ValueError('A should have full row rank')
+        dimension = self.A.shape[1]
+        if lower is None and upper is None:
+            self.box = None
+        else:
+            self.box = Box(-np.inf if lower is None else lower, np.inf if upper is None else upper,
+                           dimension=dimension)
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.iterations = 0  # Dykstra iterations of the last projection
+        self._affine_point = np.zeros(dimension)
+        self._correction = np.zeros(dimension)
+        self._previous = np.zeros(dimension)
+        super(AffineProjection, self).__init__(dimension)
+
+    def _project_affine(self, lambda_k, out):
+        np.subtract(lambda_k, self.A_T.dot(self.factorization.solve(self.A.dot(lambda_k) - self.b)), out=out)
+
+    def _project(self, lambda_k, out):
+        if self.box is None:
+            self._project_affine(lambda_k, out)
+            return
+        if out is not lambda_k:
+            np.copyto(out, lambda_k)
+        self._correction.fill(0.0)
+        self.iterations = 0
+        while self.iterations < self.max_iterations:
+            self.iterations += 1
+            np.copyto(self._previous, out)
+            self._project_affine(out, self._affine_point)
+            np.add(self._affine_point, self._correction, out=self._correction)
+            self.box._project(self._correction, out)
+            np.subtract(self._correction, out, out=self._correction)
+
+            np.subtract(out, self._previous, out=self._previous)
+            if (np.linalg.norm(self._previous) <= self.tolerance
+                    and np.linalg.norm(self.A.dot(out) - self.b) <= self.tolerance):
+                break
+
+
+def accepts_out(projection_function):
+    """ Whether projection_function can be called as projection_function(lambda_k, out=buffer), as the projections of
+    this module; the methods then project in place (see SolutionMethod._project). """
+    if isinstance(projection_function, Projection):
+        return True
+    try:
+        return 'out' in inspect.signature(projection_function).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def dual_domain_projection(type, dimension, param=0, inner_problem=None):
+    """ Projection on the dual domains of set_dual_domain() (see nsopy.methods.master_problems.dual_domain_constraints).
+    """
+    if type == 'free':
+        return Free(dimension)
+    elif type == 'positive orthant':
+        return NonnegativeOrthant(dimension=dimension)
+    elif type == 'sum to param':
+        return SumToParam(param, dimension=dimension)
+    elif type == '2 stage smps':
+        return SumZeroGroups(inner_problem.n_x, dimension=dimension)
+    elif type == 'mrf':
+        return SumZeroGroups(int(dimension/2), dimension=dimension)
+    raise ValueError('Type of dual domain not recognized.')
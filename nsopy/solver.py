@@ -0,0 +1,161 @@
+# High level entry point: instantiates a method (see nsopy.methods_factory), and iterates it until a budget is
+# exhausted or a stopping criterion is met.
+import time
+
+import numpy as np
+
+from nsopy.certificates import DualityGapCertificate, DEFAULT_CHECK_EVERY
+from nsopy.methods.base import SolutionMethod
+from nsopy.methods_factory import DualMethodsFactory
+
+DEFAULT_MAX_ITERATIONS = 1000
+
+SOLVE_STATUSES = (
+    'max_iterations',  # budgets
+    'max_oracle_calls',
+    'max_time',
+    'converged',  # the method's own stopping criterion (cutting planes and bundle methods)
+    'gap',  # stopping criteria
+    'stalled',
+    'subgradient',
+    'interrupted',  # KeyboardInterrupt
+)
+
+
+class SolveResult(object):
+    """ Outcome of solve().
+
+    - status: the budget or criterion that ended the run (see SOLVE_STATUSES)
+    - lambda_best, d_best, x_best: the best point queried (methods are not monotone, so this is not necessarily the
+      last iterate), its value and inner solution (see SolutionMethod.best)
+    - gap, upper_bound: certified optimality gap of lambda_best and upper bound on the optimum (see
+      nsopy.certificates.DualityGapCertificate), when gap_tolerance is given, and None otherwise
+    - iterations, oracle_calls
+    - total_time, oracle_time, master_time (master problems of the cutting planes and bundle methods),
+      certificate_time and method_time (the rest), in seconds
+    - method: the method, which can be iterated further
+    """
+    def __init__(self, method, status, lambda_best, d_best, x_best, iterations, total_time, master_time,
+                 certificate=None):
+        self.method = method
+        self.status = status
+        self.lambda_best = lambda_best
+        self.d_best = d_best
+        self.x_best = x_best
+        self.iterations = iterations
+        self.oracle_calls = method.oracle_calls
+        self.gap = certificate.gap if certificate is not None else None
+        self.upper_bound = certificate.upper_bound if certificate is not None else None
+
+        self.total_time = total_time
+        self.oracle_time = method.oracle_time
+        self.master_time = master_time
+        self.certificate_time = certificate.check_time if certificate is not None else 0.0
+        self.method_time = total_time - self.oracle_time - self.master_time - self.certificate_time
+
+    def __repr__(self):
+        return 'SolveResult(status={!r}, d_best={}, iterations={}, oracle_calls={}, total_time={:.3f})'.format(
+            self.status, self.d_best, self.iterations, self.oracle_calls, self.total_time)
+
+
+class _StationarityTest(object):
+    # oracle observer (see SolutionMethod.register_oracle_observer): tests the norm of the projected subgradient step
+    # at each point queried
+    def __init__(self, projection_function, tolerance, sense_sign=1.0):
+        self.projection_function = projection_function
+        self.tolerance = tolerance
+        self.sense_sign = sense_sign
+        self.stationary = False
+
+    def oracle_update(self, points, results):
+        for lambda_j, (_, _, diff_d_j) in zip(points, results):
+            # on a free domain, this is the norm of the subgradient
+            step = self.projection_function(lambda_j + self.sense_sign*np.asarray(diff_d_j)) - lambda_j
+            self.stationary = self.stationary or np.linalg.norm(step) <= self.tolerance
+
+
+def solve(inner_problem, method, param=0, max_iterations=DEFAULT_MAX_ITERATIONS, max_oracle_calls=None,
+          max_time=None, gap_tolerance=None, stall_iterations=None, stall_tolerance=0.0, subgradient_tolerance=None,
+          dual_domain='free', dual_domain_param=0, lambda_min=-np.inf, lambda_max=np.inf,
+          gap_check_every=DEFAULT_CHECK_EVERY):
+    """ Maximizes the dual function of inner_problem with method (one of nsopy.methods_factory.AVAILABLE_METHODS,
+    instantiated with param; or an instance of a method, for other options), and returns a SolveResult.
+
+    The run ends as soon as one of the following holds (checked after each iteration):
+    - subgradient_tolerance: a point lambda_j was queried with ||P(lambda_j + diff_d_j) - lambda_j|| below the
+      tolerance, where P is the projection on the dual domain (on a free domain, ||diff_d_j||)
+    - gap_tolerance: the certified gap of the best point is below the tolerance; the gap is computed every
+      gap_check_every iterations by a DualityGapCertificate on the dual domain (dual_domain, dual_domain_param, as
+      in set_dual_domain(), within the box lambda_min <= lambda <= lambda_max)
+    - the method found an optimum by its own criterion (cutting planes and bundle methods)
+    - stall_iterations: the best value has not improved by more than stall_tolerance in as many iterations (counted
+      from the first point queried with a finite value); this needs a method whose iterates are all exactly
+      evaluated (see SolutionMethod.exact_oracle_results), and a ValueError is raised otherwise
+    - max_iterations, max_oracle_calls or max_time (in seconds) have been reached
+    A KeyboardInterrupt also ends the run, with the best point found until then (the method may then be left in the
+    middle of an iteration).
+    """
+    if isinstance(method, SolutionMethod):
+        dual_method = method
+    else:
+        dual_method = DualMethodsFactory(inner_problem, method, param=param)
+        if dual_domain != 'free' and hasattr(dual_method, 'set_dual_domain'):
+            dual_method.set_dual_domain(type=dual_domain, param=dual_domain_param)
+    if stall_iterations is not None and not dual_method.exact_oracle_results:
+        raise ValueError('stall_iterations cannot be used with {}, which steps along estimates of the dual function '
+                         'and only passes occasional exact evaluations to its best point '
+                         '(see SolutionMethod.exact_oracle_results)'.format(type(dual_method).__name__))
+
+    stationarity = None
+    if subgradient_tolerance is not None:
+        stationarity = _StationarityTest(dual_method.projection_function, subgradient_tolerance,
+                                         sense_sign=dual_method.sense_sign)
+        dual_method.register_oracle_observer(stationarity)
+    certificate = None
+    if gap_tolerance is not None:
+        certificate = DualityGapCertificate(dual_method, lambda_min=lambda_min, lambda_max=lambda_max,
+                                            check_every=gap_check_every, tolerance=gap_tolerance)
+        certificate.set_dual_domain(type=dual_domain, param=dual_domain_param)
+
+    start = time.time()
+    iterations = 0
+    master_time = 0.0
+    d_stall, stall_iteration = -np.inf, 0
+    status = None
+    while status is None:
+        try:
+            dual_method.dual_step()
+        except KeyboardInterrupt:
+            status = 'interrupted'
+            break
+        iterations += 1
+        master_time += getattr(dual_method, 'master_solve_time', 0.0)
+        d_best = dual_method.sense_sign*dual_method.best.d_best  # in the sense of the maximization
+        if d_best > d_stall + stall_tolerance or not np.isfinite(d_stall):
+            d_stall, stall_iteration = d_best, iterations
+
+        if stationarity is not None and stationarity.stationary:
+            status = 'subgradient'
+        elif certificate is not None and certificate.certified:
+            status = 'gap'
+        elif not getattr(dual_method, 'optimizer_not_yet_found', True):
+            status = 'converged'
+        elif stall_iterations is not None and iterations - stall_iteration >= stall_iterations:
+            status = 'stalled'
+        elif max_iterations is not None and iterations >= max_iterations:
+            status = 'max_iterations'
+        elif max_oracle_calls is not None and dual_method.oracle_calls >= max_oracle_calls:
+            status = 'max_oracle_calls'
+        elif max_time is not None and time.time() - start >= max_time:
+            status = 'max_time'
+
+    if stationarity is not None:
+        dual_method.remove_oracle_observer(stationarity)
+    if certificate is not None:
+        if status != 'gap':
+            certificate.check()  # the gap at the end of the run
+        dual_method.remove_observer(certificate)
+        dual_method.remove_oracle_observer(certificate)
+    d_best, lambda_best, x_best = dual_method.best.snapshot()
+    return SolveResult(dual_method, status, lambda_best, d_best, x_best, iterations, time.time() - start, master_time,
+                       certificate=certificate)
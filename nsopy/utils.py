@@ -1,17 +1,41 @@
 import datetime
+import inspect
 import pandas as pd
 from ast import literal_eval
 
+from nsopy.oracles import find_batch_oracle
+
 
 def invert_oracle_sense(oracle):
     def inverted_oracle(lambda_k):
-        x_k, d_k, diff_d_k = oracle(lambda_k)
+        result = oracle(lambda_k)
+        if inspect.isawaitable(result):
+            # asynchronous oracle (see SolutionMethod.dual_step_async)
+            return _invert_awaitable_oracle_result(result)
+        x_k, d_k, diff_d_k = result
 
         return x_k, -d_k, -diff_d_k
 
+    inverted_oracle.__wrapped__ = oracle  # gives access to the original oracle (see nsopy.oracles.unwrap_oracle)
+
+    oracle_batch = find_batch_oracle(oracle)
+    if oracle_batch is not None:
+        def inverted_oracle_batch(Lambda):
+            X, D, diff_D = oracle_batch(Lambda)
+
+            return X, -D, -diff_D
+
+        inverted_oracle.oracle_batch = inverted_oracle_batch
+
     return inverted_oracle
 
 
+async def _invert_awaitable_oracle_result(result):
+    x_k, d_k, diff_d_k = await result
+
+    return x_k, -d_k, -diff_d_k
+
+
 def record_logger(logger, filename=r'logger_record.csv'):
     """ Records the information contained in a method logger into a csv. """
     inner_problem = logger.method.oracle.__self__
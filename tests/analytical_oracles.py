@@ -3,6 +3,8 @@ from __future__ import print_function
 """ Small analytical models to test dual solvers. """
 import numpy as np
 
+from nsopy.projections import Box, SumToParam
+
 
 class OneDimensionalProblem:
     def __init__(self):
@@ -95,6 +97,19 @@ class AnalyticalExampleInnerProblem(object):
 
         return x_k, d_k, diff_d_k
 
+    def oracle_batch(self, Lambda):
+        # vectorized version of the oracle above, evaluated at each row of Lambda
+        C = np.column_stack([- 0.5 - 0.5*Lambda[:, 0] + Lambda[:, 1],
+                             - 1 - 0.5*Lambda[:, 0] + Lambda[:, 1],
+                             + 1 - Lambda[:, 0]])
+        X = (C < 0).astype(float)
+
+        diff_D = np.column_stack([1 - 0.5*X[:, 0] - 0.5*X[:, 1] - X[:, 2],
+                                  X[:, 0] + X[:, 1] - 1])
+        D = np.sum(C*X, axis=1) + Lambda[:, 0] - Lambda[:, 1]
+
+        return X, D, diff_D
+
     def projection_function(self, lambda_k):
         if lambda_k is 0:
             return np.zeros(self.dimension)
@@ -105,6 +120,36 @@ class AnalyticalExampleInnerProblem(object):
         pass
 
 
+class SeparableAnalyticalExampleInnerProblem(object):
+    """
+    Same dual function as AnalyticalExampleInnerProblem, written as a sum of independent blocks: one per inner
+    variable x1, x2, x3, plus the linear term lambda_1 - lambda_2, i.e.,
+        d(lambda) = sum_j min_{x_j} c_j(lambda)*x_j + lambda_1 - lambda_2
+    """
+    def __init__(self):
+        self.dimension = 2
+        self.n_blocks = 4
+
+    def block_oracle(self, block_id, lambda_k):
+        # derivatives of the cost coefficients c_j(lambda) with respect to lambda
+        c_0 = np.array([-0.5, -1, 1], dtype=float)
+        diff_c = np.array([[-0.5, 1], [-0.5, 1], [-1, 0]], dtype=float)
+
+        if block_id == 3:
+            return np.zeros(0), lambda_k[0] - lambda_k[1], np.array([1, -1], dtype=float)
+
+        c_j = c_0[block_id] + np.dot(diff_c[block_id], lambda_k)
+        x_j = 1.0 if c_j < 0 else 0.0
+
+        return np.array([x_j]), c_j*x_j, x_j*diff_c[block_id]
+
+    def oracle(self, lambda_k):
+        return AnalyticalExampleInnerProblem().oracle(lambda_k)
+
+    def projection_function(self, lambda_k):
+        return np.maximum(lambda_k, 0)
+
+
 class SecondAnalyticalExampleInnerProblem(object):
     """
     This example has 1 equality and 1 inequality.
@@ -159,6 +204,18 @@ class SecondAnalyticalExampleInnerProblem(object):
 
         return x_k, d_k, diff_d_k
 
+    def oracle_batch(self, Lambda):
+        # vectorized version of the oracle above, evaluated at each row of Lambda
+        C = np.column_stack([- 1 + Lambda[:, 0] + Lambda[:, 1],
+                             - 1 + Lambda[:, 0] - Lambda[:, 1]])
+        X = (C < 0).astype(float)
+
+        diff_D = np.column_stack([X[:, 0] + X[:, 1] - 1,
+                                  X[:, 0] - X[:, 1] + 0.5])
+        D = np.sum(C*X, axis=1) - Lambda[:, 0] + 0.5*Lambda[:, 1]
+
+        return X, D, diff_D
+
     def projection_function(self, lambda_k):
         # simply project lambda_k[0] on the positive orthant; lambda_k[1] free
         return np.array([np.maximum(lambda_k[0], 0), lambda_k[1]])
@@ -242,9 +299,8 @@ class ConstrainedDualAnalyticalExampleInnerProblem(object):
 
         return x_k, d_k, diff_d_k
 
-    def projection_function(self, lambda_k):
-        # simply project lambda_k[0] on the positive orthant; lambda_k[1] free
-        return np.array([(lambda_k[0]-lambda_k[1])/float(2) + 0.25, (lambda_k[1]-lambda_k[0])/float(2) + 0.25])
+    # the dual domain is lambda_1 + lambda_2 = 0.5
+    projection_function = staticmethod(SumToParam(0.5, dimension=2))
 
 
 class BertsekasCounterExample(object):
@@ -275,6 +331,5 @@ class BertsekasCounterExample(object):
         # print('queried at {}, f val is {}'.format(x, -f_x))
         return 0, -f_x, -diff_f_x
 
-    def projection_function(self, lambda_k):
-        # projection on the box is simply saturating the entries
-        return np.array([min(max(lambda_k[0], -3), 3), min(max(lambda_k[1], -3), 3)])
+    # projection on the box is simply saturating the entries
+    projection_function = staticmethod(Box(-3, 3, dimension=2))
@@ -0,0 +1,238 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import wait, ALL_COMPLETED
+
+import numpy as np
+import pytest
+
+from nsopy.loggers import GenericDualMethodLogger
+from nsopy.methods import asynchronous
+from nsopy.methods.asynchronous import AsynchronousSubgradientMethod, AsynchronousSGMDoubleSimpleAveraging
+from nsopy.methods.quasi_monotone import SGMDoubleSimpleAveraging
+from nsopy.methods.subgradient import SubgradientMethod
+from nsopy.oracles import SeparableOracle
+from tests.analytical_oracles import AnalyticalExampleInnerProblem, SeparableAnalyticalExampleInnerProblem
+
+
+class SlowSeparableAnalyticalExample(SeparableAnalyticalExampleInnerProblem):
+    """ Separable example where block i takes delays[i] seconds to evaluate. """
+    def __init__(self, delays):
+        super(SlowSeparableAnalyticalExample, self).__init__()
+        self.delays = delays
+
+    def slow_block_oracle(self, block_id, lambda_k):
+        time.sleep(self.delays[block_id])
+        return self.block_oracle(block_id, lambda_k)
+
+
+class FakeClock(object):
+    """ Replaces the time module of nsopy.methods.asynchronous: time only passes when advance() is called. """
+    def __init__(self):
+        self.now = 0.0
+        self.lock = threading.Lock()
+
+    def time(self):
+        with self.lock:
+            return self.now
+
+    def advance(self, seconds):
+        with self.lock:
+            self.now += seconds
+
+
+class GatedSeparableOracle(SeparableOracle):
+    """ Separable oracle whose gated blocks are only evaluated once the method waits for all of them, i.e., when
+    wait(..., return_when=ALL_COMPLETED) is called on their evaluations (see gated_wait()). """
+    def __init__(self, block_function, block_ids, gated_blocks):
+        super(GatedSeparableOracle, self).__init__(block_function=self._gated_block_function, block_ids=block_ids)
+        self.gated_function = block_function
+        self.gated_blocks = gated_blocks
+        self.gates = {}
+
+    def submit(self, block_id, lambda_k):
+        gate = threading.Event()
+        future = super(GatedSeparableOracle, self).submit(block_id, (gate, lambda_k))
+        if block_id in self.gated_blocks:
+            self.gates[future] = gate
+        else:
+            gate.set()
+        return future
+
+    def _gated_block_function(self, block_id, gated_lambda_k):
+        gate, lambda_k = gated_lambda_k
+        gate.wait()
+        return self.gated_function(block_id, lambda_k)
+
+    def gated_wait(self, futures, timeout=None, return_when=ALL_COMPLETED):
+        if return_when == ALL_COMPLETED:
+            for future in futures:
+                if future in self.gates:
+                    self.gates.pop(future).set()
+        return wait(futures, timeout=timeout, return_when=return_when)
+
+
+class ExactnessChecker(object):
+    """ Oracle observer, checking that the results it is passed are exact evaluations of oracle. """
+    def __init__(self, oracle):
+        self.oracle = oracle
+        self.points = []
+
+    def oracle_update(self, points, results):
+        for lambda_j, (x_j, d_j, diff_d_j) in zip(points, results):
+            exact_x, exact_d, exact_diff_d = self.oracle(lambda_j)
+            np.testing.assert_allclose(d_j, exact_d)
+            np.testing.assert_allclose(diff_d_j, exact_diff_d)
+            np.testing.assert_allclose(x_j, exact_x)
+            self.points.append(np.copy(lambda_j))
+
+
+def run_dual_steps(dual_method, n_iterations, use_async):
+    if use_async:
+        async def dual_steps():
+            for iteration in range(n_iterations):
+                await dual_method.dual_step_async()
+        asyncio.run(dual_steps())
+    else:
+        for iteration in range(n_iterations):
+            dual_method.dual_step()
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+@pytest.mark.parametrize('async_method_class, method_class, parameters', [
+    (AsynchronousSubgradientMethod, SubgradientMethod, dict(stepsize_rule='1/sqrt(k)')),
+    (AsynchronousSGMDoubleSimpleAveraging, SGMDoubleSimpleAveraging, dict(gamma=0.5)),
+])
+def test_zero_staleness_reproduces_synchronous_method(async_method_class, method_class, parameters, use_async):
+    print('# Test {} with max_staleness=0 against {} (dual_step_async: {})'.format(
+        async_method_class.__name__, method_class.__name__, use_async))
+    inner_problem = SlowSeparableAnalyticalExample(delays=[0.01, 0., 0.002, 0.])
+
+    with SeparableOracle(block_function=inner_problem.slow_block_oracle,
+                         block_ids=range(inner_problem.n_blocks)) as separable_oracle:
+        async_method = async_method_class(separable_oracle, inner_problem.projection_function, dimension=2,
+                                          max_staleness=0, sense='max', **parameters)
+        async_logger = GenericDualMethodLogger(async_method)
+        checker = ExactnessChecker(inner_problem.oracle)
+        async_method.register_oracle_observer(checker)
+        run_dual_steps(async_method, 10, use_async)
+        async_method.close()
+
+    method = method_class(inner_problem.oracle, inner_problem.projection_function, dimension=2, sense='max',
+                          **parameters)
+    logger = GenericDualMethodLogger(method)
+    for iteration in range(10):
+        method.dual_step()
+
+    np.testing.assert_allclose(async_logger.lambda_k_iterates, logger.lambda_k_iterates)
+    np.testing.assert_allclose(async_logger.d_k_iterates, logger.d_k_iterates)
+    assert async_method.max_observed_staleness == 0
+    # every iterate is an exact evaluation, passed on to the oracle observers
+    np.testing.assert_allclose(checker.points, async_logger.lambda_k_iterates)
+    assert method.best.d_best == max(logger.d_k_iterates)
+    np.testing.assert_allclose(async_method.best.d_best, method.best.d_best)
+    assert async_method.oracle_time >= async_method.wait_time > 0
+
+
+@pytest.mark.parametrize('max_staleness', [1, 3])
+def test_staleness_is_bounded(max_staleness, monkeypatch):
+    print('# Test Asynchronous Subgradient Method staleness bound ({})'.format(max_staleness))
+    # block 0 only returns when the method has to wait for it, i.e., when its result would otherwise be too stale
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+
+    with GatedSeparableOracle(block_function=inner_problem.block_oracle, block_ids=range(inner_problem.n_blocks),
+                              gated_blocks=[0]) as separable_oracle:
+        monkeypatch.setattr(asynchronous, 'wait', separable_oracle.gated_wait)
+        dual_method = AsynchronousSubgradientMethod(separable_oracle, inner_problem.projection_function, dimension=2,
+                                                    max_staleness=max_staleness, sense='max')
+        checker = ExactnessChecker(AnalyticalExampleInnerProblem().oracle)
+        dual_method.register_oracle_observer(checker)
+        for iteration in range(20):
+            dual_method.dual_step()
+            assert np.all(dual_method.block_staleness <= max_staleness)
+        dual_method.close()
+
+    assert dual_method.max_observed_staleness == max_staleness
+    assert dual_method.oracle_calls == dual_method.block_calls / inner_problem.n_blocks
+    # the stale aggregates are not passed on to the oracle observers, but the exact evaluations are
+    assert 1 <= len(checker.points) < 20
+    assert np.isfinite(dual_method.best.d_best)
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+def test_wait_time(use_async, monkeypatch):
+    print('# Test the wait time of the asynchronous block methods (dual_step_async: {})'.format(use_async))
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    delays = [4., 1., 2., 3.]
+    clock = FakeClock()
+    monkeypatch.setattr(asynchronous, 'time', clock)
+
+    def block_oracle(block_id, lambda_k):
+        clock.advance(delays[block_id])
+        return inner_problem.block_oracle(block_id, lambda_k)
+
+    # the first iteration waits for all the blocks, which only start once the method waits for them
+    with GatedSeparableOracle(block_function=block_oracle, block_ids=range(inner_problem.n_blocks),
+                              gated_blocks=range(inner_problem.n_blocks)) as separable_oracle:
+        monkeypatch.setattr(asynchronous, 'wait', separable_oracle.gated_wait)
+        dual_method = AsynchronousSubgradientMethod(separable_oracle, inner_problem.projection_function, dimension=2,
+                                                    max_staleness=0, sense='max')
+        run_dual_steps(dual_method, 1, use_async)
+        assert dual_method.wait_time == dual_method.oracle_time == sum(delays)
+        dual_method.close()
+
+
+def test_block_idle_time(monkeypatch):
+    print('# Test the idle time of the blocks of the asynchronous block methods')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    delays = [4., 1., 2., 3.]
+    clock = FakeClock()
+    monkeypatch.setattr(asynchronous, 'time', clock)
+
+    def block_oracle(block_id, lambda_k):
+        clock.advance(delays[block_id])
+        return inner_problem.block_oracle(block_id, lambda_k)
+
+    # serial blocks are evaluated as soon as they are dispatched (so the method never waits), one after the other:
+    # after each iteration, block i is idle while the blocks before it are evaluated
+    separable_oracle = SeparableOracle(block_function=block_oracle, block_ids=range(inner_problem.n_blocks),
+                                       executor='serial')
+    dual_method = AsynchronousSubgradientMethod(separable_oracle, inner_problem.projection_function, dimension=2,
+                                                sense='max')
+    for iteration in range(5):
+        dual_method.dual_step()
+
+    assert dual_method.wait_time == 0
+    np.testing.assert_allclose(dual_method.block_idle_time, 5*np.array([0., 4., 5., 7.]))
+
+
+@pytest.mark.parametrize('async_method_class, parameters', [
+    (AsynchronousSubgradientMethod, dict(stepsize_rule='1/k')),
+    (AsynchronousSGMDoubleSimpleAveraging, dict(gamma=0.5)),
+])
+def test_asynchronous_methods_on_separable_analytical_example(async_method_class, parameters):
+    print('# Test {} on Separable Analytical Example'.format(async_method_class.__name__))
+    inner_problem = SlowSeparableAnalyticalExample(delays=[0.004, 0., 0.001, 0.002])
+
+    with SeparableOracle(block_function=inner_problem.slow_block_oracle,
+                         block_ids=range(inner_problem.n_blocks)) as separable_oracle:
+        dual_method = async_method_class(separable_oracle, inner_problem.projection_function, dimension=2,
+                                         max_staleness=3, sense='max', **parameters)
+        for iteration in range(200):
+            dual_method.dual_step()
+        dual_method.close()
+
+    # d(lambda*) = -0.5; the d_k of the asynchronous methods are stale, so d is evaluated at the last iterate (which
+    # depends on the order in which blocks return, hence the loose tolerance)
+    x_k, d_k, diff_d_k = AnalyticalExampleInnerProblem().oracle(dual_method.lambda_k)
+    np.testing.assert_allclose(d_k, -0.5, atol=0.1)
+
+
+def test_asynchronous_method_input_validation():
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    separable_oracle = SeparableOracle(block_function=inner_problem.block_oracle,
+                                       block_ids=range(inner_problem.n_blocks), executor='serial')
+    with pytest.raises(ValueError):
+        AsynchronousSubgradientMethod(separable_oracle, inner_problem.projection_function, max_staleness=-1)
+    with pytest.raises(ValueError):
+        AsynchronousSubgradientMethod(separable_oracle, inner_problem.projection_function, sense='maximize')
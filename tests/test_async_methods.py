@@ -0,0 +1,156 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from nsopy.loggers import GenericDualMethodLogger
+from nsopy.methods.subgradient import SubgradientMethod
+from nsopy.methods.universal import UniversalPGM, UniversalDGM, UniversalFGM
+from nsopy.methods.quasi_monotone import SGMDoubleSimpleAveraging, SGMTripleAveraging
+from nsopy.oracles import SeparableOracle, CachedOracle
+from tests.analytical_oracles import AnalyticalExampleInnerProblem, SeparableAnalyticalExampleInnerProblem
+
+METHODS = [
+    (SubgradientMethod, dict(sense='max')),
+    (SGMDoubleSimpleAveraging, dict(gamma=0.5, sense='max')),
+    (SGMTripleAveraging, dict(gamma=0.5, sense='max')),
+    (UniversalPGM, dict(epsilon=0.01, sense='max')),
+    (UniversalDGM, dict(epsilon=0.01, sense='max', averaging=True)),
+    (UniversalFGM, dict(epsilon=0.01, sense='max', speculative_trials=3)),
+]
+
+
+class OracleRecorder(object):
+    """ Oracle observer, recording the points it is passed. """
+    def __init__(self):
+        self.points = []
+
+    def oracle_update(self, points, results):
+        self.points.extend(np.copy(lambda_j) for lambda_j in points)
+
+
+class EveryOtherCallInexact(object):
+    """ Reports every other call as inexact, as a DeadlineSeparableOracle with late blocks would. """
+    def __init__(self, oracle):
+        self.oracle = oracle
+        self.calls = 0
+        self.last_call_inexact = False
+
+    def __call__(self, lambda_k):
+        self.calls += 1
+        self.last_call_inexact = self.calls % 2 == 0
+        return self.oracle(lambda_k)
+
+
+class AsyncAnalyticalExample(AnalyticalExampleInnerProblem):
+    """ Asynchronous version of the oracle, as if the inner problem was solved by an external process. """
+    def __init__(self, delay=0.0):
+        super(AsyncAnalyticalExample, self).__init__()
+        self.delay = delay
+
+    async def async_oracle(self, lambda_k):
+        await asyncio.sleep(self.delay)
+        return self.oracle(lambda_k)
+
+
+@pytest.mark.parametrize('method_class, parameters', METHODS)
+def test_dual_step_async_reproduces_dual_step(method_class, parameters):
+    print('# Test dual_step_async of {}'.format(method_class.__name__))
+    inner_problem = AsyncAnalyticalExample()
+
+    sync_method = method_class(inner_problem.oracle, inner_problem.projection_function,
+                               dimension=inner_problem.dimension, **parameters)
+    async_method = method_class(inner_problem.async_oracle, inner_problem.projection_function,
+                                dimension=inner_problem.dimension, **parameters)
+    sync_logger = GenericDualMethodLogger(sync_method)
+    async_logger = GenericDualMethodLogger(async_method)
+
+    async def run():
+        for iteration in range(10):
+            await async_method.dual_step_async()
+
+    for iteration in range(10):
+        sync_method.dual_step()
+    asyncio.run(run())
+
+    np.testing.assert_allclose(async_logger.lambda_k_iterates, sync_logger.lambda_k_iterates)
+    np.testing.assert_allclose(async_logger.d_k_iterates, sync_logger.d_k_iterates)
+    assert async_method.oracle_calls == sync_method.oracle_calls
+
+
+def test_dual_step_with_async_oracle_raises():
+    inner_problem = AsyncAnalyticalExample()
+    method = SubgradientMethod(inner_problem.async_oracle, inner_problem.projection_function, dimension=2)
+
+    with pytest.raises(TypeError):
+        method.dual_step()
+
+    # several points at once, queried one by one or on an executor (without the batched oracle of inner_problem)
+    async def async_oracle(lambda_k):
+        return await inner_problem.async_oracle(lambda_k)
+
+    method = UniversalPGM(async_oracle, inner_problem.projection_function, dimension=2, speculative_trials=3,
+                          sense='max')
+    points = [np.zeros(2), np.ones(2)]
+    with pytest.raises(TypeError):
+        method._evaluate_oracle(points)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        method.oracle_executor = executor
+        with pytest.raises(TypeError):
+            method._evaluate_oracle(points)
+
+
+def test_dual_step_async_counts_cached_and_inexact_calls():
+    print('# Test the accounting of cached and inexact oracle calls in dual_step_async')
+    inner_problem = AsyncAnalyticalExample()
+    methods = [UniversalFGM(CachedOracle(inner_problem.oracle), inner_problem.projection_function, dimension=2,
+                            epsilon=0.1, averaging=True, sense='max')
+               for _ in range(2)]
+    for iteration in range(5):
+        methods[0].dual_step()
+        asyncio.run(methods[1].dual_step_async())
+    assert methods[1].cached_oracle_calls == methods[0].cached_oracle_calls > 0
+
+    method = SubgradientMethod(EveryOtherCallInexact(inner_problem.oracle), inner_problem.projection_function,
+                               dimension=2, sense='max')
+    recorder = OracleRecorder()
+    method.register_oracle_observer(recorder)
+    for iteration in range(4):
+        asyncio.run(method.dual_step_async())
+    # inexact results are not passed on to the oracle observers
+    assert method.inexact_oracle_calls == 2
+    assert len(recorder.points) == 2
+
+
+def test_one_event_loop_drives_several_methods_and_blocks_concurrently():
+    print('# Test concurrent asynchronous methods on asynchronous separable oracles')
+    delay = 0.05
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+
+    async def block_oracle(block_id, lambda_k):
+        await asyncio.sleep(delay)
+        return inner_problem.block_oracle(block_id, lambda_k)
+
+    separable_oracle = SeparableOracle(block_function=block_oracle, block_ids=range(inner_problem.n_blocks))
+    assert separable_oracle.asynchronous
+    methods = [UniversalPGM(separable_oracle, inner_problem.projection_function, dimension=2, epsilon=0.01, sense='max',
+                            speculative_trials=2)
+               for _ in range(4)]
+
+    async def run():
+        await asyncio.gather(*[method.dual_step_async() for method in methods])
+
+    start = time.time()
+    asyncio.run(run())
+    elapsed = time.time() - start
+
+    # in its first step, UPGM queries lambda_0, and then a round of trial points (a single one, since the smallest i_k
+    # is among the first speculative_trials); blocks, points and methods are all awaited concurrently
+    assert methods[0].i_k < methods[0].speculative_trials
+    rounds = 2
+    n_sequential_evaluations = sum(method.oracle_calls for method in methods) * inner_problem.n_blocks
+    assert elapsed < rounds * delay + 0.1 < n_sequential_evaluations * delay
+    x_k, d_k, diff_d_k = inner_problem.oracle(methods[0].lambda_hat_k)
+    np.testing.assert_allclose(methods[0].d_hat_k, d_k)
@@ -3,14 +3,23 @@ import sys
 import numpy as np
 import pytest
 
-from nsopy.methods.bundle import BundleMethod
-from nsopy.loggers import EnhancedDualMethodLogger
+from nsopy.methods.bundle import BundleMethod, BundleManager
+from nsopy.methods.cut_pool import CutPool
+from nsopy.methods.master_problems import ScipyMasterProblem, DualQPMasterProblem
+from nsopy.loggers import EnhancedDualMethodLogger, BundleMethodLogger
+from nsopy.oracles import SeparableOracle
 from tests.analytical_oracles import AnalyticalExampleInnerProblem, SecondAnalyticalExampleInnerProblem, \
-    ConstrainedDualAnalyticalExampleInnerProblem
+    ConstrainedDualAnalyticalExampleInnerProblem, SeparableAnalyticalExampleInnerProblem
 
+MASTER_PROBLEMS = [
+    pytest.param('gurobi', marks=pytest.mark.skipif('gurobipy' not in sys.modules,
+                                                    reason="requires the Gurobipy library")),
+    'scipy',
+]
 
-@pytest.mark.skipif('gurobipy' not in sys.modules, reason="requires the Gurobipy library")
-def test_bundle_method_on_analytical_example():
+
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_bundle_method_on_analytical_example(master_problem):
     print('# Test Bundle Method on Analytical Example (2 ineq)')
     # see definition of AnalyticalExampleInnerProblem for problem and solution statement
     analytical_inner_problem = AnalyticalExampleInnerProblem()
@@ -19,7 +28,8 @@ def test_bundle_method_on_analytical_example():
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
                                epsilon=0.01,
-                               sense='max')
+                               sense='max',
+                               master_problem=master_problem)
 
     dual_method.set_dual_domain(type='positive orthant', param=0.5)
 
@@ -40,8 +50,8 @@ def test_bundle_method_on_analytical_example():
     np.testing.assert_allclose(logger.d_k_iterates[-1], -0.5, atol=0.02)
 
 
-@pytest.mark.skipif('gurobipy' not in sys.modules, reason="requires the Gurobipy library")
-def test_bundle_method_on_second_analytical_example():
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_bundle_method_on_second_analytical_example(master_problem):
     print('# Test Bundle Method on Second Analytical Example (1 eq, 1 ineq)')
     # see definition of AnalyticalExampleInnerProblem for problem and solution statement
     analytical_inner_problem = SecondAnalyticalExampleInnerProblem()
@@ -50,7 +60,8 @@ def test_bundle_method_on_second_analytical_example():
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
                                epsilon=0.01,
-                               sense='max')
+                               sense='max',
+                               master_problem=master_problem)
 
     logger = EnhancedDualMethodLogger(dual_method)
 
@@ -65,8 +76,8 @@ def test_bundle_method_on_second_analytical_example():
     np.testing.assert_allclose(logger.d_k_iterates[-1], -1.02, atol=0.02)
 
 
-@pytest.mark.skipif('gurobipy' not in sys.modules, reason="requires the Gurobipy library")
-def test_bundle_method_on_third_analytical_example():
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_bundle_method_on_third_analytical_example(master_problem):
     print('# Test Bundle Method on Constrained Dual Analytical Example')
     # see definition of AnalyticalExampleInnerProblem for problem and solution statement
     analytical_inner_problem = ConstrainedDualAnalyticalExampleInnerProblem()
@@ -75,7 +86,8 @@ def test_bundle_method_on_third_analytical_example():
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
                                epsilon=0.01,
-                               sense='max')
+                               sense='max',
+                               master_problem=master_problem)
 
     dual_method.set_dual_domain(type='sum to param', param=0.5)
     dual_method.lambda_k = dual_method.projection_function(np.array([-2,2]))
@@ -92,4 +104,265 @@ def test_bundle_method_on_third_analytical_example():
     assert 0 <= lambda_star[0] <= 0.5
     assert abs(lambda_star[1] - (0.5 - lambda_star[0])) <= 0.01  # should have: lambda_0 + lambda_1 = 0.5
     # with value close to dual optimum
-    np.testing.assert_allclose(logger.d_k_iterates[-1], -1.0, atol=0.01)
\ No newline at end of file
+    np.testing.assert_allclose(logger.d_k_iterates[-1], -1.0, atol=0.01)
+
+def test_bundle_method_with_master_problem_instance():
+    print('# Test Bundle Method with a user supplied master problem')
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+    master_problem = ScipyMasterProblem(analytical_inner_problem.dimension)
+
+    dual_method = BundleMethod(analytical_inner_problem.oracle,
+                               analytical_inner_problem.projection_function,
+                               dimension=analytical_inner_problem.dimension,
+                               sense='max',
+                               master_problem=master_problem)
+    dual_method.set_dual_domain(type='positive orthant')
+    for iteration in range(10):
+        dual_method.dual_step()
+
+    assert dual_method.master_problem is master_problem
+    assert len(master_problem.slopes) == dual_method.oracle_calls
+    np.testing.assert_allclose(dual_method.d_k, -0.5, atol=0.02)
+
+    with pytest.raises(ValueError):
+        BundleMethod(analytical_inner_problem.oracle, analytical_inner_problem.projection_function,
+                     dimension=analytical_inner_problem.dimension, master_problem='cplex')
+    with pytest.raises(ValueError):
+        dual_method.set_dual_domain(type='simplex')
+
+
+def test_bundle_method_with_dual_qp_master_problem():
+    print('# Test Bundle Method with the dual QP master problem, against the scipy one')
+    analytical_inner_problem = SecondAnalyticalExampleInnerProblem()
+    methods = [BundleMethod(analytical_inner_problem.oracle,
+                            analytical_inner_problem.projection_function,
+                            dimension=analytical_inner_problem.dimension,
+                            epsilon=0.01,
+                            sense='max',
+                            master_problem=master_problem) for master_problem in ['dual qp', 'scipy']]
+    loggers = [EnhancedDualMethodLogger(method) for method in methods]
+
+    for iteration in range(5):
+        for method in methods:
+            method.dual_step()
+
+    np.testing.assert_allclose(loggers[0].lambda_k_iterates, loggers[1].lambda_k_iterates, atol=1e-5)
+    np.testing.assert_allclose(loggers[0].lambda_k_iterates[-1], np.array([1, 0]), atol=0.01)
+
+    with pytest.raises(ValueError):
+        methods[0].set_dual_domain(type='positive orthant')
+
+
+def test_dual_qp_master_problem_matches_primal_qp():
+    print('# Test the dual QP master problem on random bundles, with repeated cuts and more cuts than dimensions')
+    rng = np.random.RandomState(0)
+    for dimension in [3, 40]:
+        dual_qp = DualQPMasterProblem(dimension)
+        # with a (non binding) bound, ScipyMasterProblem solves the primal QP with SLSQP
+        primal_qp = ScipyMasterProblem(dimension, lambda_min=-1e6)
+        center = rng.normal(size=dimension)
+        for cut in range(15):
+            a, b = rng.normal(size=dimension), rng.normal()
+            for master_problem in [dual_qp, primal_qp]:
+                master_problem.add_cut(a, b)
+                if cut % 3 == 0:
+                    master_problem.add_cut(a, b)
+            value, lambda_k = dual_qp.solve(center=center, mu=0.7)
+            expected_value, expected_lambda_k = primal_qp.solve(center=center, mu=0.7)
+
+            np.testing.assert_allclose(value, expected_value, atol=1e-6)
+            np.testing.assert_allclose(lambda_k, expected_lambda_k, atol=1e-4)
+            np.testing.assert_allclose(dual_qp.gram, dual_qp.slopes.dot(dual_qp.slopes.T))
+            if cut % 4 == 0:
+                # serious step: the products with the center are updated in the space of cuts
+                center = lambda_k
+                np.testing.assert_allclose(np.sum(dual_qp.alpha), 1.0)
+
+
+def test_scipy_master_problem_solves_the_dual_qp_on_free_domains():
+    print('# Test the scipy master problem on a free dual domain, with dense and sparse cuts, against SLSQP')
+    rng = np.random.RandomState(1)
+    dimension = 20
+    master_problems = [ScipyMasterProblem(dimension), ScipyMasterProblem(dimension, sparse=True),
+                       ScipyMasterProblem(dimension, lambda_min=-1e6)]
+    center = rng.normal(size=dimension)
+    for cut in range(12):
+        a = rng.normal(size=dimension)*(rng.uniform(size=dimension) < 0.3)
+        b = rng.normal()
+        solutions = []
+        for master_problem in master_problems:
+            master_problem.add_cut(a, b)
+            solutions.append(master_problem.solve(center=center, mu=0.5))
+        for value, lambda_k in solutions[:2]:
+            np.testing.assert_allclose(value, solutions[2][0], atol=1e-6)
+            np.testing.assert_allclose(lambda_k, solutions[2][1], atol=1e-4)
+        # the multipliers of the dual QP, from which the next solve starts, are those of the cuts
+        np.testing.assert_allclose(np.sum(master_problems[0].multipliers), 1.0)
+        np.testing.assert_allclose(master_problems[1].multipliers, master_problems[0].multipliers, atol=1e-9)
+
+
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS + ['dual qp'])
+def test_bundle_method_with_bounded_bundle_size(master_problem):
+    print('# Test Bundle Method with at most 3 cuts in the bundle, and aggregation')
+    analytical_inner_problem = SecondAnalyticalExampleInnerProblem()
+
+    dual_method = BundleMethod(analytical_inner_problem.oracle,
+                               analytical_inner_problem.projection_function,
+                               dimension=analytical_inner_problem.dimension,
+                               epsilon=0.01,
+                               sense='max',
+                               master_problem=master_problem,
+                               max_bundle_size=3,
+                               max_inactive_iterations=2)
+    logger = BundleMethodLogger(dual_method)
+
+    for iteration in range(10):
+        dual_method.dual_step()
+
+    assert max(logger.bundle_size) <= 3
+    assert len(logger.master_solve_time) == 10
+    assert dual_method.bundle_manager.removed_cuts > 0
+    assert len(dual_method.bundle_manager.inactive_iterations) == len(dual_method.bundle)
+    np.testing.assert_allclose(logger.lambda_k_iterates[-1], np.array([1, 0]), atol=0.01)
+    np.testing.assert_allclose(logger.d_k_iterates[-1], -1.02, atol=0.02)
+
+
+def test_bundle_manager_aggregation_and_duplicates():
+    print('# Test the aggregation of active cuts, and the removal of duplicate cuts')
+    master_problem = ScipyMasterProblem(2)
+    bundle = CutPool(2)
+    manager = BundleManager(bundle, master_problem, max_bundle_size=2, remove_duplicate_cuts=True)
+    center = np.zeros(2)
+    # f_hat(lambda) = max(lambda_0, -lambda_0, lambda_1 - 1), minimized (with the proximal term) at 0, where the
+    # first two cuts are active
+    for a, b in [([1.0, 0.0], 0.0), ([-1.0, 0.0], 0.0), ([1.0, 0.0], -1.0), ([0.0, 1.0], -1.0)]:
+        bundle.append((np.array(a), b))
+        manager.add_new_cuts()
+        value, lambda_k = master_problem.solve(center=center, mu=1.0)
+        manager.update()
+
+    # the duplicate (dominated) cut was discarded
+    assert manager.duplicate_cuts == 1
+    # the first two cuts have been replaced by their aggregate, 0.5*(a_0 + a_1) = 0, which keeps lambda = 0 optimal
+    assert len(bundle) == 2
+    assert manager.aggregated_cuts >= 1
+    np.testing.assert_allclose(bundle[-1][0], np.zeros(2), atol=1e-6)
+    value, lambda_k = master_problem.solve(center=center, mu=1.0)
+    np.testing.assert_allclose(lambda_k, np.zeros(2), atol=1e-6)
+    np.testing.assert_allclose(value, 0.0, atol=1e-6)
+
+
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_multi_cut_bundle_method_on_separable_example(master_problem):
+    print('# Test the multi-cut Bundle Method on the Separable Analytical Example')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    oracle = SeparableOracle(block_function=inner_problem.block_oracle, block_ids=range(inner_problem.n_blocks))
+    methods = [BundleMethod(oracle if multi_cut else inner_problem.oracle,
+                            inner_problem.projection_function,
+                            dimension=inner_problem.dimension,
+                            epsilon=0.01,
+                            sense='max',
+                            master_problem=master_problem,
+                            multi_cut=multi_cut) for multi_cut in [True, False]]
+    loggers = [EnhancedDualMethodLogger(method) for method in methods]
+    for method in methods:
+        method.set_dual_domain(type='positive orthant', param=0.5)
+        for iteration in range(10):
+            method.dual_step()
+
+    # one cut per block and oracle call
+    assert len(methods[0].bundle) == inner_problem.n_blocks*methods[0].oracle_calls
+    assert set(methods[0].bundle.blocks) == set(range(inner_problem.n_blocks))
+    for logger in loggers:
+        np.testing.assert_allclose(logger.d_k_iterates[-1], -0.5, atol=0.02)
+    # the disaggregated model is at least as accurate as the aggregated one
+    iterations_to_optimum = [np.flatnonzero(np.abs(np.array(logger.d_k_iterates) + 0.5) <= 0.02)[0]
+                             for logger in loggers]
+    assert iterations_to_optimum[0] <= iterations_to_optimum[1]
+
+    with pytest.raises(ValueError):
+        BundleMethod(inner_problem.oracle, inner_problem.projection_function, dimension=inner_problem.dimension,
+                     multi_cut=True)
+
+
+def test_multi_cut_bundle_method_with_dual_qp_and_bounded_bundle_size():
+    print('# Test the multi-cut Bundle Method with the dual QP master problem, and per-block aggregation')
+    # maximize d(lambda) = -sum_i max_j |a_ij^T lambda - c_ij|
+    rng = np.random.RandomState(0)
+    slopes, offsets = rng.normal(size=(3, 5, 2)), rng.normal(size=(3, 5))
+
+    def block_oracle(block_id, lambda_k):
+        residuals = slopes[block_id].dot(lambda_k) - offsets[block_id]
+        j = np.argmax(np.abs(residuals))
+        return np.zeros(0), -abs(residuals[j]), -np.sign(residuals[j])*slopes[block_id][j]
+
+    oracle = SeparableOracle(block_function=block_oracle, block_ids=range(3))
+    methods = [BundleMethod(oracle if multi_cut else oracle.__call__, lambda lambda_k: lambda_k, dimension=2,
+                            epsilon=0.001, sense='max', master_problem='dual qp', multi_cut=multi_cut,
+                            max_bundle_size=6, max_inactive_iterations=3) for multi_cut in [True, False]]
+    loggers = [BundleMethodLogger(method) for method in methods]
+    for method in methods:
+        for iteration in range(30):
+            method.dual_step()
+
+    assert max(loggers[0].bundle_size) <= 6
+    assert methods[0].bundle_manager.aggregated_cuts > 0
+    np.testing.assert_allclose(methods[0].lambda_hat_k, methods[1].lambda_hat_k, atol=1e-3)
+    np.testing.assert_allclose(methods[0].d_hat_k, methods[1].d_hat_k, atol=1e-3)
+
+    with pytest.raises(ValueError):
+        BundleMethod(oracle, lambda lambda_k: lambda_k, dimension=2, multi_cut=True, max_bundle_size=5)
+
+
+@pytest.mark.parametrize('revalidate', ['evaluate', 'shift'])
+def test_bundle_method_seeded_from_saved_cuts(revalidate, tmp_path):
+    print('# Test seeding a Bundle Method run with the cuts of a previous run, on slightly different data')
+    # maximize d(lambda) = -max_j |a_j^T lambda - c_j| - shift^T lambda, first with shift = 0
+    rng = np.random.RandomState(1)
+    slopes, offsets = rng.normal(size=(8, 3)), rng.normal(size=8)
+
+    def oracle_with(shift):
+        def oracle(lambda_k):
+            residuals = slopes.dot(lambda_k) - offsets
+            j = np.argmax(np.abs(residuals))
+            return 0, -abs(residuals[j]) - shift.dot(lambda_k), -np.sign(residuals[j])*slopes[j] - shift
+        return oracle
+
+    def run(oracle, seed_file=None, **kwargs):
+        dual_method = BundleMethod(oracle, lambda lambda_k: lambda_k, dimension=3, epsilon=1e-4, sense='max',
+                                   master_problem='dual qp', keep_cut_points=True)
+        if seed_file is not None:
+            dual_method.load_cuts(seed_file, **kwargs)
+        for iteration in range(100):
+            dual_method.dual_step()
+            if not dual_method.optimizer_not_yet_found:
+                break
+        return dual_method
+
+    dual_method = run(oracle_with(np.zeros(3)))
+    dual_method.save_cuts(tmp_path / 'cuts.npz')
+
+    shift = np.array([0.05, -0.02, 0.01])
+    cold_start = run(oracle_with(shift))
+    warm_start = run(oracle_with(shift), seed_file=tmp_path / 'cuts.npz', revalidate=revalidate,
+                     slope_shift=-shift)
+
+    np.testing.assert_allclose(warm_start.d_hat_k, cold_start.d_hat_k, atol=1e-3)
+    # with revalidate='evaluate', the oracle calls at the stored points are independent (and batched, if possible)
+    assert warm_start.iteration_number < cold_start.iteration_number
+    if revalidate == 'shift':
+        assert warm_start.oracle_calls < cold_start.oracle_calls
+    # revalidated cuts are valid for the new function
+    for lambda_k in rng.normal(size=(20, 3)):
+        assert np.all(warm_start.bundle.values(lambda_k) <= -oracle_with(shift)(lambda_k)[1] + 1e-9)
+
+    with pytest.raises(ValueError):
+        BundleMethod(oracle_with(shift), lambda lambda_k: lambda_k, dimension=3).load_cuts(tmp_path / 'cuts.npz')
+
+    # without keep_cut_points, the cuts can only be shifted
+    dual_method = BundleMethod(oracle_with(np.zeros(3)), lambda lambda_k: lambda_k, dimension=3, sense='max')
+    dual_method.dual_step()
+    dual_method.save_cuts(tmp_path / 'cuts_without_points.npz')
+    with pytest.raises(ValueError):
+        run(oracle_with(shift), seed_file=tmp_path / 'cuts_without_points.npz', revalidate='evaluate')
+    run(oracle_with(shift), seed_file=tmp_path / 'cuts_without_points.npz', revalidate='shift', slope_shift=-shift)
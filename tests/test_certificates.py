@@ -0,0 +1,74 @@
+import sys
+
+import numpy as np
+import pytest
+
+from nsopy.certificates import DualityGapCertificate
+from nsopy.methods.quasi_monotone import SGMDoubleSimpleAveraging, SGMTripleAveraging
+from nsopy.methods.subgradient import SubgradientMethod
+from nsopy.methods.universal import UniversalPGM, UniversalDGM, UniversalFGM
+from nsopy.oracles import CachedOracle
+from tests.analytical_oracles import AnalyticalExampleInnerProblem
+
+MASTER_PROBLEMS = [
+    pytest.param('gurobi', marks=pytest.mark.skipif('gurobipy' not in sys.modules,
+                                                    reason="requires the Gurobipy library")),
+    'scipy',
+]
+
+
+def _methods_on(inner_problem):
+    common = dict(projection_function=inner_problem.projection_function, dimension=inner_problem.dimension)
+    return {
+        'SG': SubgradientMethod(inner_problem.oracle, stepsize_rule='1/k', sense='max', **common),
+        'UPGM': UniversalPGM(inner_problem.oracle, epsilon=0.01, sense='max', **common),
+        'UDGM': UniversalDGM(inner_problem.oracle, epsilon=0.01, sense='max', **common),
+        'UFGM': UniversalFGM(inner_problem.oracle, epsilon=0.01, sense='max', **common),
+        'DSA': SGMDoubleSimpleAveraging(inner_problem.oracle, gamma=1.0, sense='max', **common),
+        'TA': SGMTripleAveraging(inner_problem.oracle, variant=2, gamma=1.0, sense='max', **common),
+    }
+
+
+@pytest.mark.parametrize('method', ['SG', 'UPGM', 'UDGM', 'UFGM', 'DSA', 'TA'])
+def test_duality_gap_certificate_on_analytical_example(method):
+    print('# Test the duality gap certificate of {} on Analytical Example'.format(method))
+    # see definition of AnalyticalExampleInnerProblem: d* = -0.5, on the positive orthant
+    inner_problem = AnalyticalExampleInnerProblem()
+    dual_method = _methods_on(inner_problem)[method]
+    certificate = DualityGapCertificate(dual_method, lambda_min=0, lambda_max=10, check_every=5, tolerance=0.01)
+    certificate.set_dual_domain(type='positive orthant')
+
+    for iteration in range(200):
+        dual_method.dual_step()
+        # the bounds are valid throughout
+        assert certificate.lower_bound <= -0.5 + 1e-9
+        assert certificate.upper_bound >= -0.5 - 1e-9
+        if certificate.certified:
+            break
+
+    assert certificate.certified
+    assert len(certificate.bundle) == dual_method.oracle_calls
+    d_best = inner_problem.oracle(certificate.best_lambda)[1]
+    np.testing.assert_allclose(d_best, certificate.lower_bound)
+    assert -0.5 - d_best <= certificate.gap + 1e-9
+
+
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_duality_gap_certificate_with_bounded_model(master_problem):
+    print('# Test the duality gap certificate with at most 4 cuts, and without a bounded domain')
+    inner_problem = AnalyticalExampleInnerProblem()
+    dual_method = SubgradientMethod(CachedOracle(inner_problem.oracle), inner_problem.projection_function,
+                                    dimension=inner_problem.dimension, sense='max')
+    certificate = DualityGapCertificate(dual_method, check_every=1, max_cuts=4, master_problem=master_problem)
+
+    dual_method.dual_step()
+    # the model is unbounded on the positive orthant: no certificate yet
+    certificate.set_dual_domain(type='positive orthant')
+    assert certificate.upper_bound == np.inf and not certificate.certified
+
+    certificate.master_problem.upper_bounds[:] = 10.0
+    for iteration in range(30):
+        dual_method.dual_step()
+        assert certificate.upper_bound >= -0.5 - 1e-9
+    assert len(certificate.bundle) <= 4
+    assert certificate.gap < 0.1
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from nsopy.methods.bundle import BundleMethod, CuttingPlanesMethod
+from nsopy.methods.cut_pool import CutPool
+from nsopy.loggers import EnhancedDualMethodLogger
+from tests.analytical_oracles import AnalyticalExampleInnerProblem, SecondAnalyticalExampleInnerProblem
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_cut_pool_operations(sparse):
+    print('# Test adding, removing and evaluating cuts of a CutPool')
+    rng = np.random.RandomState(0)
+    dimension = 6
+    pool = CutPool(dimension, sparse=sparse, capacity=2)
+    cuts = []
+    for j in range(9):
+        a = rng.normal(size=dimension)*(rng.uniform(size=dimension) < 0.5)
+        b = rng.normal()
+        pool.add_cut(sp.csr_matrix(a) if sparse and j % 2 else a, b)
+        cuts.append((a, b))
+
+    def dense(a):
+        return a.toarray().ravel() if sp.issparse(a) else a
+
+    lambda_k = rng.normal(size=dimension)
+    assert len(pool) == 9
+    np.testing.assert_allclose(pool.values(lambda_k), [a.dot(lambda_k) + b for a, b in cuts])
+    np.testing.assert_allclose(pool.evaluate(lambda_k), max(a.dot(lambda_k) + b for a, b in cuts))
+
+    pool.remove([0, 4, 5])
+    cuts = [cut for j, cut in enumerate(cuts) if j not in [0, 4, 5]]
+    last = pool.pop()
+    np.testing.assert_allclose(dense(last[0]), cuts.pop()[0])
+    for (a, b), (expected_a, expected_b) in zip(pool, cuts):
+        np.testing.assert_allclose(dense(a), expected_a)
+        assert b == expected_b
+
+    weights = np.full(len(cuts), 1.0/len(cuts))
+    a_bar, b_bar = pool.aggregate(weights)
+    np.testing.assert_allclose(a_bar, sum(a for a, _ in cuts)/len(cuts))
+    np.testing.assert_allclose(b_bar, sum(b for _, b in cuts)/len(cuts))
+
+    pool.append(cuts[2])
+    np.testing.assert_array_equal(pool.find_slope(cuts[2][0]), [2, len(cuts)])
+    assert len(pool.find_slope(np.ones(dimension))) == 0
+
+
+@pytest.mark.parametrize('master_problem', ['scipy', 'dual qp'])
+def test_bundle_method_with_sparse_cuts(master_problem):
+    print('# Test Bundle Method storing the cuts in CSR format')
+    analytical_inner_problem = SecondAnalyticalExampleInnerProblem()
+    methods = [BundleMethod(analytical_inner_problem.oracle,
+                            analytical_inner_problem.projection_function,
+                            dimension=analytical_inner_problem.dimension,
+                            epsilon=0.01,
+                            sense='max',
+                            master_problem=master_problem,
+                            sparse_cuts=sparse_cuts) for sparse_cuts in [True, False]]
+    loggers = [EnhancedDualMethodLogger(method) for method in methods]
+
+    for iteration in range(5):
+        for method in methods:
+            method.dual_step()
+
+    assert sp.issparse(methods[0].bundle.slopes)
+    np.testing.assert_allclose(loggers[0].lambda_k_iterates, loggers[1].lambda_k_iterates, atol=1e-6)
+
+
+def test_cp_method_with_sparse_cuts():
+    print('# Test Cutting Plane Method storing the cuts in CSR format')
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+    dual_method = CuttingPlanesMethod(analytical_inner_problem.oracle,
+                                      analytical_inner_problem.projection_function,
+                                      dimension=analytical_inner_problem.dimension,
+                                      epsilon=0.01,
+                                      sense='max',
+                                      master_problem='scipy',
+                                      sparse_cuts=True)
+    logger = EnhancedDualMethodLogger(dual_method)
+
+    for iteration in range(10):
+        dual_method.dual_step()
+
+    np.testing.assert_allclose(logger.d_k_iterates[-1], -0.5, atol=0.02)
+    assert sp.issparse(dual_method.master_problem.slopes)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_cut_pool_save_load_and_shift(sparse, tmp_path):
+    print('# Test writing and reading a CutPool, and shifting its cuts')
+    rng = np.random.RandomState(0)
+    dimension = 5
+    pool = CutPool(dimension, sparse=sparse, n_blocks=2, keep_points=True)
+    for j in range(6):
+        a = rng.normal(size=dimension)*(rng.uniform(size=dimension) < 0.5)
+        pool.add_cut(a, rng.normal(), block=j % 2, point=rng.normal(size=dimension) if j < 5 else None)
+
+    pool.save(tmp_path / 'cuts.npz', center=np.ones(dimension))
+    loaded, arrays = CutPool.load(tmp_path / 'cuts.npz')
+    assert (loaded.sparse, loaded.n_blocks, len(loaded)) == (sparse, 2, 6)
+    np.testing.assert_allclose(arrays['center'], np.ones(dimension))
+    lambda_k = rng.normal(size=dimension)
+    np.testing.assert_allclose(loaded.values(lambda_k), pool.values(lambda_k))
+    np.testing.assert_array_equal(loaded.blocks, pool.blocks)
+    np.testing.assert_array_equal(loaded.points, pool.points)  # NaN for the last cut
+    assert loaded.keep_points
+
+    # the cuts of block 1 become cuts of the block plus lambda_0 + 2
+    slopes = np.zeros((2, dimension))
+    slopes[1, 0] = 1.0
+    loaded.shift(slopes=slopes, offsets=[0.0, 2.0])
+    np.testing.assert_allclose(loaded.values(lambda_k),
+                               pool.values(lambda_k) + (pool.blocks == 1)*(lambda_k[0] + 2.0))
+
+
+def test_cut_pool_points():
+    print('# Test that a CutPool keeps the points of its cuts only on request, once per distinct point')
+    rng = np.random.RandomState(0)
+    points = rng.normal(size=(3, 4))
+    pool = CutPool(4)
+    pool.add_cut(rng.normal(size=4), 0.0, point=points[0])
+    assert pool.points is None and pool.unique_points is None
+
+    # the cuts of two blocks share each point
+    pool = CutPool(4, n_blocks=2, capacity=1, keep_points=True)
+    for point in points:
+        for block in range(2):
+            pool.add_cut(rng.normal(size=4), 0.0, block=block, point=point)
+    pool.add_cut(rng.normal(size=4), 0.0)
+    np.testing.assert_array_equal(pool.unique_points, points)
+    assert pool.n_points == 3
+    np.testing.assert_array_equal(pool.points[:6], np.repeat(points, 2, axis=0))
+    assert np.all(np.isnan(pool.points[6]))
+
+    # points without cuts are dropped
+    pool.remove([0, 1, 3])
+    assert pool.n_points == 2
+    np.testing.assert_array_equal(pool.unique_points, points[1:])
+    np.testing.assert_array_equal(pool.points[:3], points[[1, 2, 2]])
+    pool.add_cut(rng.normal(size=4), 0.0, point=points[0])
+    np.testing.assert_array_equal(pool.unique_points, points[[1, 2, 0]])
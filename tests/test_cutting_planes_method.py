@@ -5,20 +5,29 @@ import pytest
 
 from nsopy.loggers import EnhancedDualMethodLogger
 from nsopy.methods.bundle import CuttingPlanesMethod
+from nsopy.oracles import SeparableOracle
 from tests.analytical_oracles import (
     AnalyticalExampleInnerProblem, ConstrainedDualAnalyticalExampleInnerProblem, OneDimensionalProblem,
-    SecondAnalyticalExampleInnerProblem)
+    SecondAnalyticalExampleInnerProblem, SeparableAnalyticalExampleInnerProblem)
 
+MASTER_PROBLEMS = [
+    pytest.param('gurobi', marks=pytest.mark.skipif('gurobipy' not in sys.modules,
+                                                    reason="requires the Gurobipy library")),
+    'scipy',
+]
 
-@pytest.mark.skipif('gurobipy' not in sys.modules, reason="requires the Gurobipy library")
-def test_cp_method_on_one_dimensional_example():
+
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_cp_method_on_one_dimensional_example(master_problem):
     print('# Test Cutting Plane Method on One-Dimensional Example')
     analytical_inner_problem = OneDimensionalProblem()
 
     dual_method = CuttingPlanesMethod(analytical_inner_problem.oracle,
                                       analytical_inner_problem.projection_function,
+                                      dimension=analytical_inner_problem.dimension,
                                       epsilon=0.01,
-                                      sense='min')
+                                      sense='min',
+                                      master_problem=master_problem)
 
     logger = EnhancedDualMethodLogger(dual_method)
 
@@ -33,8 +42,8 @@ def test_cp_method_on_one_dimensional_example():
     assert abs(lambda_star[0] - 2.25) <= 0.01
 
 
-@pytest.mark.skipif('gurobipy' not in sys.modules, reason="requires the Gurobipy library")
-def test_cp_method_on_analytical_example():
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_cp_method_on_analytical_example(master_problem):
     print('# Test Cutting Plane Method on Analytical Example (2 ineq)')
     # see definition of AnalyticalExampleInnerProblem for problem and solution statement
     analytical_inner_problem = AnalyticalExampleInnerProblem()
@@ -43,7 +52,8 @@ def test_cp_method_on_analytical_example():
                                       analytical_inner_problem.projection_function,
                                       dimension=analytical_inner_problem.dimension,
                                       epsilon=0.01,
-                                      sense='max')
+                                      sense='max',
+                                      master_problem=master_problem)
 
     logger = EnhancedDualMethodLogger(dual_method)
 
@@ -62,8 +72,8 @@ def test_cp_method_on_analytical_example():
     np.testing.assert_allclose(logger.d_k_iterates[-1], -0.5, atol=0.02)
 
 
-@pytest.mark.skipif('gurobipy' not in sys.modules, reason="requires the Gurobipy library")
-def test_cp_method_on_second_analytical_example():
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_cp_method_on_second_analytical_example(master_problem):
     print('# Test Cutting Plane Method on Second Analytical Example (1 eq, 1 ineq)')
     # see definition of AnalyticalExampleInnerProblem for problem and solution statement
     analytical_inner_problem = SecondAnalyticalExampleInnerProblem()
@@ -72,7 +82,8 @@ def test_cp_method_on_second_analytical_example():
                                       analytical_inner_problem.projection_function,
                                       dimension=analytical_inner_problem.dimension,
                                       epsilon=0.01,
-                                      sense='max')
+                                      sense='max',
+                                      master_problem=master_problem)
 
     logger = EnhancedDualMethodLogger(dual_method)
 
@@ -87,8 +98,8 @@ def test_cp_method_on_second_analytical_example():
     np.testing.assert_allclose(logger.d_k_iterates[-1], -1.02, atol=0.02)
 
 
-@pytest.mark.skipif('gurobipy' not in sys.modules, reason="requires the Gurobipy library")
-def test_cp_method_on_third_analytical_example():
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_cp_method_on_third_analytical_example(master_problem):
     print('# Test Cutting Plane Method on Constrained Dual Analytical Example')
     # see definition of AnalyticalExampleInnerProblem for problem and solution statement
     analytical_inner_problem = ConstrainedDualAnalyticalExampleInnerProblem()
@@ -97,7 +108,8 @@ def test_cp_method_on_third_analytical_example():
                                       analytical_inner_problem.projection_function,
                                       dimension=analytical_inner_problem.dimension,
                                       epsilon=0.01,
-                                      sense='max')
+                                      sense='max',
+                                      master_problem=master_problem)
     dual_method.set_dual_domain(type='sum to param', param=0.5)
     dual_method.lambda_k = dual_method.projection_function(np.array([-2,2]))
 
@@ -114,3 +126,100 @@ def test_cp_method_on_third_analytical_example():
     assert lambda_star[1] == 0.5 - lambda_star[0]
     # with value close to dual optimum
     np.testing.assert_allclose(logger.d_k_iterates[-1], -1.0, atol=0.01)
+
+
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+def test_cp_method_with_inactive_cut_removal(master_problem):
+    print('# Test Cutting Plane Method on One-Dimensional Example, removing inactive cuts')
+    analytical_inner_problem = OneDimensionalProblem()
+
+    dual_method = CuttingPlanesMethod(analytical_inner_problem.oracle,
+                                      analytical_inner_problem.projection_function,
+                                      dimension=analytical_inner_problem.dimension,
+                                      epsilon=0.01,
+                                      sense='min',
+                                      master_problem=master_problem,
+                                      max_inactive_iterations=3,
+                                      remove_duplicate_cuts=True)
+
+    for iteration in range(10):
+        dual_method.dual_step()
+
+    assert dual_method.bundle_size == len(dual_method.bundle)
+    assert dual_method.bundle_manager.removed_cuts >= 1
+    assert dual_method.bundle_manager.duplicate_cuts >= 1
+    assert dual_method.master_solve_time > 0
+    assert abs(dual_method.lambda_k[0] - 2.25) <= 0.01
+
+
+@pytest.mark.parametrize('master_problem', MASTER_PROBLEMS)
+@pytest.mark.parametrize('sense', ['max', 'min'])
+def test_multi_cut_cp_method_on_separable_example(master_problem, sense):
+    print('# Test the multi-cut Cutting Plane Method on the Separable Analytical Example')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    sign = 1 if sense == 'max' else -1
+
+    def block_oracle(block_id, lambda_k):
+        # with sense='min', the (convex) negative of the dual function is minimized
+        x_i, d_i, diff_d_i = inner_problem.block_oracle(block_id, lambda_k)
+        return x_i, sign*d_i, sign*diff_d_i
+
+    oracle = SeparableOracle(block_function=block_oracle, block_ids=range(inner_problem.n_blocks))
+    dual_method = CuttingPlanesMethod(oracle,
+                                      inner_problem.projection_function,
+                                      dimension=inner_problem.dimension,
+                                      epsilon=0.01,
+                                      search_box_min=0,
+                                      sense=sense,
+                                      master_problem=master_problem,
+                                      multi_cut=True)
+
+    for iteration in range(10):
+        dual_method.dual_step()
+
+    assert len(dual_method.bundle) == inner_problem.n_blocks*dual_method.oracle_calls
+    lambda_star = dual_method.lambda_k
+    assert abs(lambda_star[0] - 1) <= 0.01
+    assert 0.99 <= lambda_star[1] <= 1.51
+    # d_k is the value returned by the oracle
+    np.testing.assert_allclose(dual_method.d_k, sign*(-0.5), atol=0.02)
+
+
+class LateBlockSeparableOracle(SeparableOracle):
+    """ Returns late_block with its value at the first query point, and reports it as inexact, as a
+    DeadlineSeparableOracle does with a hung block. """
+    def __init__(self, inner_problem, late_block):
+        super(LateBlockSeparableOracle, self).__init__(block_function=inner_problem.block_oracle,
+                                                       block_ids=range(inner_problem.n_blocks), executor='serial')
+        self.late_block = late_block
+        self.first_results = None
+        self.inexact_blocks = []
+        self.last_call_inexact = False
+
+    def evaluate_blocks(self, lambda_k, blocks=None):
+        results = super(LateBlockSeparableOracle, self).evaluate_blocks(lambda_k, blocks=blocks)
+        if self.first_results is None:
+            self.first_results = results
+        else:
+            results[self.late_block] = self.first_results[self.late_block]
+            self.inexact_blocks = [self.late_block]
+            self.last_call_inexact = True
+        return results
+
+
+def test_multi_cut_cp_method_leaves_out_inexact_blocks():
+    print('# Test the multi-cut Cutting Plane Method with an inexact separable oracle')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    oracle = LateBlockSeparableOracle(inner_problem, late_block=2)
+    dual_method = CuttingPlanesMethod(oracle, inner_problem.projection_function, dimension=inner_problem.dimension,
+                                      epsilon=0.01, search_box_min=0, sense='max', master_problem='scipy',
+                                      multi_cut=True)
+
+    for iteration in range(5):
+        dual_method.dual_step()
+
+    # after the first query, block 2 is late: its cuts, which would not be valid at the query points, are left out
+    assert dual_method.oracle_calls == 5
+    assert dual_method.inexact_oracle_calls == 4
+    assert len(dual_method.bundle) == inner_problem.n_blocks + (inner_problem.n_blocks - 1)*4
+    assert dual_method.optimizer_not_yet_found
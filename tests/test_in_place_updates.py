@@ -0,0 +1,110 @@
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from nsopy.loggers import GenericDualMethodLogger
+from nsopy.methods.asynchronous import AsynchronousSubgradientMethod, AsynchronousSGMDoubleSimpleAveraging
+from nsopy.methods.quasi_monotone import SGMDoubleSimpleAveraging, SGMTripleAveraging
+from nsopy.methods.subgradient import SubgradientMethod
+from nsopy.methods.universal import UniversalPGM, UniversalDGM, UniversalFGM
+from nsopy.oracles import SeparableOracle
+from nsopy.projections import Box
+from tests.analytical_oracles import SeparableAnalyticalExampleInnerProblem
+
+DIMENSION = 10**5
+
+
+class QuadraticOracle(object):
+    """ d(lambda) = -1/2 ||lambda - c||^2, returning its subgradient in a preallocated buffer. """
+    def __init__(self, dimension):
+        self.c = np.linspace(-1, 1, dimension)
+        self.diff_d_k = np.zeros(dimension)
+
+    def oracle(self, lambda_k):
+        np.subtract(self.c, lambda_k, out=self.diff_d_k)
+        return 0, -0.5*np.dot(self.diff_d_k, self.diff_d_k), self.diff_d_k
+
+
+METHODS = [(SubgradientMethod, dict(sense='max')),
+           (SGMDoubleSimpleAveraging, dict(sense='max')),
+           (SGMTripleAveraging, dict(sense='max')),
+           (UniversalPGM, dict(sense='max')),
+           (UniversalPGM, dict(sense='max', averaging=True, speculative_trials=2)),
+           (UniversalDGM, dict(sense='max')),
+           (UniversalFGM, dict(sense='max'))]
+
+
+@pytest.mark.parametrize('method_class, options', METHODS)
+def test_steps_do_not_allocate(method_class, options):
+    print('# Test that {} steps in place, without allocating arrays of the dimension'.format(method_class.__name__))
+    dual_method = method_class(QuadraticOracle(DIMENSION).oracle, Box(-0.5, 0.5), dimension=DIMENSION, **options)
+    for iteration in range(3):  # work arrays are allocated in the first steps
+        dual_method.dual_step()
+
+    tracemalloc.start()
+    dual_method.dual_step()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < DIMENSION  # bytes, i.e., less than an eighth of an array of the dimension
+
+
+@pytest.mark.parametrize('method_class, options', METHODS)
+def test_in_place_steps_keep_outside_arrays(method_class, options):
+    print('# Test that {} does not modify arrays set from outside, nor logged ones'.format(method_class.__name__))
+    dual_method = method_class(QuadraticOracle(4).oracle, lambda lambda_k: np.clip(lambda_k, -0.5, 0.5), dimension=4,
+                               **options)
+    logger = GenericDualMethodLogger(dual_method)
+    lambda_0 = np.array([0, 1, 0, 1])  # integer, and kept by the caller
+    dual_method.lambda_k = lambda_0
+    for iteration in range(5):
+        dual_method.dual_step()
+
+    assert lambda_0.tolist() == [0, 1, 0, 1]
+    assert len(set(tuple(lambda_k) for lambda_k in logger.lambda_k_iterates)) > 1
+    assert np.all(np.abs(dual_method.lambda_k) <= 0.5)
+
+
+@pytest.mark.parametrize('method_class', [AsynchronousSubgradientMethod, AsynchronousSGMDoubleSimpleAveraging])
+def test_asynchronous_steps_in_place(method_class):
+    print('# Test that {} steps in place, without modifying the points of the evaluations in flight'.format(
+        method_class.__name__))
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    queried_points = []
+
+    def block_oracle(block_id, lambda_k):
+        queried_points.append((lambda_k, lambda_k.copy()))
+        return inner_problem.block_oracle(block_id, lambda_k)
+
+    separable_oracle = SeparableOracle(block_function=block_oracle, block_ids=range(inner_problem.n_blocks),
+                                       executor='serial')
+    dual_method = method_class(separable_oracle, inner_problem.projection_function, dimension=2, sense='max')
+    lambda_0 = np.array([1.0, 1.0])
+    dual_method.lambda_k = lambda_0
+    dual_method.dual_step()
+    lambda_k = dual_method.lambda_k
+    for iteration in range(5):
+        dual_method.dual_step()
+
+    assert dual_method.lambda_k is lambda_k
+    assert lambda_0.tolist() == [1.0, 1.0]
+    for lambda_j, queried_lambda_j in queried_points:
+        np.testing.assert_array_equal(lambda_j, queried_lambda_j)
+
+
+def test_methods_run_without_scipy():
+    print('# Test that the methods, and their in-place projections, do not need scipy')
+    code = ("import sys; sys.modules['scipy'] = None\n"
+            "import numpy as np\n"
+            "from nsopy.methods.subgradient import SubgradientMethod\n"
+            "from nsopy.projections import Box\n"
+            "dual_method = SubgradientMethod(lambda lambda_k: (0, -np.sum(lambda_k**2), -2*lambda_k), Box(0.5, 1.0),\n"
+            "                                dimension=3, sense='max')\n"
+            "for iteration in range(3):\n"
+            "    dual_method.dual_step()\n"
+            "print(dual_method._projection_accepts_out, dual_method.best.d_best)\n")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['True', '-0.75']
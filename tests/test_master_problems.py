@@ -0,0 +1,112 @@
+import types
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+from nsopy.methods import master_problems
+from nsopy.methods.master_problems import GurobiMasterProblem, GUROBI_TIME_LIMIT
+
+GRB_INFINITY = 1e100
+
+
+class FakeVar(object):
+    def __init__(self, obj, lb, ub):
+        self.obj = obj
+        self.lb = lb
+        self.ub = ub
+        self.x = np.nan
+
+
+class FakeMConstr(object):
+    def __init__(self, A, sense, b):
+        self.A = A
+        self.sense = sense
+        self.b = b
+        self.Pi = None
+
+
+class FakeModel(object):
+    """ Stands in for gurobipy.Model in the LP master problems, with Gurobi's conventions; LPs are solved with
+    HiGHS, whose marginals have the same signs as Gurobi's duals (Pi <= 0 for the '<' rows of a minimization). """
+    def __init__(self):
+        self.params = {}
+        self.variables = []
+        self.constraints = []
+        self.ObjVal = None
+
+    def setParam(self, name, value):
+        self.params[name] = value
+
+    def addVar(self, obj=0.0, lb=0.0, ub=GRB_INFINITY, vtype=None, name=''):
+        self.variables.append(FakeVar(obj, lb, ub))
+        return self.variables[-1]
+
+    def update(self):
+        pass
+
+    def addMConstr(self, A, x, sense, b):
+        A = A.toarray() if sp.issparse(A) else np.atleast_2d(A)
+        self.constraints.append(FakeMConstr(A, sense, np.asarray(b, dtype=float)))
+        return self.constraints[-1]
+
+    def remove(self, constraint):
+        self.constraints.remove(constraint)
+
+    def getAttr(self, name, variables):
+        return [{'X': v.x, 'LB': v.lb}[name] for v in variables]
+
+    def setAttr(self, name, variables, values):
+        assert name == 'LB'
+        for v, value in zip(variables, values):
+            v.lb = value
+
+    def optimize(self):
+        def bound(value):
+            return None if abs(value) >= GRB_INFINITY else value
+
+        upper = [c for c in self.constraints if c.sense == '<']
+        equal = [c for c in self.constraints if c.sense == '=']
+        result = linprog([v.obj for v in self.variables],
+                         A_ub=np.vstack([c.A for c in upper]) if upper else None,
+                         b_ub=np.concatenate([c.b for c in upper]) if upper else None,
+                         A_eq=np.vstack([c.A for c in equal]) if equal else None,
+                         b_eq=np.concatenate([c.b for c in equal]) if equal else None,
+                         bounds=[(bound(v.lb), bound(v.ub)) for v in self.variables], method='highs')
+        assert result.status == 0, result.message
+        for v, x in zip(self.variables, result.x):
+            v.x = x
+        marginals = iter(result.ineqlin.marginals)
+        for c in upper:
+            c.Pi = np.array([next(marginals) for _ in c.b])
+        self.ObjVal = result.fun
+
+
+@pytest.fixture
+def fake_gurobi(monkeypatch):
+    gb = types.SimpleNamespace(Model=FakeModel, GRB=types.SimpleNamespace(INFINITY=GRB_INFINITY, CONTINUOUS='C'))
+    monkeypatch.setattr(master_problems, 'gb', gb)
+    return gb
+
+
+def test_gurobi_master_problem_time_limit(fake_gurobi):
+    print('# Test the time limit of the Gurobi master problem')
+    assert GurobiMasterProblem(2).bundle_model.params['TimeLimit'] == GUROBI_TIME_LIMIT == 360
+    assert GurobiMasterProblem(2, time_limit=10).bundle_model.params['TimeLimit'] == 10
+    assert 'TimeLimit' not in GurobiMasterProblem(2, time_limit=None).bundle_model.params
+
+
+@pytest.mark.parametrize('n_blocks', [1, 3])
+def test_gurobi_master_problem_multipliers(fake_gurobi, n_blocks):
+    print('# Test the multipliers of the cuts in the Gurobi master problem ({} blocks)'.format(n_blocks))
+    rng = np.random.RandomState(0)
+    master_problem = GurobiMasterProblem(2, lambda_min=-10, lambda_max=10, n_blocks=n_blocks)
+    blocks = np.arange(12) % n_blocks
+    for block in blocks:
+        master_problem.add_cut(rng.normal(size=2), rng.normal(), block=block)
+    master_problem.solve()
+
+    multipliers = master_problem.multipliers
+    assert np.all(multipliers >= 0)
+    np.testing.assert_allclose(np.bincount(blocks, weights=multipliers), np.ones(n_blocks))
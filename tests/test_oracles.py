@@ -0,0 +1,487 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from nsopy.loggers import GenericDualMethodLogger
+from nsopy.methods.subgradient import SubgradientMethod
+from nsopy.methods.universal import UniversalPGM, UniversalFGM
+from nsopy.oracles import SeparableOracle, SharedMemorySeparableOracle, CachedOracle, LazySeparableOracle, \
+    DeadlineSeparableOracle, BlockTimeoutError, evaluate_batch, find_batch_oracle, last_call_flags
+from nsopy.utils import invert_oracle_sense
+from tests.analytical_oracles import AnalyticalExampleInnerProblem, SecondAnalyticalExampleInnerProblem, \
+    SeparableAnalyticalExampleInnerProblem
+
+LAMBDA_GRID = np.array([[lambda_1, lambda_2] for lambda_1 in np.linspace(-1, 3, 9) for lambda_2 in np.linspace(-1, 3, 9)])
+
+
+def _separable_oracle(executor='thread'):
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    return SeparableOracle(block_function=inner_problem.block_oracle,
+                           block_ids=range(inner_problem.n_blocks),
+                           executor=executor)
+
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_separable_oracle_matches_monolithic_oracle(executor):
+    print('# Test Separable Oracle ({}) against monolithic oracle'.format(executor))
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+
+    with _separable_oracle(executor) as separable_oracle:
+        for lambda_k in [np.array([0., 0.]), np.array([1., 1.2]), np.array([2.5, 0.3])]:
+            x_k, d_k, diff_d_k = separable_oracle(lambda_k)
+            x_k_ref, d_k_ref, diff_d_k_ref = analytical_inner_problem.oracle(lambda_k)
+
+            np.testing.assert_allclose(x_k, x_k_ref)
+            np.testing.assert_allclose(d_k, d_k_ref)
+            np.testing.assert_allclose(diff_d_k, diff_d_k_ref)
+
+
+def test_separable_oracle_with_block_oracles_and_external_executor():
+    print('# Test Separable Oracle with a list of block oracles, on a user supplied pool')
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        separable_oracle = SeparableOracle([analytical_inner_problem.oracle, analytical_inner_problem.oracle],
+                                           executor=pool)
+        lambda_k = np.array([0.5, 0.5])
+        x_k, d_k, diff_d_k = separable_oracle(lambda_k)
+        x_k_ref, d_k_ref, diff_d_k_ref = analytical_inner_problem.oracle(lambda_k)
+
+        np.testing.assert_allclose(x_k, np.concatenate([x_k_ref, x_k_ref]))
+        np.testing.assert_allclose(d_k, 2*d_k_ref)
+        np.testing.assert_allclose(diff_d_k, 2*diff_d_k_ref)
+        # closing the oracle should not shut down a pool it does not own
+        separable_oracle.close()
+        assert pool.submit(int, 1).result() == 1
+
+
+def test_subgradient_method_on_separable_analytical_example():
+    print('# Test Subgradient Method on Separable Analytical Example')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+
+    with _separable_oracle() as separable_oracle:
+        dual_method = SubgradientMethod(separable_oracle,
+                                        inner_problem.projection_function,
+                                        dimension=inner_problem.dimension,
+                                        sense='max')
+        logger = GenericDualMethodLogger(dual_method)
+
+        for iteration in range(10):
+            dual_method.dual_step()
+
+    # same iterates as on the monolithic oracle (see test_subgradient_method_on_analytical_example)
+    np.testing.assert_allclose(logger.lambda_k_iterates[-1], np.array([0.91, 1.]), rtol=1e-2, atol=0)
+    np.testing.assert_allclose(logger.d_k_iterates[-1], -0.54, rtol=1e-2, atol=0)
+
+
+def test_separable_oracle_input_validation():
+    with pytest.raises(ValueError):
+        SeparableOracle()
+    with pytest.raises(ValueError):
+        SeparableOracle(block_function=lambda i, lambda_k: (0, 0, 0))
+    with pytest.raises(ValueError):
+        SeparableOracle([lambda lambda_k: (0, 0, 0)], executor='gpu')
+    with pytest.raises(ValueError):
+        SeparableOracle([lambda lambda_k: (0, 0, 0)], schedule='round robin')
+
+
+class CountingOracle(object):
+    """ Wraps an oracle and counts how many times it is actually evaluated. """
+    def __init__(self, oracle):
+        self.oracle = oracle
+        self.evaluations = 0
+
+    def __call__(self, lambda_k):
+        self.evaluations += 1
+        return self.oracle(lambda_k)
+
+
+def test_cached_oracle_lru_eviction():
+    print('# Test Cached Oracle LRU eviction')
+    counting_oracle = CountingOracle(AnalyticalExampleInnerProblem().oracle)
+    cached_oracle = CachedOracle(counting_oracle, maxsize=2)
+
+    cached_oracle(np.array([0., 0.]))
+    cached_oracle(np.array([1., 0.]))
+    cached_oracle(np.array([-0., 0.]))  # hit (-0.0 == 0.0), and [0, 0] becomes most recently used
+    assert cached_oracle.last_call_cached
+    cached_oracle(np.array([2., 0.]))  # evicts [1, 0]
+    cached_oracle(np.array([0., 0.]))  # hit
+    cached_oracle(np.array([1., 0.]))  # miss
+
+    assert (cached_oracle.hits, cached_oracle.misses) == (2, 4)
+    assert counting_oracle.evaluations == 4
+    assert len(cached_oracle) == 2
+
+
+def test_cached_oracle_with_tolerance():
+    print('# Test Cached Oracle with tolerance based keys')
+    cached_oracle = CachedOracle(AnalyticalExampleInnerProblem().oracle, tolerance=1e-6)
+
+    _, d_k, _ = cached_oracle(np.array([1., 1.]))
+    _, d_k_cached, _ = cached_oracle(np.array([1. + 1e-9, 1. - 1e-9]))
+    assert cached_oracle.hits == 1
+    assert d_k_cached == d_k
+    cached_oracle(np.array([1. + 1e-3, 1.]))
+    assert cached_oracle.misses == 2
+
+
+def test_averaged_UFGM_with_cached_oracle():
+    print('# Test averaged UFGM with a cached oracle: same iterates, fewer oracle evaluations')
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+    counting_oracle = CountingOracle(analytical_inner_problem.oracle)
+
+    dual_methods = [UniversalFGM(oracle,
+                                 analytical_inner_problem.projection_function,
+                                 dimension=analytical_inner_problem.dimension,
+                                 epsilon=0.1, sense='max',
+                                 averaging=True)
+                    for oracle in [analytical_inner_problem.oracle, CachedOracle(counting_oracle)]]
+    loggers = [GenericDualMethodLogger(dual_method) for dual_method in dual_methods]
+
+    for iteration in range(10):
+        for dual_method in dual_methods:
+            dual_method.dual_step()
+
+    uncached_method, cached_method = dual_methods
+    np.testing.assert_allclose(loggers[0].lambda_k_iterates, loggers[1].lambda_k_iterates)
+    np.testing.assert_allclose(loggers[0].d_k_iterates, loggers[1].d_k_iterates)
+
+    # y_k is evaluated in the backtracking loop and then again as the averaged output
+    assert cached_method.oracle_calls == uncached_method.oracle_calls
+    assert cached_method.cached_oracle_calls >= 10
+    assert counting_oracle.evaluations == cached_method.oracle_calls - cached_method.cached_oracle_calls
+
+
+@pytest.mark.parametrize('inner_problem', [AnalyticalExampleInnerProblem(), SecondAnalyticalExampleInnerProblem()])
+def test_batched_oracles_match_oracle(inner_problem):
+    print('# Test batched oracles of the analytical examples')
+    X, D, diff_D = inner_problem.oracle_batch(LAMBDA_GRID)
+
+    for i, lambda_k in enumerate(LAMBDA_GRID):
+        x_k, d_k, diff_d_k = inner_problem.oracle(lambda_k)
+        np.testing.assert_allclose(X[i], x_k)
+        np.testing.assert_allclose(D[i], d_k)
+        np.testing.assert_allclose(diff_D[i], diff_d_k)
+
+    # the fallback, point by point, gives the same stacked results
+    X_loop, D_loop, diff_D_loop = evaluate_batch(CountingOracle(inner_problem.oracle), LAMBDA_GRID)
+    np.testing.assert_allclose(X_loop, X)
+    np.testing.assert_allclose(D_loop, D)
+    np.testing.assert_allclose(diff_D_loop, diff_D)
+
+
+def test_batched_oracle_through_wrappers():
+    print('# Test batched oracle protocol through sense inversion and caching')
+    inner_problem = AnalyticalExampleInnerProblem()
+    X, D, diff_D = inner_problem.oracle_batch(LAMBDA_GRID)
+
+    inverted_oracle = invert_oracle_sense(inner_problem.oracle)
+    _, D_inverted, diff_D_inverted = find_batch_oracle(inverted_oracle)(LAMBDA_GRID)
+    np.testing.assert_allclose(D_inverted, -D)
+    np.testing.assert_allclose(diff_D_inverted, -diff_D)
+
+    cached_oracle = CachedOracle(inner_problem.oracle)
+    cached_oracle(LAMBDA_GRID[0])
+    _, D_cached, diff_D_cached = cached_oracle.oracle_batch(np.vstack([LAMBDA_GRID, LAMBDA_GRID[:3]]))
+    np.testing.assert_allclose(D_cached, np.concatenate([D, D[:3]]))
+    np.testing.assert_allclose(diff_D_cached, np.vstack([diff_D, diff_D[:3]]))
+    assert cached_oracle.misses == len(LAMBDA_GRID)
+    assert cached_oracle.last_batch_cached_calls == 4
+
+
+def test_method_batched_oracle_queries_are_counted():
+    print('# Test oracle calls accounting of batched queries')
+    inner_problem = AnalyticalExampleInnerProblem()
+    cached_oracle = CachedOracle(inner_problem.oracle)
+    dual_method = UniversalPGM(cached_oracle, inner_problem.projection_function, dimension=2, epsilon=0.01, sense='max',
+                               averaging=True, speculative_trials=3)
+
+    for iteration in range(10):
+        dual_method.dual_step()
+
+    assert dual_method.oracle_calls == cached_oracle.hits + cached_oracle.misses
+    assert dual_method.cached_oracle_calls == cached_oracle.hits
+
+
+def test_method_executor_oracle_queries_are_counted():
+    print('# Test oracle calls accounting of queries on an oracle_executor')
+    inner_problem = AnalyticalExampleInnerProblem()
+    cached_oracle = CachedOracle(inner_problem.oracle)
+
+    def oracle(lambda_k):
+        # without a batched version, the points are queried on the oracle_executor
+        return cached_oracle(lambda_k)
+    oracle.__wrapped__ = cached_oracle
+
+    dual_method = UniversalPGM(oracle, inner_problem.projection_function, dimension=2, epsilon=0.01, sense='max',
+                               averaging=True, speculative_trials=3)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        dual_method.oracle_executor = executor
+        for iteration in range(10):
+            dual_method.dual_step()
+
+    assert dual_method.oracle_calls == cached_oracle.hits + cached_oracle.misses
+    assert dual_method.cached_oracle_calls == cached_oracle.hits > 0
+
+
+def test_call_flags_are_per_thread():
+    print('# Test that the flags of the last call of an oracle are kept per thread')
+    cached_oracle = CachedOracle(AnalyticalExampleInnerProblem().oracle)
+    cached_oracle(np.zeros(2))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(lambda: (cached_oracle(np.zeros(2)), last_call_flags(cached_oracle))[1]).result() == \
+            (True, False)
+    assert last_call_flags(cached_oracle) == (False, False)
+
+
+def test_lazy_separable_oracle_reuses_unchanged_blocks():
+    print('# Test Lazy Separable Oracle: same iterates, blocks with unchanged multipliers are reused')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    block_support = [[0, 1], [0, 1], [0], [0, 1]]
+
+    lazy_oracle = LazySeparableOracle(_separable_oracle('serial'), block_support=block_support)
+    dual_methods = [SubgradientMethod(oracle, inner_problem.projection_function, dimension=2, sense='max')
+                    for oracle in [_separable_oracle('serial'), lazy_oracle]]
+    loggers = [GenericDualMethodLogger(dual_method) for dual_method in dual_methods]
+    # the first steps go to lambda_2 = 0, then lambda_2 moves, and then block 2 (depending on lambda_1 only) is reused
+    for dual_method in dual_methods:
+        dual_method.lambda_k = np.array([1., 3.])
+        for iteration in range(10):
+            dual_method.dual_step()
+
+    np.testing.assert_allclose(loggers[0].lambda_k_iterates, loggers[1].lambda_k_iterates)
+    np.testing.assert_allclose(loggers[0].d_k_iterates, loggers[1].d_k_iterates)
+    assert len(lazy_oracle.reused_blocks) == 10
+    assert sum(lazy_oracle.reused_blocks) == lazy_oracle.hits > 0
+    assert lazy_oracle.hits + lazy_oracle.misses == 10 * inner_problem.n_blocks
+
+
+def test_lazy_separable_oracle_with_longest_processing_time_schedule():
+    print('# Test Lazy Separable Oracle over a Separable Oracle with longest processing time first schedule')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    lambda_k = np.array([1., 1.2])
+
+    with SeparableOracle(block_function=inner_problem.block_oracle, block_ids=range(inner_problem.n_blocks),
+                         n_workers=2, schedule='lpt') as separable_oracle:
+        lazy_oracle = LazySeparableOracle(separable_oracle)
+        x_k, d_k, diff_d_k = lazy_oracle(lambda_k)
+        # all the blocks are reused: nothing is scheduled
+        reused_x_k, reused_d_k, reused_diff_d_k = lazy_oracle(lambda_k)
+        assert len(separable_oracle.makespan_history) == 1
+
+    np.testing.assert_allclose(reused_x_k, x_k)
+    np.testing.assert_allclose(reused_d_k, d_k)
+    np.testing.assert_allclose(reused_diff_d_k, diff_d_k)
+    assert lazy_oracle.reused_blocks == [0, inner_problem.n_blocks]
+
+
+def test_lazy_separable_oracle_tolerance():
+    print('# Test Lazy Separable Oracle with tolerance')
+    lazy_oracle = LazySeparableOracle(_separable_oracle('serial'), tolerance=1e-3)
+
+    results = lazy_oracle.evaluate_blocks(np.array([1., 1.]))
+    reused_results = lazy_oracle.evaluate_blocks(np.array([1. + 1e-4, 1.]), blocks=[0, 3])
+    assert lazy_oracle.reused_blocks == [0, 2]
+    assert reused_results[1] is results[3]
+    # small moves are measured from the point the block was evaluated at, so that they do not accumulate
+    assert lazy_oracle.submit(3, np.array([1. + 5e-4, 1.])).result() is results[3]
+    _, d_3, _ = lazy_oracle.submit(3, np.array([1. + 2e-3, 1.])).result()
+    np.testing.assert_allclose(d_3, 2e-3)
+    assert lazy_oracle.submit(0, np.array([1. + 5e-4, 1.])).result() is results[0]
+    assert (lazy_oracle.hits, lazy_oracle.misses) == (4, 5)
+
+
+def test_shared_memory_separable_oracle_matches_monolithic_oracle():
+    print('# Test Shared Memory Separable Oracle against monolithic oracle')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+
+    with SharedMemorySeparableOracle(block_function=inner_problem.block_oracle, block_ids=range(inner_problem.n_blocks),
+                                     dimension=inner_problem.dimension, n_workers=2) as separable_oracle:
+        for lambda_k in [np.array([0., 0.]), np.array([1., 1.2]), np.array([2.5, 0.3])]:
+            x_k, d_k, diff_d_k = separable_oracle(lambda_k)
+            x_k_ref, d_k_ref, diff_d_k_ref = analytical_inner_problem.oracle(lambda_k)
+
+            np.testing.assert_allclose(x_k, x_k_ref)
+            np.testing.assert_allclose(d_k, d_k_ref)
+            np.testing.assert_allclose(diff_d_k, diff_d_k_ref)
+        # lambda_k and the subgradients went through shared memory
+        assert separable_oracle.pickled_calls == 0
+
+        # the same block, possibly in flight at more points than there are lambda slots: falls back to pickling
+        lambdas = [np.array([float(i), 0.]) for i in range(6)]
+        futures = [separable_oracle.submit(0, lambda_k) for lambda_k in lambdas]
+        for future, lambda_k in zip(futures, lambdas):
+            x_i, d_i, diff_d_i = future.result()
+            x_i_ref, d_i_ref, diff_d_i_ref = inner_problem.block_oracle(0, lambda_k)
+            assert d_i == d_i_ref
+            np.testing.assert_allclose(diff_d_i, diff_d_i_ref)
+        assert separable_oracle.pickled_calls <= 5
+
+
+def test_subgradient_method_on_shared_memory_separable_oracle():
+    print('# Test Subgradient Method on Shared Memory Separable Oracle')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+
+    with SharedMemorySeparableOracle(block_function=inner_problem.block_oracle, block_ids=range(inner_problem.n_blocks),
+                                     dimension=inner_problem.dimension) as separable_oracle:
+        dual_method = SubgradientMethod(separable_oracle, inner_problem.projection_function,
+                                        dimension=inner_problem.dimension, sense='max')
+        logger = GenericDualMethodLogger(dual_method)
+        for iteration in range(10):
+            dual_method.dual_step()
+
+    np.testing.assert_allclose(logger.lambda_k_iterates[-1], np.array([0.91, 1.]), rtol=1e-2, atol=0)
+    np.testing.assert_allclose(logger.d_k_iterates[-1], -0.54, rtol=1e-2, atol=0)
+
+
+class DelayedSeparableAnalyticalExample(SeparableAnalyticalExampleInnerProblem):
+    """ Separable example where block i takes delays[i] seconds to evaluate. """
+    def __init__(self, delays):
+        super(DelayedSeparableAnalyticalExample, self).__init__()
+        self.delays = delays
+
+    def delayed_block_oracle(self, block_id, lambda_k):
+        time.sleep(self.delays[block_id])
+        return self.block_oracle(block_id, lambda_k)
+
+
+def test_separable_oracle_longest_processing_time_schedule():
+    print('# Test Separable Oracle with longest processing time first schedule')
+    inner_problem = DelayedSeparableAnalyticalExample(delays=[0.005, 0.04, 0.001, 0.03])
+    lambda_k = np.array([1., 1.2])
+
+    with SeparableOracle(block_function=inner_problem.delayed_block_oracle, block_ids=range(inner_problem.n_blocks),
+                         n_workers=2, schedule='lpt', min_chunk_time=0.01) as separable_oracle:
+        # no timings yet: each block is a task, in the given order
+        assert separable_oracle._lpt_chunks([0, 1, 2, 3]) == [[0], [1], [2], [3]]
+        separable_oracle(lambda_k)
+        assert np.isnan(separable_oracle.predicted_makespan)
+        assert np.all(separable_oracle.block_times >= inner_problem.delays)
+
+        x_k, d_k, diff_d_k = separable_oracle(lambda_k)
+        # longest first, and the two cheap blocks in one chunk
+        assert separable_oracle._lpt_chunks([0, 1, 2, 3]) == [[1], [3], [0, 2]]
+        np.testing.assert_allclose(separable_oracle.predicted_makespan, 0.04, atol=0.01)
+        assert separable_oracle.actual_makespan >= 0.04
+        assert len(separable_oracle.makespan_history) == 2
+
+    x_k_ref, d_k_ref, diff_d_k_ref = AnalyticalExampleInnerProblem().oracle(lambda_k)
+    np.testing.assert_allclose(x_k, x_k_ref)
+    np.testing.assert_allclose(d_k, d_k_ref)
+    np.testing.assert_allclose(diff_d_k, diff_d_k_ref)
+
+
+class FlakySeparableAnalyticalExample(DelayedSeparableAnalyticalExample):
+    """ Delayed separable example whose blocks can also be made to fail a number of times. """
+    def __init__(self, delays):
+        super(FlakySeparableAnalyticalExample, self).__init__(delays)
+        self.failures = [0]*len(delays)
+
+    def flaky_block_oracle(self, block_id, lambda_k):
+        if self.failures[block_id] > 0:
+            self.failures[block_id] -= 1
+            raise RuntimeError('Block {} failed'.format(block_id))
+        return self.delayed_block_oracle(block_id, lambda_k)
+
+
+def test_deadline_separable_oracle_fills_late_blocks():
+    print('# Test Deadline Separable Oracle with a straggling block')
+    inner_problem = FlakySeparableAnalyticalExample(delays=[0., 0., 0., 0.])
+    separable_oracle = SeparableOracle(block_function=inner_problem.flaky_block_oracle,
+                                       block_ids=range(inner_problem.n_blocks), n_workers=8)
+
+    with DeadlineSeparableOracle(separable_oracle, deadline=0.05, timeout=0.2) as deadline_oracle:
+        dual_method = SubgradientMethod(deadline_oracle, inner_problem.projection_function, dimension=2, sense='max')
+        dual_method.dual_step()
+        assert not deadline_oracle.last_call_inexact
+        lambda_0_results = separable_oracle.evaluate_blocks(np.zeros(2))
+
+        # block 2 (depending on lambda_1) hangs: the oracle returns on time, with its value at lambda_0
+        inner_problem.delays[2] = 1.0
+        start = time.time()
+        dual_method.dual_step()
+        assert time.time() - start < 0.5
+        assert deadline_oracle.inexact_blocks == [2]
+        assert dual_method.inexact_oracle_calls == 1
+        # it is still running at the next step, and is not submitted again
+        lambda_2 = dual_method.lambda_k.copy()
+        x_k, d_k, diff_d_k = deadline_oracle.aggregate(separable_oracle.evaluate_blocks(lambda_2, blocks=[0, 1, 3]) +
+                                                       [lambda_0_results[2]])
+        dual_method.dual_step()
+        np.testing.assert_allclose(dual_method.d_k, d_k)
+
+        # once it has been running for longer than timeout, the evaluation is abandoned and resubmitted
+        inner_problem.delays[2] = 0.
+        time.sleep(0.2)
+        deadline_oracle(lambda_2)
+        assert not deadline_oracle.last_call_inexact
+        assert deadline_oracle.timeouts == 1
+        assert deadline_oracle.late_blocks == 2
+
+
+def test_deadline_separable_oracle_retries_failed_blocks():
+    print('# Test Deadline Separable Oracle with failing blocks')
+    inner_problem = FlakySeparableAnalyticalExample(delays=[0., 0., 0., 0.])
+    lambda_k = np.array([1., 1.2])
+    x_k_ref, d_k_ref, diff_d_k_ref = AnalyticalExampleInnerProblem().oracle(lambda_k)
+
+    with DeadlineSeparableOracle(_separable_oracle_of(inner_problem.flaky_block_oracle), deadline=1.0,
+                                 max_retries=1) as deadline_oracle:
+        inner_problem.failures[1] = 1
+        x_k, d_k, diff_d_k = deadline_oracle(lambda_k)
+        np.testing.assert_allclose(d_k, d_k_ref)
+        assert (deadline_oracle.failures, deadline_oracle.retries) == (1, 1)
+
+        # retries exhausted: the last value of the block is used
+        inner_problem.failures[1] = 2
+        deadline_oracle(lambda_k)
+        assert deadline_oracle.inexact_blocks == [1]
+
+    with DeadlineSeparableOracle(_separable_oracle_of(inner_problem.flaky_block_oracle), deadline=1.0,
+                                 max_retries=0) as deadline_oracle:
+        # no value to fall back on: the error is raised
+        inner_problem.failures[0] = 1
+        with pytest.raises(RuntimeError):
+            deadline_oracle(lambda_k)
+
+    inner_problem.delays[0] = 0.5
+    with DeadlineSeparableOracle(_separable_oracle_of(inner_problem.flaky_block_oracle), deadline=0.01,
+                                 timeout=0.05) as deadline_oracle:
+        with pytest.raises(BlockTimeoutError):
+            deadline_oracle(lambda_k)
+    assert issubclass(BlockTimeoutError, TimeoutError)
+
+
+def test_deadline_separable_oracle_timeout_without_deadline():
+    print('# Test Deadline Separable Oracle with hung blocks, and no deadline')
+    inner_problem = FlakySeparableAnalyticalExample(delays=[1.0, 0., 0., 0.])
+    lambda_k = np.array([1., 1.2])
+
+    # no value to fall back on: the hung block is waited for up to timeout, and then a BlockTimeoutError is raised
+    with DeadlineSeparableOracle(_separable_oracle_of(inner_problem.flaky_block_oracle), deadline=None,
+                                 timeout=0.1, max_retries=0) as deadline_oracle:
+        start = time.time()
+        with pytest.raises(BlockTimeoutError):
+            deadline_oracle(lambda_k)
+        assert time.time() - start < 0.5
+        assert deadline_oracle.timeouts == 1
+
+    # the hung block is resubmitted once, and then filled with its last value
+    inner_problem.delays[0] = 0.
+    with DeadlineSeparableOracle(_separable_oracle_of(inner_problem.flaky_block_oracle), deadline=None,
+                                 timeout=0.1, max_retries=1) as deadline_oracle:
+        deadline_oracle(lambda_k)
+        inner_problem.delays[2] = 1.0
+        start = time.time()
+        deadline_oracle(lambda_k)
+        assert time.time() - start < 0.5
+        assert deadline_oracle.inexact_blocks == [2]
+        assert (deadline_oracle.timeouts, deadline_oracle.retries) == (2, 1)
+
+
+def _separable_oracle_of(block_function):
+    return SeparableOracle(block_function=block_function, block_ids=range(4), n_workers=4)
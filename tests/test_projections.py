@@ -0,0 +1,194 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from scipy.optimize import minimize
+
+from nsopy.methods.master_problems import dual_domain_constraints
+from nsopy.methods.subgradient import SubgradientMethod
+from nsopy.projections import Box, NonnegativeOrthant, Simplex, CappedSimplex, L2Ball, SumToParam, \
+    AffineProjection, dual_domain_projection
+from tests.analytical_oracles import BertsekasCounterExample, ConstrainedDualAnalyticalExampleInnerProblem
+
+
+def simplex_projection_by_sorting(v, radius):
+    u = np.sort(v)[::-1]
+    cumulative = np.cumsum(u) - radius
+    rho = np.nonzero(u - cumulative/np.arange(1, len(v) + 1) > 0)[0][-1]
+    return np.maximum(v - cumulative[rho]/(rho + 1.0), 0)
+
+
+def capped_simplex_projection_by_bisection(v, total, cap):
+    low, high = np.min(v) - cap, np.max(v)
+    for _ in range(200):
+        tau = (low + high)/2
+        if np.sum(np.clip(v - tau, 0, cap)) >= total:
+            low = tau
+        else:
+            high = tau
+    return np.clip(v - (low + high)/2, 0, cap)
+
+
+def test_box_and_orthant_projections():
+    print('# Test the box and nonnegative orthant projections, in place and into a buffer')
+    v = np.array([-4.0, -1.0, 0.5, 2.0, 5.0])
+    np.testing.assert_allclose(Box(-3, 3)(v), [-3, -1, 0.5, 2, 3])
+    np.testing.assert_allclose(Box([0, -2, 0, 0, -np.inf], [1, 2, 0, np.inf, 4])(v), [0, -1, 0, 2, 4])
+    assert Box([0, 0], 1)(0).tolist() == [0, 0]  # the dimension is inferred from the bounds
+
+    orthant = NonnegativeOrthant(indices=[0, 2], dimension=5)
+    out = np.empty(5)
+    assert orthant(v, out=out) is out
+    np.testing.assert_allclose(out, [0, -1, 0.5, 2, 5])
+    np.testing.assert_allclose(NonnegativeOrthant()(v), [0, 0, 0.5, 2, 5])
+
+    w = v.copy()
+    NonnegativeOrthant(indices=[False, True, False, False, False])(w, out=w)
+    np.testing.assert_allclose(w, [-4, 0, 0.5, 2, 5])
+
+    with pytest.raises(ValueError):
+        Box(1, 0)
+
+
+@pytest.mark.parametrize('dimension', [1, 2, 7, 100])
+def test_simplex_projections(dimension):
+    print('# Test the simplex and capped simplex projections against sorting and bisection')
+    rng = np.random.RandomState(dimension)
+    simplex = Simplex(radius=2.0)
+    for _ in range(20):
+        v = rng.normal(size=dimension)*3
+        v[rng.uniform(size=dimension) < 0.3] = 1.0  # ties
+        np.testing.assert_allclose(simplex(v), simplex_projection_by_sorting(v, 2.0), atol=1e-10)
+
+        cap = rng.uniform(0.1, 2)
+        total = rng.uniform(0, dimension*cap)
+        p = CappedSimplex(total=total, cap=cap)(v)
+        assert np.all(p >= 0) and np.all(p <= cap + 1e-12)
+        np.testing.assert_allclose(np.sum(p), total)
+        np.testing.assert_allclose(p, capped_simplex_projection_by_bisection(v, total, cap), atol=1e-9)
+
+    v = rng.normal(size=dimension)
+    out = v.copy()
+    simplex(out, out=out)
+    np.testing.assert_allclose(out, simplex(v))
+
+    with pytest.raises(ValueError):
+        CappedSimplex(total=dimension + 1.0, cap=1.0)(v)
+
+
+def test_ball_and_affine_projections():
+    print('# Test the l2 ball and sum to param projections')
+    ball = L2Ball(radius=1.0, center=[1.0, 1.0])
+    np.testing.assert_allclose(ball(np.array([1.5, 1.0])), [1.5, 1.0])
+    np.testing.assert_allclose(ball(np.array([4.0, 5.0])), [1.6, 1.8])
+    np.testing.assert_allclose(ball(0), [1 - np.sqrt(0.5), 1 - np.sqrt(0.5)])
+
+    p = SumToParam(0.5)(np.array([1.0, 2.0, -3.0]))
+    np.testing.assert_allclose(np.sum(p), 0.5)
+    np.testing.assert_allclose(p - [1.0, 2.0, -3.0], np.full(3, p[0] - 1.0))
+
+
+class TwoStageProblem(object):
+    n_x = 3
+    n_scenarios = 4
+
+
+@pytest.mark.parametrize('domain', ['free', 'positive orthant', 'sum to param', '2 stage smps', 'mrf'])
+def test_dual_domain_projections(domain):
+    print('# Test the projections on the dual domains of set_dual_domain() against their constraints')
+    dimension = 12
+    rng = np.random.RandomState(0)
+    v = rng.normal(size=dimension)
+    project = dual_domain_projection(domain, dimension, param=1.5, inner_problem=TwoStageProblem())
+    p = project(v)
+    lower_bounds, A_eq, b_eq = dual_domain_constraints(domain, dimension, param=1.5, inner_problem=TwoStageProblem())
+    if lower_bounds is not None:
+        assert np.all(p >= lower_bounds)
+    if A_eq is not None:
+        np.testing.assert_allclose(A_eq.dot(p), b_eq, atol=1e-12)
+        # v - p is orthogonal to the affine domain
+        multipliers = np.linalg.lstsq(A_eq.T, v - p, rcond=None)[0]
+        np.testing.assert_allclose(A_eq.T.dot(multipliers), v - p, atol=1e-12)
+    np.testing.assert_allclose(project(p), p)
+
+
+def test_projection_with_method():
+    print('# Test a method on the box of BertsekasCounterExample, with projections from nsopy.projections')
+    inner_problem = BertsekasCounterExample()
+    method = SubgradientMethod(inner_problem.oracle, Box(-3, 3), dimension=2, stepsize_0=0.1, sense='min')
+    for _ in range(100):
+        method.dual_step()
+    assert np.all(np.abs(method.lambda_k) <= 3)
+
+
+@pytest.mark.parametrize('domain', ['2 stage smps', 'mrf'])
+def test_affine_projection(domain):
+    print('# Test the projection on an affine domain, with the factorization of A A^T, against the closed form')
+    dimension = 12
+    _, A_eq, b_eq = dual_domain_constraints(domain, dimension, inner_problem=TwoStageProblem())
+    project = AffineProjection(sp.csr_matrix(A_eq), b_eq)
+    v = np.random.RandomState(0).normal(size=dimension)
+    closed_form = dual_domain_projection(domain, dimension, inner_problem=TwoStageProblem())
+    np.testing.assert_allclose(project(v), closed_form(v))
+    out = v.copy()
+    project(out, out=out)
+    np.testing.assert_allclose(out, project(v))
+
+    with pytest.raises(ValueError):
+        AffineProjection(np.ones((2, 3)), [1, 1])  # rank deficient
+
+
+def test_polyhedral_projection():
+    print('# Test the projection on a polyhedral domain (Dykstra) against SLSQP')
+    rng = np.random.RandomState(0)
+    dimension, n_constraints = 15, 4
+    A = sp.random(n_constraints, dimension, density=0.5, random_state=1) + sp.eye(n_constraints, dimension)
+    b = A.dot(rng.uniform(0, 1, dimension))
+    project = AffineProjection(A, b, lower=0, upper=1)
+    for _ in range(3):
+        v = rng.normal(size=dimension)*2
+        p = project(v)
+        assert np.all(p >= 0) and np.all(p <= 1)
+        np.testing.assert_allclose(A.dot(p), b, atol=1e-8)
+
+        reference = minimize(lambda x: 0.5*np.sum((x - v)**2), np.clip(v, 0, 1), jac=lambda x: x - v,
+                             constraints=[{'type': 'eq', 'fun': lambda x: A.dot(x) - b,
+                                           'jac': lambda x: A.toarray()}],
+                             bounds=[(0, 1)]*dimension, method='SLSQP', options={'ftol': 1e-14, 'maxiter': 1000})
+        np.testing.assert_allclose(p, reference.x, atol=1e-6)
+
+
+def test_affine_projection_with_method():
+    print('# Test a method on the domain of ConstrainedDualAnalyticalExample, with an AffineProjection')
+    inner_problem = ConstrainedDualAnalyticalExampleInnerProblem()
+    project = AffineProjection([[1.0, 1.0]], [0.5], lower=[-np.inf, -np.inf])
+    method = SubgradientMethod(inner_problem.oracle, project, dimension=0, stepsize_0=0.1, stepsize_rule='1/k')
+    reference = SubgradientMethod(inner_problem.oracle, inner_problem.projection_function, dimension=2,
+                                  stepsize_0=0.1, stepsize_rule='1/k')
+    for _ in range(20):
+        method.dual_step()
+        reference.dual_step()
+    np.testing.assert_allclose(method.lambda_k, reference.lambda_k, atol=1e-8)
+
+
+def run_without_scipy(code):
+    # runs code in a new interpreter, in which importing scipy fails
+    result = subprocess.run([sys.executable, '-c', "import sys; sys.modules['scipy'] = None\n" + code],
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_projections_without_scipy():
+    print('# Test that the projections, except AffineProjection, do not need scipy')
+    output = run_without_scipy(
+        'import numpy as np\n'
+        'from nsopy.projections import Simplex, AffineProjection\n'
+        'print(Simplex()(np.array([1.0, 2.0])))\n'
+        'try:\n'
+        '    AffineProjection(np.eye(2), np.ones(2))\n'
+        'except ImportError as error:\n'
+        '    print(error)\n')
+    assert output.splitlines() == ['[0. 1.]', 'scipy is required for affine projections.']
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from nsopy.methods.asynchronous import AsynchronousSubgradientMethod, AsynchronousSGMDoubleSimpleAveraging
+from nsopy.methods.bundle import CuttingPlanesMethod, BundleMethod
+from nsopy.methods.quasi_monotone import SGMDoubleSimpleAveraging, SGMTripleAveraging
+from nsopy.methods.subgradient import SubgradientMethod, IncrementalSubgradientMethod, \
+    AggregatedIncrementalSubgradientMethod
+from nsopy.methods.universal import UniversalPGM, UniversalDGM, UniversalFGM
+from nsopy.methods_factory import DualMethodsFactory
+from nsopy.oracles import SeparableOracle
+from tests.analytical_oracles import AnalyticalExampleInnerProblem, SeparableAnalyticalExampleInnerProblem
+
+METHODS = [
+    (SubgradientMethod, dict(stepsize_0=0.1)),
+    (SGMDoubleSimpleAveraging, dict(gamma=0.5)),
+    (SGMTripleAveraging, dict(variant=1, gamma=0.5)),
+    (SGMTripleAveraging, dict(variant=2, gamma=0.5)),
+    (UniversalPGM, dict(epsilon=0.01)),
+    (UniversalPGM, dict(epsilon=0.01, averaging=True, speculative_trials=2)),
+    (UniversalDGM, dict(epsilon=0.01)),
+    (UniversalFGM, dict(epsilon=0.01)),
+    (CuttingPlanesMethod, dict(epsilon=0.01, master_problem='scipy')),
+    (BundleMethod, dict(epsilon=0.01, master_problem='scipy')),
+]
+
+SEPARABLE_METHODS = [
+    (IncrementalSubgradientMethod, dict(stepsize_0=0.1, seed=0)),
+    (AggregatedIncrementalSubgradientMethod, dict(stepsize_0=0.1, seed=0)),
+    (AsynchronousSubgradientMethod, dict(stepsize_0=0.1)),
+    (AsynchronousSGMDoubleSimpleAveraging, dict(gamma=0.5)),
+]
+
+
+def negated(oracle):
+    def negated_oracle(lambda_k):
+        x_k, d_k, diff_d_k = oracle(lambda_k)
+        return x_k, -d_k, -diff_d_k
+    return negated_oracle
+
+
+def run_both_senses(make_method, oracle, n_iterations=10):
+    # the concave dual is maximized with sense='max', and its (convex) negative minimized with sense='min': both
+    # runs should take the same steps, while reporting the values of their own oracle
+    methods = [make_method(oracle, 'max'), make_method(negated(oracle), 'min')]
+    for iteration in range(n_iterations):
+        lambdas = []
+        for method in methods:
+            method.dual_step()
+            lambdas.append(np.copy(method.lambda_k))
+        np.testing.assert_allclose(lambdas[0], lambdas[1], atol=1e-9)
+        np.testing.assert_allclose(methods[1].d_k, -methods[0].d_k, atol=1e-9)
+    return methods
+
+
+@pytest.mark.parametrize('method_class, options', METHODS)
+def test_sense_conventions(method_class, options):
+    print('# Test that {} minimizes with sense=\'min\' and maximizes with sense=\'max\''.format(method_class.__name__))
+    inner_problem = AnalyticalExampleInnerProblem()
+    methods = run_both_senses(lambda oracle, sense: method_class(oracle, inner_problem.projection_function,
+                                                                 dimension=inner_problem.dimension, sense=sense,
+                                                                 **options),
+                              inner_problem.oracle)
+
+    max_method, min_method = methods
+    # d(lambda) <= d(lambda*) = -0.5; the best points are the same, with the values of their own oracle
+    d_best, lambda_best, _ = max_method.best.snapshot()
+    assert d_best == -min_method.best.d_best <= -0.5 + 1e-9
+    assert d_best > inner_problem.oracle(np.zeros(2))[1]
+    np.testing.assert_allclose(min_method.best.lambda_best, lambda_best)
+
+
+@pytest.mark.parametrize('method_class, options', SEPARABLE_METHODS)
+def test_sense_conventions_of_block_methods(method_class, options):
+    print('# Test that {} minimizes with sense=\'min\' and maximizes with sense=\'max\''.format(method_class.__name__))
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+
+    def make_method(block_oracle, sense):
+        separable_oracle = SeparableOracle(block_function=block_oracle, block_ids=range(inner_problem.n_blocks),
+                                           executor='serial')
+        return method_class(separable_oracle, inner_problem.projection_function, dimension=inner_problem.dimension,
+                            sense=sense, **options)
+
+    def block_oracle(block_id, lambda_k):
+        return inner_problem.block_oracle(block_id, lambda_k)
+
+    def negated_block_oracle(block_id, lambda_k):
+        x_k, d_k, diff_d_k = inner_problem.block_oracle(block_id, lambda_k)
+        return x_k, -d_k, -diff_d_k
+
+    methods = [make_method(block_oracle, 'max'), make_method(negated_block_oracle, 'min')]
+    for iteration in range(10):
+        for method in methods:
+            method.dual_step()
+        np.testing.assert_allclose(methods[0].lambda_k, methods[1].lambda_k, atol=1e-9)
+        np.testing.assert_allclose(methods[1].d_k, -methods[0].d_k, atol=1e-9)
+    for method in methods:
+        if hasattr(method, 'close'):
+            method.close()
+
+
+@pytest.mark.parametrize('method', ['SG 1/k', 'DSA', 'TA 1', 'TA 2', 'UPGM', 'UDGM', 'UFGM', 'CP', 'bundle'])
+def test_factory_methods_maximize_the_dual(method):
+    print('# Test that the methods of the factory ({}) maximize the dual function'.format(method))
+    inner_problem = AnalyticalExampleInnerProblem()
+    dual_method = DualMethodsFactory(inner_problem, method)
+    for iteration in range(20):
+        dual_method.dual_step()
+    assert dual_method.sense == 'max'
+    assert inner_problem.oracle(np.zeros(2))[1] < dual_method.best.d_best <= -0.5 + 1e-9
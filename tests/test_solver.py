@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from nsopy.methods.subgradient import SubgradientMethod, IncrementalSubgradientMethod
+from nsopy.oracles import SeparableOracle
+from nsopy.solver import solve, SOLVE_STATUSES
+from tests.analytical_oracles import AnalyticalExampleInnerProblem, SecondAnalyticalExampleInnerProblem, \
+    SeparableAnalyticalExampleInnerProblem
+
+
+class QuadraticInnerProblem(object):
+    """ d(lambda) = -||lambda - c||^2, maximized at lambda* = c """
+    def __init__(self):
+        self.dimension = 2
+        self.c = np.array([1.0, -2.0])
+
+    def oracle(self, lambda_k):
+        return 0, -np.sum((lambda_k - self.c)**2), -2*(lambda_k - self.c)
+
+    def projection_function(self, lambda_k):
+        return lambda_k
+
+
+def test_solve_budgets():
+    print('# Test solve() with iteration, oracle call and time budgets')
+    inner_problem = AnalyticalExampleInnerProblem()
+
+    result = solve(inner_problem, 'SG 1/k', max_iterations=20)
+    assert (result.status, result.iterations, result.oracle_calls) == ('max_iterations', 20, 20)
+
+    result = solve(inner_problem, 'UFGM', max_oracle_calls=15)
+    assert result.status == 'max_oracle_calls' and 15 <= result.oracle_calls
+    assert result.status in SOLVE_STATUSES
+
+    result = solve(inner_problem, 'DSA', max_iterations=None, max_time=0.05)
+    assert result.status == 'max_time' and result.total_time >= 0.05
+    assert result.gap is None
+    assert 0 < result.oracle_time < result.total_time
+    assert result.method_time > 0
+
+
+def test_solve_tracks_best_iterate():
+    print('# Test solve() keeping the best point queried, not the last iterate')
+    inner_problem = AnalyticalExampleInnerProblem()
+    result = solve(inner_problem, 'SG const', param=0.5, max_iterations=50)
+
+    np.testing.assert_allclose(inner_problem.oracle(result.lambda_best)[1], result.d_best)
+    np.testing.assert_allclose(result.d_best, -0.5, atol=1e-6)
+    assert result.d_best >= result.method.d_k
+    assert result.method.oracle_observers == [result.method.best]
+
+
+def test_solve_stopping_criteria():
+    print('# Test solve() stopping on the certified gap, on stalls, on the subgradient norm, and on convergence')
+    inner_problem = AnalyticalExampleInnerProblem()
+    result = solve(inner_problem, 'SG 1/k', gap_tolerance=0.01, dual_domain='positive orthant', lambda_min=0,
+                   lambda_max=10, gap_check_every=5)
+    assert result.status == 'gap' and result.iterations < 100
+    assert result.gap <= 0.01
+    assert result.upper_bound >= -0.5 >= result.d_best
+
+    result = solve(inner_problem, 'SG const', param=0.5, stall_iterations=10)
+    assert result.status == 'stalled' and result.iterations < 100
+
+    # the incremental methods only pass the queries of all the blocks to best
+    separable_problem = SeparableAnalyticalExampleInnerProblem()
+    separable_oracle = SeparableOracle(block_function=separable_problem.block_oracle,
+                                       block_ids=range(separable_problem.n_blocks), executor='serial')
+    with pytest.raises(ValueError):
+        solve(None, IncrementalSubgradientMethod(separable_oracle, separable_problem.projection_function, dimension=2,
+                                                 sense='max'), stall_iterations=20)
+    result = solve(None, IncrementalSubgradientMethod(separable_oracle, separable_problem.projection_function,
+                                                      dimension=2, batch_size=separable_problem.n_blocks,
+                                                      stepsize_rule='constant', stepsize_0=0.5, sense='max'),
+                   stall_iterations=10)
+    assert result.status == 'stalled' and np.isfinite(result.d_best) and result.lambda_best is not None
+
+    quadratic_problem = QuadraticInnerProblem()
+    dual_method = SubgradientMethod(quadratic_problem.oracle, quadratic_problem.projection_function,
+                                    dimension=2, stepsize_rule='constant', stepsize_0=0.25, sense='max')
+    result = solve(None, dual_method, subgradient_tolerance=1e-6)
+    assert result.status == 'subgradient' and result.method is dual_method
+    np.testing.assert_allclose(result.lambda_best, quadratic_problem.c, atol=1e-6)
+
+    result = solve(SecondAnalyticalExampleInnerProblem(), 'bundle', param=0.01)
+    assert result.status == 'converged'
+    assert result.master_time > 0
+    np.testing.assert_allclose(result.lambda_best, [1, 0], atol=0.01)
+
+
+def test_solve_interrupted():
+    print('# Test interrupting solve(), which returns the best point found so far')
+    inner_problem = AnalyticalExampleInnerProblem()
+
+    class InterruptedInnerProblem(object):
+        dimension = inner_problem.dimension
+        projection_function = staticmethod(inner_problem.projection_function)
+
+        def __init__(self):
+            self.calls = 0
+
+        def oracle(self, lambda_k):
+            self.calls += 1
+            if self.calls > 25:
+                raise KeyboardInterrupt()
+            return inner_problem.oracle(lambda_k)
+
+    result = solve(InterruptedInnerProblem(), 'SG 1/k')
+    assert result.status == 'interrupted' and result.iterations == 25
+    assert result.d_best == result.method.best.d_best > -np.inf
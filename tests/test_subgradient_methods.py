@@ -1,10 +1,15 @@
 import time
 
 import numpy as np
+import pytest
+
 from nsopy.loggers import TemplateMethodLogger, GenericDualMethodLogger, EnhancedDualMethodLogger
-from nsopy.methods.subgradient import SubgradientMethod
+from nsopy.methods.subgradient import SubgradientMethod, IncrementalSubgradientMethod, \
+    AggregatedIncrementalSubgradientMethod
+from nsopy.oracles import SeparableOracle
 from nsopy.template_methods import TemplateMethod
-from .analytical_oracles import AnalyticalExampleInnerProblem, SecondAnalyticalExampleInnerProblem, ConstrainedDualAnalyticalExampleInnerProblem
+from .analytical_oracles import AnalyticalExampleInnerProblem, SecondAnalyticalExampleInnerProblem, ConstrainedDualAnalyticalExampleInnerProblem, \
+    SeparableAnalyticalExampleInnerProblem
 
 
 def test_templates():
@@ -190,4 +195,156 @@ def test_subgradient_method_on_third_analytical_example_non_zero_start():
     assert 0 <= lambda_star[0] <= 0.5
     assert lambda_star[1] == 0.5 - lambda_star[0]
     # with value close to dual optimum
-    np.testing.assert_allclose(logger.d_k_iterates[-1], -1.0, atol=0.01)
\ No newline at end of file
+    np.testing.assert_allclose(logger.d_k_iterates[-1], -1.0, atol=0.01)
+
+@pytest.mark.parametrize('sampling, block_weights', [('uniform', None), ('importance', [1., 2., 3., 4.]),
+                                                     ('cyclic', None)])
+def test_incremental_subgradient_method_estimates_are_unbiased(sampling, block_weights):
+    print('# Test Incremental Subgradient Method ({}) estimates of d_k and diff_d_k'.format(sampling))
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    separable_oracle = SeparableOracle(block_function=inner_problem.block_oracle,
+                                       block_ids=range(inner_problem.n_blocks), executor='serial')
+    lambda_k = np.array([0.8, 1.2])
+    x_k, d_k, diff_d_k = inner_problem.oracle(lambda_k)
+
+    # with stepsize_0 = 0, the method stays at lambda_k and we can average its estimates
+    dual_method = IncrementalSubgradientMethod(separable_oracle, lambda lambda_k: lambda_k, dimension=2,
+                                               stepsize_0=0.0, batch_size=2, sampling=sampling,
+                                               block_weights=block_weights, seed=0, sense='max')
+    dual_method.lambda_k = lambda_k
+    logger = GenericDualMethodLogger(dual_method)
+    n_iterations = 2 if sampling == 'cyclic' else 5000  # a cycle is exact
+    for iteration in range(n_iterations):
+        dual_method.dual_step()
+
+    np.testing.assert_allclose(np.mean(logger.d_k_iterates), d_k, atol=0.05)
+    assert dual_method.oracle_calls == dual_method.block_calls / inner_problem.n_blocks
+
+
+@pytest.mark.parametrize('sampling, block_weights', [('uniform', None), ('importance', [1., 1., 2., 1.]),
+                                                     ('cyclic', None)])
+def test_incremental_subgradient_method_on_separable_analytical_example(sampling, block_weights):
+    print('# Test Incremental Subgradient Method ({}) on Separable Analytical Example'.format(sampling))
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    separable_oracle = SeparableOracle(block_function=inner_problem.block_oracle,
+                                       block_ids=range(inner_problem.n_blocks), executor='serial')
+
+    dual_method = IncrementalSubgradientMethod(separable_oracle, inner_problem.projection_function, dimension=2,
+                                               stepsize_0=0.5, batch_size=2, sampling=sampling,
+                                               block_weights=block_weights, seed=0, sense='max')
+    for iteration in range(500):
+        dual_method.dual_step()
+
+    # d(lambda*) = -0.5
+    x_k, d_k, diff_d_k = inner_problem.oracle(dual_method.lambda_k)
+    np.testing.assert_allclose(d_k, -0.5, atol=0.02)
+    assert dual_method.oracle_calls <= 500 * 2 / inner_problem.n_blocks
+
+
+def test_incremental_subgradient_method_observers_and_iterates():
+    print('# Test the oracle observers, oracle time and x_k of the Incremental Subgradient Method')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    separable_oracle = SeparableOracle(block_function=inner_problem.block_oracle,
+                                       block_ids=range(inner_problem.n_blocks), executor='serial')
+    x_shape = np.shape(inner_problem.oracle(np.zeros(2))[0])
+
+    dual_method = IncrementalSubgradientMethod(separable_oracle, inner_problem.projection_function, dimension=2,
+                                               stepsize_0=0.5, batch_size=2, sampling='cyclic', sense='max')
+    dual_method.dual_step()
+    # only blocks 0 and 1 have been evaluated
+    assert dual_method.x_k is None
+    for iteration in range(10):
+        dual_method.dual_step()
+        assert np.shape(dual_method.x_k) == x_shape
+    assert dual_method.oracle_time > 0
+    # the queries of some of the blocks are not exact values of d: the best iterate is not tracked
+    assert dual_method.best.lambda_best is None
+
+    # with all the blocks, the queries are exact, and the observers see them
+    dual_method = IncrementalSubgradientMethod(separable_oracle, inner_problem.projection_function, dimension=2,
+                                               stepsize_0=0.5, batch_size=inner_problem.n_blocks, sense='max')
+    logger = GenericDualMethodLogger(dual_method)
+    for iteration in range(10):
+        dual_method.dual_step()
+    assert dual_method.best.d_best == max(logger.d_k_iterates)
+
+
+def test_incremental_subgradient_method_input_validation():
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    separable_oracle = SeparableOracle(block_function=inner_problem.block_oracle,
+                                       block_ids=range(inner_problem.n_blocks), executor='serial')
+    with pytest.raises(ValueError):
+        IncrementalSubgradientMethod(separable_oracle, inner_problem.projection_function, batch_size=5)
+    with pytest.raises(ValueError):
+        IncrementalSubgradientMethod(separable_oracle, inner_problem.projection_function, sampling='shuffled')
+    with pytest.raises(ValueError):
+        IncrementalSubgradientMethod(separable_oracle, inner_problem.projection_function, sampling='importance')
+
+
+def test_aggregated_incremental_subgradient_method_on_separable_analytical_example():
+    print('# Test Aggregated Incremental Subgradient Method (dense and sparse tables) on Separable Analytical Example')
+    inner_problem = SeparableAnalyticalExampleInnerProblem()
+    separable_oracle = SeparableOracle(block_function=inner_problem.block_oracle,
+                                       block_ids=range(inner_problem.n_blocks), executor='serial')
+
+    dual_methods = [AggregatedIncrementalSubgradientMethod(separable_oracle, inner_problem.projection_function,
+                                                           dimension=2, stepsize_0=0.5, batch_size=1, seed=0,
+                                                           block_support=block_support, sense='max')
+                    for block_support in [None, [[0, 1], [0, 1], [0], [0, 1]]]]
+    loggers = [GenericDualMethodLogger(dual_method) for dual_method in dual_methods]
+
+    for iteration in range(300):
+        for dual_method in dual_methods:
+            dual_method.dual_step()
+        if iteration == 0:
+            # the table is filled with a full pass at the first iteration
+            x_k, d_k, diff_d_k = inner_problem.oracle(loggers[0].lambda_k_iterates[0])
+            for logger in loggers:
+                np.testing.assert_allclose(logger.d_k_iterates[0], d_k)
+                np.testing.assert_allclose(logger.x_k_iterates[0], x_k)
+    # x_k concatenates the x_i of the table, not only those of the sampled block
+    assert np.shape(loggers[0].x_k_iterates[-1]) == np.shape(x_k)
+
+    dense_method, sparse_method = dual_methods
+    np.testing.assert_allclose(loggers[0].lambda_k_iterates, loggers[1].lambda_k_iterates)
+    # the running sums agree with the table
+    np.testing.assert_allclose(dense_method.diff_d_k, np.sum(dense_method.block_subgradients, axis=0))
+    np.testing.assert_allclose(sparse_method.d_k, np.sum(sparse_method.block_values))
+    assert len(sparse_method.block_subgradients) == 7
+    assert dense_method.block_calls == inner_problem.n_blocks + 299
+
+    # d(lambda*) = -0.5
+    x_k, d_k, diff_d_k = inner_problem.oracle(dense_method.lambda_k)
+    np.testing.assert_allclose(d_k, -0.5, atol=0.02)
+
+
+def test_best_iterate_tracking_on_analytical_example():
+    print('# Test tracking the best iterates of the (non-monotone) Subgradient Method')
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+    dual_method = SubgradientMethod(analytical_inner_problem.oracle,
+                                    analytical_inner_problem.projection_function,
+                                    dimension=analytical_inner_problem.dimension,
+                                    stepsize_0=0.5,
+                                    stepsize_rule='constant',
+                                    sense='max')
+    assert dual_method.best.snapshot() == (-np.inf, None, None)
+    dual_method.track_best(top_k=3)
+    logger = GenericDualMethodLogger(dual_method)
+
+    for iteration in range(30):
+        dual_method.dual_step()
+
+    # d_k is the value at the point queried before the (last) step
+    queried = [np.zeros(2)] + logger.lambda_k_iterates[:-1]
+    values = [analytical_inner_problem.oracle(lambda_k)[1] for lambda_k in queried]
+    d_best, lambda_best, x_best = dual_method.best.snapshot()
+    assert d_best == max(values) == max(logger.d_k_iterates)
+    np.testing.assert_allclose(analytical_inner_problem.oracle(lambda_best)[1], d_best)
+    np.testing.assert_allclose(x_best, analytical_inner_problem.oracle(lambda_best)[0])
+    assert dual_method.best.lambdas.shape == (3, 2)
+
+    top = dual_method.best.top()
+    np.testing.assert_allclose([d for d, _, _ in top], sorted(values, reverse=True)[:3])
+    # copies: the incumbent is not affected
+    top[0][1][:] = 100
+    np.testing.assert_allclose(dual_method.best.lambda_best, lambda_best)
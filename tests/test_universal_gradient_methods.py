@@ -1,6 +1,8 @@
 from __future__ import print_function
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+import pytest
 from nsopy.loggers import GenericDualMethodLogger, DualDgmFgmMethodLogger
 from nsopy.methods.universal import UniversalPGM, UniversalDGM, UniversalFGM
 from tests.analytical_oracles import AnalyticalExampleInnerProblem, SecondAnalyticalExampleInnerProblem, ConstrainedDualAnalyticalExampleInnerProblem
@@ -19,7 +21,7 @@ def test_UPGM_on_analytical_example():
     dual_method = UniversalPGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01)
+                               epsilon=0.01, sense='max')
 
     logger = GenericDualMethodLogger(dual_method)
 
@@ -43,7 +45,7 @@ def test_averaged_UPGM_on_analytical_example():
     dual_method = UniversalPGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01,
+                               epsilon=0.01, sense='max',
                                averaging=True)
 
     logger = GenericDualMethodLogger(dual_method)
@@ -68,7 +70,7 @@ def test_UPGM_on_second_analytical_example():
     dual_method = UniversalPGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01)
+                               epsilon=0.01, sense='max')
 
     logger = GenericDualMethodLogger(dual_method)
 
@@ -91,7 +93,8 @@ def test_UPGM_on_third_analytical_example_non_zero_start():
 
     dual_method = UniversalPGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
-                               dimension=analytical_inner_problem.dimension)
+                               dimension=analytical_inner_problem.dimension,
+                               sense='max')
 
     # we set the initial point somewhere not 0
     dual_method.lambda_hat_k = dual_method.projection_function(np.array([-2, 2]))
@@ -120,7 +123,8 @@ def test_averaged_UPGM_on_third_analytical_example_non_zero_start():
     dual_method = UniversalPGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               averaging=True)
+                               averaging=True,
+                               sense='max')
 
     # we set the initial point somewhere not 0
     dual_method.lambda_hat_k = dual_method.projection_function(np.array([-2, 2]))
@@ -155,7 +159,7 @@ def test_UDGM_on_analytical_example():
     dual_method = UniversalDGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01)
+                               epsilon=0.01, sense='max')
     # epsilon=0.5)
 
     logger = GenericDualMethodLogger(dual_method)
@@ -179,7 +183,7 @@ def test_averaged_UDGM_on_analytical_example():
     dual_method = UniversalDGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01,
+                               epsilon=0.01, sense='max',
                                averaging=True)
     # epsilon=0.5)
 
@@ -204,7 +208,7 @@ def test_UDGM_on_second_analytical_example():
     dual_method = UniversalDGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01)
+                               epsilon=0.01, sense='max')
     # epsilon=0.5)
 
     logger = DualDgmFgmMethodLogger(dual_method)
@@ -229,7 +233,7 @@ def test_UDGM_on_third_analytical_example_non_zero_start():
     dual_method = UniversalDGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.1)
+                               epsilon=0.1, sense='max')
 
     # we set the initial point somewhere not 0
     dual_method.lambda_hat_k = dual_method.projection_function(np.array([-2, 2]))
@@ -260,7 +264,7 @@ def test_UFGM_on_analytical_example():
     dual_method = UniversalFGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.1)
+                               epsilon=0.1, sense='max')
 
     logger = GenericDualMethodLogger(dual_method)
 
@@ -283,7 +287,7 @@ def test_averaged_UFGM_on_analytical_example():
     dual_method = UniversalFGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.1,
+                               epsilon=0.1, sense='max',
                                averaging=False)
 
     logger = GenericDualMethodLogger(dual_method)
@@ -308,7 +312,7 @@ def test_UFGM_on_second_analytical_example():
     dual_method = UniversalFGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01)
+                               epsilon=0.01, sense='max')
     # epsilon=0.5)
 
     logger = DualDgmFgmMethodLogger(dual_method)
@@ -333,7 +337,7 @@ def test_UFGM_on_third_analytical_example_non_zero_start():
     dual_method = UniversalFGM(analytical_inner_problem.oracle,
                                analytical_inner_problem.projection_function,
                                dimension=analytical_inner_problem.dimension,
-                               epsilon=0.01)
+                               epsilon=0.01, sense='max')
 
     # we set the initial point somewhere not 0
     dual_method.lambda_hat_k = dual_method.projection_function(np.array([-2, 2]))
@@ -351,3 +355,45 @@ def test_UFGM_on_third_analytical_example_non_zero_start():
     assert lambda_star[1] == 0.5 - lambda_star[0]
     # with value close to dual optimum
     np.testing.assert_allclose(logger.d_k_iterates[-1], -1.0, atol=0.01)
+
+
+#####################
+# SPECULATIVE TESTS #
+#####################
+
+
+@pytest.mark.parametrize('method_class', [UniversalPGM, UniversalDGM, UniversalFGM])
+@pytest.mark.parametrize('averaging', [False, True])
+def test_speculative_backtracking_reproduces_sequential_iterates(method_class, averaging):
+    print('# Test speculative backtracking of {} (averaging={})'.format(method_class.__name__, averaging))
+    analytical_inner_problem = AnalyticalExampleInnerProblem()
+
+    def oracle_without_batch(lambda_k):
+        return analytical_inner_problem.oracle(lambda_k)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        dual_methods = [
+            # sequential search of i_k
+            method_class(analytical_inner_problem.oracle, analytical_inner_problem.projection_function,
+                         dimension=analytical_inner_problem.dimension, epsilon=0.01, sense='max', averaging=averaging),
+            # speculative, with the batched oracle
+            method_class(analytical_inner_problem.oracle, analytical_inner_problem.projection_function,
+                         dimension=analytical_inner_problem.dimension, epsilon=0.01, sense='max', averaging=averaging,
+                         speculative_trials=4),
+            # speculative, with concurrent point by point queries
+            method_class(oracle_without_batch, analytical_inner_problem.projection_function,
+                         dimension=analytical_inner_problem.dimension, epsilon=0.01, sense='max', averaging=averaging,
+                         speculative_trials=3, oracle_executor=pool),
+        ]
+        loggers = [DualDgmFgmMethodLogger(dual_method) for dual_method in dual_methods]
+
+        for iteration in range(15):
+            for dual_method in dual_methods:
+                dual_method.dual_step()
+
+    for logger in loggers[1:]:
+        np.testing.assert_allclose(logger.lambda_k_iterates, loggers[0].lambda_k_iterates)
+        np.testing.assert_allclose(logger.d_k_iterates, loggers[0].d_k_iterates)
+        np.testing.assert_allclose(logger.L_k_iterates, loggers[0].L_k_iterates)
+    # speculation can only waste oracle calls
+    assert dual_methods[1].oracle_calls >= dual_methods[0].oracle_calls